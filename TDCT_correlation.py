@@ -28,7 +28,6 @@ to one single stack file, ...).
 import sys
 import os
 import time
-import re
 import tempfile
 from PyQt4 import QtCore, QtGui, uic
 import numpy as np
@@ -37,7 +36,7 @@ import tifffile as tf
 import qimage2ndarray
 ## Colored stdout, custom Qt functions (mostly to handle events), CSV handler
 ## and correlation algorithm
-from tdct import clrmsg, TDCT_debug, QtCustom, csvHandler, correlation
+from tdct import clrmsg, TDCT_debug, QtCustom, csvHandler, correlation, tiffMetadata, stackProcessing, beadDetect
 
 __version__ = 'v2.3.0'
 
@@ -208,6 +207,7 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
         self.toolButton_contrast_reset.clicked.connect(lambda: self.horizontalSlider_contrast.setValue(10))
         self.toolButton_importPoints.clicked.connect(self.importPoints)
         self.toolButton_exportPoints.clicked.connect(self.exportPoints)
+        self.toolButton_detectBeads.clicked.connect(self.detectBeads)
         self.toolButton_selectWorkingDir.clicked.connect(self.selectWorkingDir)
         self.toolButton_selectMarkerColor.clicked.connect(self.getMarkerColor)
         self.toolButton_selectPoiColor.clicked.connect(self.getPoiColor)
@@ -510,6 +510,7 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
         self.toolButton_rotccw.setEnabled(status)
         self.toolButton_importPoints.setEnabled(not status)
         self.toolButton_exportPoints.setEnabled(not status)
+        self.toolButton_detectBeads.setEnabled(not status)
         self.toolButton_loadLayer2.setEnabled(status)
         self.toolButton_loadLayer3.setEnabled(status)
 
@@ -644,6 +645,8 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
             self.tableView_left.img1 = self.imgstack_left_layer1
             self.tableView_left.img2 = self.imgstack_left_layer2
             self.tableView_left.img3 = self.imgstack_left_layer3
+            ## 2D image for the x,y refinement
+            self.tableView_left.img2D = self.img_left_layer1 if self.imgstack_left_layer1 is None else None
             ## check if coloring z values in table is needed (correlation needs z=0 in 2D image, so no checking for valid z
             ## with 2D images needed)
             if self.imgstack_left_layer1 is None:
@@ -651,6 +654,8 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
             else:
                 self.sceneLeft._z = True
                 self.setCustomRotCenter(max(self.imgstack_left_layer1.shape))
+                ## z estimates for markers set in the MIP
+                self.sceneLeft.computeDepthMap(self.imgstack_left_layer1)
             # self.pixmap_left = QtGui.QPixmap(self.leftImage)
             self.pixmap_left = self.cv2Qimage(self.img_left_displayed_layer1)
             self.pixmap_item_left = QtGui.QGraphicsPixmapItem(self.pixmap_left, None, self.sceneLeft)
@@ -690,6 +695,8 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
             self.tableView_right.img1 = self.imgstack_right_layer1
             self.tableView_right.img2 = self.imgstack_right_layer2
             self.tableView_right.img3 = self.imgstack_right_layer3
+            ## 2D image for the x,y refinement
+            self.tableView_right.img2D = self.img_right_layer1 if self.imgstack_right_layer1 is None else None
             ## check if coloring z values in table is needed (correlation needs z=0 in 2D image, so no checking for valid z
             ## with 2D images needed)
             if self.imgstack_right_layer1 is None:
@@ -697,6 +704,8 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
             else:
                 self.sceneRight._z = True
                 self.setCustomRotCenter(max(self.imgstack_right_layer1.shape))
+                ## z estimates for markers set in the MIP
+                self.sceneRight.computeDepthMap(self.imgstack_right_layer1)
             # self.pixmap_right = QtGui.QPixmap(self.rightImage)
             self.pixmap_right = self.cv2Qimage(self.img_right_displayed_layer1)
             self.pixmap_item_right = QtGui.QGraphicsPixmapItem(self.pixmap_right, None, self.sceneRight)
@@ -971,7 +980,7 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
             16= normalized
         """
         if debug is True: print clrmsg.DEBUG + "===== imread"
-        img = tf.imread(path)
+        img = stackProcessing.readStack(path)
         if debug is True: print clrmsg.DEBUG + "Image shape/dtype:", img.shape, img.dtype
         ## Displaying issues with uint16 images -> convert to uint8
         if img.dtype == 'uint16':
@@ -999,48 +1008,18 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
             return np.amax(img, axis=0), 22, img
 
     def pxSize(self,img_path,z=False):
-        with tf.TiffFile(img_path) as tif:
-            for page in tif:
-                for tag in page.tags.values():
-                    if isinstance(tag.value, str):
-                        for keyword in ['PhysicalSizeX','PixelWidth','PixelSize'] if not z else ['PhysicalSizeZ','FocusStepSize']:
-                            tagposs = [m.start() for m in re.finditer(keyword, tag.value)]
-                            for tagpos in tagposs:
-                                if keyword == 'PhysicalSizeX' or keyword == 'PhysicalSizeZ':
-                                    for piece in tag.value[tagpos:tagpos+30].split('"'):
-                                        try:
-                                            pixelSize = float(piece)
-                                            if debug is True: print clrmsg.DEBUG + "Pixel size from exif metakey:", keyword
-                                            ## Value is in um from CorrSight/LA tiff files
-                                            if z:
-                                                pixelSize = pixelSize*1000
-                                            return pixelSize
-                                        except Exception as e:
-                                            if debug is True: print clrmsg.DEBUG + "Pixel size parser:", e
-                                            pass
-                                elif keyword == 'PixelWidth':
-                                    for piece in tag.value[tagpos:tagpos+30].split('='):
-                                        try:
-                                            try:
-                                                pixelSize = float(piece.strip().split('\r\n')[0])
-                                            except:
-                                                pixelSize = float(piece.strip().split(r'\r\n')[0])
-                                            if debug is True: print clrmsg.DEBUG + "Pixel size from exif metakey:", keyword
-                                            ## *1E6 because these values from SEM/FIB image is in m
-                                            return pixelSize*1E6
-                                        except Exception as e:
-                                            if debug is True: print clrmsg.DEBUG + "Pixel size parser:", e
-                                            pass
-                                elif keyword == 'PixelSize' or 'FocusStepSize':
-                                    for piece in tag.value[tagpos:tagpos+30].split('"'):
-                                        try:
-                                            pixelSize = float(piece)
-                                            if debug is True: print clrmsg.DEBUG + "Pixel size from exif metakey:", keyword
-                                            ## Value is in um from CorrSight/LA tiff files
-                                            return pixelSize
-                                        except Exception as e:
-                                            if debug is True: print clrmsg.DEBUG + "Pixel size parser:", e
-                                            pass
+        ## Parsed once per file by the shared tiff metadata reader
+        meta = tiffMetadata.read(img_path)
+        if debug is True: print clrmsg.DEBUG + "Pixel size from exif metakey:", meta['focusStepKey'] if z else meta['pixelSizeKey']
+        if z:
+            ## Value is in um from CorrSight/LA tiff files
+            if meta['focusStepKey'] == 'PhysicalSizeZ':
+                return meta['focusStep']*1000
+            return meta['focusStep']
+        ## *1E6 because these values from SEM/FIB image is in m
+        if meta['pixelSizeUnit'] == 'm':
+            return meta['pixelSize']*1E6
+        return meta['pixelSize']
 
     ## Convert opencv image (numpy array in BGR) to RGB QImage and return pixmap. Only takes 2D images
     def cv2Qimage(self,img,combobox=None):
@@ -1114,32 +1093,7 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
     ## Normalize Image
     def norm_img(self,img,copy=False):
         if debug is True: print clrmsg.DEBUG + "===== norm_img"
-        if copy is True:
-            img = np.copy(img)
-        dtype = str(img.dtype)
-        ## Determine data type
-        if dtype == "uint16" or dtype == "int16":
-            typesize = 65535
-        elif dtype == "uint8" or dtype == "int8":
-            typesize = 255
-        elif dtype == "float32" or dtype == "float64":
-            typesize = 1
-        else:
-            print clrmsg.ERROR + "Sorry, I don't know this file type yet: ", dtype
-        ## 2D image
-        if img.ndim == 2: img *= typesize/img.max()
-        ## 3D or multichannel image
-        elif img.ndim == 3:
-            ## tifffile reads z,y,x for stacks but y,x,c if it is multichannel image (or z,c,y,x if it is a multicolor image stack)
-            if img.shape[-1] > 4:
-                if debug is True: print clrmsg.DEBUG + "image stack"
-                for i in range(int(img.shape[0])):
-                    img[i,:,:] *= typesize/img[i,:,:].max()
-            else:
-                if debug is True: print clrmsg.DEBUG + "multichannel image"
-                for i in range(int(img.shape[2])):
-                    img[:,:,i] *= typesize/img[:,:,i].max()
-        return img
+        return stackProcessing.norm_img(img,copy=copy)
 
     def selectSlice(self):
         if self.label_selimg.text() == 'left':
@@ -1645,6 +1599,43 @@ class MainWidget(QtGui.QMainWindow, Ui_WidgetWindow):
             self.sceneRight.itemsToModel()
             # csvHandler.csvAppend2model(csv_file_in,self.modelRight,delimiter="\t",parent=self,sniff=True)
 
+    def detectBeads(self):
+        """Detect beads in the image stack (layer 1) or the 2D image of the selected side and add the strongest ones as
+        markers"""
+        side = self.label_selectedTable.text()
+        if side == 'left':
+            scene, img = self.sceneLeft, self.imgstack_left_layer1
+            if img is None:
+                ## 2D image, localized in x,y only
+                img = self.img_left_layer1
+        elif side == 'right':
+            scene, img = self.sceneRight, self.imgstack_right_layer1
+            if img is None:
+                img = self.img_right_layer1
+        else:
+            return
+        if img is None or (img.ndim != 3 and img.ndim != 2) or (img.ndim == 3 and scene._z is False):
+            QtGui.QMessageBox.warning(
+                self, "Warning", "Bead detection needs a single channel 3D image stack or a gray scale 2D image.")
+            return
+        maxbeads, ok = QtGui.QInputDialog.getInt(
+            self, 'Detect beads', 'Number of markers to add (strongest beads first):', 20, 1, 1000)
+        if not ok:
+            return
+        QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            ## localize more candidates than requested, some of them fail
+            beads = beadDetect.detect(img, method='gauss', cutout=scene.markerSize, maxbeads=2*maxbeads)
+        finally:
+            QtGui.QApplication.restoreOverrideCursor()
+        beads = beads[beads['status'] == 'ok'][:maxbeads]
+        if debug is True: print clrmsg.DEBUG + '{0} beads detected'.format(len(beads))
+        for bead in beads:
+            scene.addCircle(bead['x'], bead['y'], bead['z'])
+        scene.itemsToModel()
+        if len(beads) < maxbeads:
+            QtGui.QMessageBox.information(self, "Detect beads", "Only {0} beads found.".format(len(beads)))
+
                                                 ##################### END #####################
                                                 ######     CSV - Point import/export    #######
                                                 ###############################################
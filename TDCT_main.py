@@ -66,6 +66,7 @@ import sys
 import os
 import tempfile
 import time
+import Queue
 # For pyinstaller matlab
 import FileDialog
 # for launching user's guide
@@ -73,7 +74,7 @@ import webbrowser
 # GUI imports
 from subprocess import call
 from PyQt4 import QtCore, QtGui, uic
-from tdct import clrmsg, TDCT_debug, helpdoc, stackProcessing
+from tdct import clrmsg, TDCT_debug, helpdoc, stackProcessing, tiffMetadata
 import TDCT_correlation
 # add working directory temporarily to PYTHONPATH
 if getattr(sys, 'frozen', False):
@@ -168,8 +169,18 @@ class APP(QtGui.QMainWindow, Ui_MainWindow):
 		self.progressBar_Normalize.setVisible(False)
 		self.progressBar_Mip.setVisible(False)
 
+		## Background processing, jobs are queued and run one after the other
+		self.progressBars = {
+			'ImageStack': self.progressBar_ImageStack, 'ImageSequence': self.progressBar_ImageSequence,
+			'Normalize': self.progressBar_Normalize, 'Mip': self.progressBar_Mip}
+		self.pendingJobs = dict((name, 0) for name in self.progressBars)
+		self.worker = Worker(self)
+		self.worker.progress.connect(self.jobProgress)
+		self.worker.jobDone.connect(self.jobDone)
+		self.worker.start()
+
 		# Checkbox
-		# DEL self.checkBox_cubeVoxels.stateChanged.connect(lambda: self.cubeVoxelsState(self.checkBox_cubeVoxels.isChecked()))
+		self.checkBox_cubeVoxels.stateChanged.connect(lambda: self.cubeVoxelsState(self.checkBox_cubeVoxels.isChecked()))
 
 		# Initialize Working directory
 		self.workingdir = os.path.expanduser("~")
@@ -344,6 +355,8 @@ class APP(QtGui.QMainWindow, Ui_MainWindow):
 		Exit dialog. If accepted, close other windows first.
 		"""
 		quit_msg = "Are you sure you want to exit the\n3D Correlation Toolbox?\n\nUnsaved data will be lost!"
+		if sum(self.pendingJobs.values()):
+			quit_msg += "\nRunning and queued processing jobs will be cancelled!"
 		reply = QtGui.QMessageBox.question(self, 'Message', quit_msg, QtGui.QMessageBox.Yes, QtGui.QMessageBox.No)
 		if reply == QtGui.QMessageBox.Yes:
 			## if loaded, close correlationModul
@@ -358,6 +371,8 @@ class APP(QtGui.QMainWindow, Ui_MainWindow):
 					event.accept()
 			else:
 				event.accept()
+			if event.isAccepted():
+				self.worker.stop()
 		else:
 			event.ignore()
 
@@ -395,8 +410,8 @@ class APP(QtGui.QMainWindow, Ui_MainWindow):
 		sender = self.sender()
 		if sender == self.toolButton_ImageStackGetPixelSize:
 			try:
-				pixelSizeXY = stackProcessing.pxSize(str(self.lineEdit_ImageStackPath.text()))
-				pixelSizeZ = stackProcessing.pxSize(str(self.lineEdit_ImageStackPath.text()),z=True)
+				meta = tiffMetadata.read(str(self.lineEdit_ImageStackPath.text()))
+				pixelSizeXY, pixelSizeZ = meta['pixelSize'], meta['focusStep']
 				if debug is True: print clrmsg.DEBUG + "Pixelsize xy/z", pixelSizeXY, pixelSizeZ
 				if pixelSizeXY:
 					self.doubleSpinBox_ImageStackFocusStepSizeReslized.setValue(pixelSizeXY*1000)
@@ -413,10 +428,8 @@ class APP(QtGui.QMainWindow, Ui_MainWindow):
 		elif sender == self.toolButton_ImageSequenceGetPixelSize:
 			try:
 				print os.path.join(str(self.lineEdit_ImageSequencePath.text()),"Tile_001-001-000_0-000.tif")
-				pixelSizeXY = stackProcessing.pxSize(
-					os.path.join(str(self.lineEdit_ImageSequencePath.text()),"Tile_001-001-000_0-000.tif"))
-				pixelSizeZ = stackProcessing.pxSize(
-					os.path.join(str(self.lineEdit_ImageSequencePath.text()),"Tile_001-001-000_0-000.tif"),z=True)
+				meta = tiffMetadata.read(os.path.join(str(self.lineEdit_ImageSequencePath.text()),"Tile_001-001-000_0-000.tif"))
+				pixelSizeXY, pixelSizeZ = meta['pixelSize'], meta['focusStep']
 				if debug is True: print clrmsg.DEBUG + "Pixelsize xy/z", pixelSizeXY, pixelSizeZ
 				if pixelSizeXY:
 					self.doubleSpinBox_ImageSequenceFocusStepSizeReslized.setValue(pixelSizeXY*1000)
@@ -433,23 +446,14 @@ class APP(QtGui.QMainWindow, Ui_MainWindow):
 
 	def cubeVoxelsState(self, checkstate):
 		"""
-		Cube Voxels button state handling.
+		Cube Voxels checkbox state handling. Isotropic resampling takes the output step size as voxel edge length and
+		is not cached.
 		"""
+		self.checkBox_ImageStackCache.setEnabled(not checkstate)
 		if checkstate is True:
-			self.doubleSpinBox_focusStepsize.setEnabled(True)
-			self.radioButton_20x.setEnabled(True)
-			self.radioButton_40x.setEnabled(True)
-			self.radioButton_63x.setEnabled(True)
-			self.radioButton_customFocusStepsize.setEnabled(True)
-			self.doubleSpinBox_customFocusStepsize.setEnabled(True)
-
+			self.label_15.setText("Output voxel size:")
 		else:
-			self.doubleSpinBox_focusStepsize.setEnabled(False)
-			self.radioButton_20x.setEnabled(False)
-			self.radioButton_40x.setEnabled(False)
-			self.radioButton_63x.setEnabled(False)
-			self.radioButton_customFocusStepsize.setEnabled(False)
-			self.doubleSpinBox_customFocusStepsize.setEnabled(False)
+			self.label_15.setText("Output focus stepsize:")
 
 	def populate_filelist(self, path):
 		"""
@@ -538,10 +542,8 @@ class APP(QtGui.QMainWindow, Ui_MainWindow):
 		By default the new resliced image stack is saved in the same direction as the original file. This directory is
 		checked for write permission. If it is a read only directory, the user is asked to select a different directory or
 		to aboard the process.
+		The stack is processed in the background, further jobs can be queued while it is running.
 		"""
-		self.progressBar_ImageStack.setVisible(True)
-		self.progressBar_ImageStack.setMaximum(0)
-		QtGui.QApplication.processEvents()  # Update GUI to display progressbar
 		img_path = str(self.lineEdit_ImageStackPath.text())
 		customSaveDir = self.checkDirectoryPrivileges(
 			os.path.split(img_path)[0],question="Do you want me to save the data to another directory?")
@@ -549,17 +551,16 @@ class APP(QtGui.QMainWindow, Ui_MainWindow):
 			ss_in = self.doubleSpinBox_ImageStackFocusStepSizeOrig.value()
 			ss_out = self.doubleSpinBox_ImageStackFocusStepSizeReslized.value()
 			if debug is True: print clrmsg.DEBUG, img_path, ss_in, ss_out, customSaveDir
-			self.progressBar_ImageStack.setMaximum(100)
-			QtGui.QApplication.processEvents()
-			stackProcessing.main(
-				img_path, ss_in, ss_out, qtprocessbar=self.progressBar_ImageStack,
-				interpolationmethod='linear', saveorigstack=False, showgraph=False, customSaveDir=customSaveDir)
-			self.progressBar_ImageStack.reset()
-			self.progressBar_ImageStack.setVisible(False)
-		else:
-			self.progressBar_ImageStack.setMaximum(100)
-			self.progressBar_ImageStack.reset()
-			self.progressBar_ImageStack.setVisible(False)
+			if self.checkBox_cubeVoxels.isChecked():
+				## xy pixel size is taken from the file
+				self.submitJob(
+					'ImageStack', stackProcessing.isotropic, img_path, voxelsize=ss_out, ss_in=ss_in,
+					interpolationmethod='linear', customSaveDir=customSaveDir)
+			else:
+				self.submitJob(
+					'ImageStack', stackProcessing.main, img_path, ss_in, ss_out,
+					interpolationmethod='linear', saveorigstack=False, showgraph=False, customSaveDir=customSaveDir,
+					cache=self.checkBox_ImageStackCache.isChecked())
 
 	def imageSequence(self):
 		"""
@@ -571,10 +572,8 @@ class APP(QtGui.QMainWindow, Ui_MainWindow):
 		By default the new merged and/or resliced image stack is saved in the same direction as the original file. This directory is
 		checked for write permission. If it is a read only directory, the user is asked to select a different directory or
 		to aboard the process.
+		The sequence is processed in the background, further jobs can be queued while it is running.
 		"""
-		self.progressBar_ImageSequence.setVisible(True)
-		self.progressBar_ImageSequence.setMaximum(0)
-		QtGui.QApplication.processEvents()
 		dirPath = str(self.lineEdit_ImageSequencePath.text())
 		customSaveDir = self.checkDirectoryPrivileges(dirPath,question="Do you want me to save the data to another directory?")
 		if os.path.isdir(dirPath) and customSaveDir:
@@ -583,66 +582,64 @@ class APP(QtGui.QMainWindow, Ui_MainWindow):
 				ss_out = self.doubleSpinBox_ImageSequenceFocusStepSizeReslized.value()
 				if debug is True: print clrmsg.DEBUG, dirPath, ss_in, ss_out, str(
 					self.checkBox_ImageSequenceSaveOrigStack.isChecked()), customSaveDir
-				self.progressBar_ImageSequence.setMaximum(100)
-				QtGui.QApplication.processEvents()
-				stackProcessing.main(
-					dirPath, ss_in, ss_out, qtprocessbar=self.progressBar_ImageSequence, interpolationmethod='linear',
+				self.submitJob(
+					'ImageSequence', stackProcessing.main, dirPath, ss_in, ss_out, interpolationmethod='linear',
 					saveorigstack=self.checkBox_ImageSequenceSaveOrigStack.isChecked(), showgraph=False, customSaveDir=customSaveDir)
-				self.progressBar_ImageSequence.reset()
 			else:
 				if debug is True: print clrmsg.DEBUG, 'no reslicing'
-				self.progressBar_ImageSequence.setMaximum(100)
-				QtGui.QApplication.processEvents()
-				stackProcessing.main(
-					dirPath, 0, 0,
-					qtprocessbar=self.progressBar_ImageSequence,
+				self.submitJob(
+					'ImageSequence', stackProcessing.main, dirPath, 0, 0,
 					saveorigstack=True, interpolationmethod='none', customSaveDir=customSaveDir)
-				self.progressBar_ImageSequence.reset()
-				self.progressBar_ImageSequence.setVisible(False)
-		else:
-			self.progressBar_ImageSequence.setMaximum(100)
-			self.progressBar_ImageSequence.reset()
-			self.progressBar_ImageSequence.setVisible(False)
 
 	def normalize(self):
-		self.progressBar_Normalize.setVisible(True)
-		self.progressBar_Normalize.setMaximum(0)
-		QtGui.QApplication.processEvents()
 		img_path = str(self.lineEdit_NormalizePath.text())
 		customSaveDir = self.checkDirectoryPrivileges(
 			os.path.split(img_path)[0],question="Do you want me to save the data to another directory?")
 		if img_path and self.lineEdit_NormalizePath.fileIsTiff is True and customSaveDir:
 			if debug is True: print clrmsg.DEBUG, 'In/out:', img_path, customSaveDir
-			self.progressBar_Normalize.setMaximum(100)
-			QtGui.QApplication.processEvents()
-			stackProcessing.normalize(img_path, qtprocessbar=self.progressBar_Normalize, customSaveDir=customSaveDir)
-			self.progressBar_Normalize.reset()
-			self.progressBar_Normalize.setVisible(False)
-		else:
-			self.progressBar_Normalize.setMaximum(100)
-			self.progressBar_Normalize.reset()
-			self.progressBar_Normalize.setVisible(False)
+			self.submitJob('Normalize', stackProcessing.normalize, img_path, customSaveDir=customSaveDir)
 
 	def mip(self):
-		self.progressBar_Mip.setVisible(True)
-		self.progressBar_Mip.setMaximum(0)
-		QtGui.QApplication.processEvents()
 		img_path = str(self.lineEdit_MipPath.text())
 		customSaveDir = self.checkDirectoryPrivileges(
 			os.path.split(img_path)[0],question="Do you want me to save the data to another directory?")
 		if img_path and self.lineEdit_MipPath.fileIsTiff is True and customSaveDir:
 			if debug is True: print clrmsg.DEBUG, 'In/out/normalize:', img_path, customSaveDir, self.checkBox_MipNormalize.isChecked()
-			self.progressBar_Mip.setMaximum(100)
-			QtGui.QApplication.processEvents()
-			stackProcessing.mip(
-				img_path, qtprocessbar=self.progressBar_Mip,
+			self.submitJob(
+				'Mip', stackProcessing.mip, img_path,
 				customSaveDir=customSaveDir, normalize=self.checkBox_MipNormalize.isChecked())
-			self.progressBar_Mip.reset()
-			self.progressBar_Mip.setVisible(False)
+
+	def submitJob(self, name, function, *args, **kwargs):
+		"""
+		Queue a stackProcessing function on the background worker. name selects the progress bar ('ImageStack',
+		'ImageSequence', 'Normalize' or 'Mip').
+		"""
+		self.pendingJobs[name] += 1
+		self.progressBars[name].setVisible(True)
+		self.updateProgressFormat(name)
+		self.worker.submit(name, function, *args, **kwargs)
+
+	def jobProgress(self, name, value):
+		self.progressBars[name].setValue(value)
+
+	def jobDone(self, name, retVal):
+		"""
+		Hide the progress bar once all jobs of its panel are done and show errors of failed jobs.
+		"""
+		self.pendingJobs[name] -= 1
+		self.progressBars[name].reset()
+		if self.pendingJobs[name] == 0:
+			self.progressBars[name].setVisible(False)
 		else:
-			self.progressBar_Mip.setMaximum(100)
-			self.progressBar_Mip.reset()
-			self.progressBar_Mip.setVisible(False)
+			self.updateProgressFormat(name)
+		if debug is True: print clrmsg.DEBUG, name, 'job done:', retVal
+		## stackProcessing functions return an error message string if processing failed
+		if type(retVal) == str:
+			QtGui.QMessageBox.warning(self, "Warning", retVal)
+
+	def updateProgressFormat(self, name):
+		queued = self.pendingJobs[name]-1
+		self.progressBars[name].setFormat("%p%" if queued < 1 else "%p% (+{0} queued)".format(queued))
 
 
 class MovieSplashScreen(QtGui.QSplashScreen):
@@ -697,20 +694,63 @@ class MovieSplashScreen(QtGui.QSplashScreen):
 		return self.movie.scaledSize()
 
 
-## Class to outsource work to an independent thread. Not used anymore at the moment.
-class GenericThread(QtCore.QThread):
-	def __init__(self, function, *args, **kwargs):
-		QtCore.QThread.__init__(self)
-		self.function = function
-		self.args = args
-		self.kwargs = kwargs
+## Class to outsource processing to a background thread, see APP.submitJob
+class Worker(QtCore.QThread):
+	"""
+	Runs queued jobs one after the other, so the GUI stays responsive and several jobs can be queued at once.
+
+	A job is a function taking a callback keyword, i.e. the stackProcessing progress/cancel callback protocol (see
+	stackProcessing.report). The progress is forwarded to the GUI thread with the progress signal, every finished job
+	emits jobDone with its return value or an error message string if it raised.
+	"""
+	progress = QtCore.pyqtSignal(object, int)
+	jobDone = QtCore.pyqtSignal(object, object)
+
+	def __init__(self, parent=None):
+		QtCore.QThread.__init__(self, parent)
+		self.jobs = Queue.Queue()
+		self.cancelled = False
 
-	def __del__(self):
+	def submit(self, name, function, *args, **kwargs):
+		"""Queue function(*args, **kwargs). name is passed on with the signals of the job."""
+		self.jobs.put((name, function, args, kwargs))
+
+	def cancel(self):
+		"""Cancel the running job at its next progress report and drop all queued jobs"""
+		while True:
+			try:
+				name = self.jobs.get_nowait()[0]
+			except Queue.Empty:
+				break
+			self.jobDone.emit(name, None)
+		self.cancelled = True
+
+	def stop(self):
+		"""Cancel all jobs and wait for the thread to finish"""
+		self.cancel()
+		self.jobs.put(None)
 		self.wait()
 
 	def run(self):
-		self.function(*self.args,**self.kwargs)
-		return
+		while True:
+			job = self.jobs.get()
+			if job is None:
+				return
+			name, function, args, kwargs = job
+			self.cancelled = False
+			callback = lambda value: self.report(name, value)
+			try:
+				retVal = function(*args, callback=callback, **kwargs)
+			except stackProcessing.Cancelled as e:
+				if debug is True: print clrmsg.DEBUG, name, e
+				retVal = None
+			except Exception as e:
+				retVal = "ERROR: {0}".format(e)
+			self.jobDone.emit(name, retVal)
+
+	def report(self, name, value):
+		self.progress.emit(name, int(value))
+		return self.cancelled
 
 
 ########## Executed when running in standalone ###################################
@@ -39,6 +39,7 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 import math
 import beadPos
+import stackProcessing
 import clrmsg
 import TDCT_debug
 
@@ -63,6 +64,8 @@ class QTableViewCustom(QtGui.QTableView):
 			self.mainParent = self.parent().parent().parent()
 
 		self._drop = False
+		## 2D image (no image stack) for the x,y refinement, set by TDCT_correlation
+		self.img2D = None
 
 		## Enable Drag'n'Drop
 		self.setDragDropOverwriteMode(False)
@@ -154,16 +157,25 @@ class QTableViewCustom(QtGui.QTableView):
 			cmGetZgaussL1.triggered.connect(lambda: self.getz(self.img1, gauss=True))
 			cmGetZgaussOptL1 = QtGui.QAction('Get x,y,z gauss layer 1', self)
 			cmGetZgaussOptL1.triggered.connect(lambda: self.getz(self.img1, gauss=True,optimize=True))
+			cmGetZradialOptL1 = QtGui.QAction('Get x,y,z radial layer 1', self)
+			cmGetZradialOptL1.triggered.connect(lambda: self.getz(self.img1, radial=True,optimize=True))
 			# Layer 2
 			cmGetZgaussL2 = QtGui.QAction('Get z gauss layer 2', self)
 			cmGetZgaussL2.triggered.connect(lambda: self.getz(self.img2, gauss=True))
 			cmGetZgaussOptL2 = QtGui.QAction('Get x,y,z gauss layer 2', self)
 			cmGetZgaussOptL2.triggered.connect(lambda: self.getz(self.img2, gauss=True,optimize=True))
+			cmGetZradialOptL2 = QtGui.QAction('Get x,y,z radial layer 2', self)
+			cmGetZradialOptL2.triggered.connect(lambda: self.getz(self.img2, radial=True,optimize=True))
 			# Layer 3
 			cmGetZgaussL3 = QtGui.QAction('Get z gauss layer 3', self)
 			cmGetZgaussL3.triggered.connect(lambda: self.getz(self.img3, gauss=True))
 			cmGetZgaussOptL3 = QtGui.QAction('Get x,y,z gauss layer 3', self)
 			cmGetZgaussOptL3.triggered.connect(lambda: self.getz(self.img3, gauss=True,optimize=True))
+			cmGetZradialOptL3 = QtGui.QAction('Get x,y,z radial layer 3', self)
+			cmGetZradialOptL3.triggered.connect(lambda: self.getz(self.img3, radial=True,optimize=True))
+			# 2D image
+			cmGetXYgauss2D = QtGui.QAction('Get x,y gauss 2D image', self)
+			cmGetXYgauss2D.triggered.connect(lambda: self.getxy(self.img2D))
 
 			# broken and not used atm
 			# cmGetZpoly = QtGui.QAction('Get z poly (deprecated)', self)
@@ -173,14 +185,19 @@ class QTableViewCustom(QtGui.QTableView):
 			if self.img1 is None:
 				cmGetZgaussL1.setEnabled(False)
 				cmGetZgaussOptL1.setEnabled(False)
+				cmGetZradialOptL1.setEnabled(False)
 			if self.img2 is None:
 				cmGetZgaussL2.setEnabled(False)
 				cmGetZgaussOptL2.setEnabled(False)
+				cmGetZradialOptL2.setEnabled(False)
 			if self.img3 is None:
 				cmGetZgaussL3.setEnabled(False)
 				cmGetZgaussOptL3.setEnabled(False)
+				cmGetZradialOptL3.setEnabled(False)
 				# cmGetZpoly.setEnabled(False)  # broken atm
 				# cmGetZpolyOpt.setEnabled(False)  # broken atm
+			if self.img2D is None or self.img2D.ndim != 2:
+				cmGetXYgauss2D.setEnabled(False)
 			self.contextMenu = QtGui.QMenu(self)
 			self.contextMenu.addAction(cmDelete)
 			self.contextMenu.addSeparator()
@@ -191,11 +208,17 @@ class QTableViewCustom(QtGui.QTableView):
 			self.contextMenu.addAction(cmGetZgaussOptL1)
 			self.contextMenu.addAction(cmGetZgaussOptL2)
 			self.contextMenu.addAction(cmGetZgaussOptL3)
+			self.contextMenu.addSeparator()
+			self.contextMenu.addAction(cmGetZradialOptL1)
+			self.contextMenu.addAction(cmGetZradialOptL2)
+			self.contextMenu.addAction(cmGetZradialOptL3)
+			self.contextMenu.addSeparator()
+			self.contextMenu.addAction(cmGetXYgauss2D)
 			# self.contextMenu.addAction(cmGetZpoly)  # broken atm
 			# self.contextMenu.addAction(cmGetZpolyOpt)  # broken atm
 			self.contextMenu.popup(QtGui.QCursor.pos())
 
-	def getz(self,img,optimize=False,gauss=False):
+	def getz(self,img,optimize=False,gauss=False,radial=False):
 		indices = self.selectedIndexes()
 		## Determine z for selected rows
 		if indices:
@@ -204,68 +227,84 @@ class QTableViewCustom(QtGui.QTableView):
 				if isinstance(item, QtGui.QGraphicsEllipseItem):
 					activeitems.append(item)
 			## Filter selected rows
-			rows = set(index.row() for index in indices)
-			## Delete selected rows in scene.
+			rows = sorted(set(index.row() for index in indices))
+			positions = []
 			for row in rows:
 				if debug is True:
 					print clrmsg.DEBUG + 'Row:', row, '|', \
 						self._model.data(self._model.index(row, 0)).toString(),\
 						self._model.data(self._model.index(row, 1)).toString(),\
 						self._model.data(self._model.index(row, 2)).toString()
-				x = float(self._model.data(self._model.index(row, 0)).toString())
-				y = float(self._model.data(self._model.index(row, 1)).toString())
-				if gauss is True:
-					if optimize is False:
-						zopt = beadPos.getzGauss(x,y,img,parent=self.mainParent)
-						if debug is True: print clrmsg.DEBUG + str(img.shape), zopt
-						if 0 <= zopt <= img.shape[-3]:
-							self._scene.zValuesDict[activeitems[row]][1] = (0,0,0)
-							self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.black)
-						else:
-							self._scene.zValuesDict[activeitems[row]][1] = (255,0,0)
-							self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.red)
-						self._model.itemFromIndex(self._model.index(row, 2)).setText(str(zopt))
-					else:
-						xopt,yopt,zopt = beadPos.getzGauss(
-							x,y,img,parent=self.mainParent,optimize=True,threshold=True,
-							threshVal=self.mainParent.doubleSpinBox_treshVal.value(),cutout=self._scene.markerSize)
-						if debug is True: print clrmsg.DEBUG + str(img.shape), xopt,yopt,zopt
-						if (
-							abs(x - xopt) <= 2 * self._scene.markerSize and
-							abs(y - yopt) <= 2 * self._scene.markerSize and
-							0 <= zopt <= img.shape[-3]):
-							self._scene.zValuesDict[activeitems[row]][1] = (255,0,0)
-							self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.black)
-						else:
-							self._scene.zValuesDict[activeitems[row]][1] = (0,0,0)
-							self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.red)
-							xopt, yopt = x, y
-						self._model.itemFromIndex(self._model.index(row, 0)).setText(str(xopt))
-						self._model.itemFromIndex(self._model.index(row, 1)).setText(str(yopt))
-						self._model.itemFromIndex(self._model.index(row, 2)).setText(str(zopt))
-				elif optimize is False:
-					zopt = beadPos.getzPoly(x,y,img,n=None)
-					if debug is True: print clrmsg.DEBUG + str(img.shape), zopt
-					if 0 <= zopt <= img.shape[-3]:
+				positions.append((
+					float(self._model.data(self._model.index(row, 0)).toString()),
+					float(self._model.data(self._model.index(row, 1)).toString())))
+			## All selected beads in one call
+			if gauss is True and optimize is True:
+				## Fit plots are only shown for a single bead, several beads are refined in one batch
+				beads = beadPos.getzBatch(
+					positions,img,method='gauss',optimize=True,parent=self.mainParent if len(rows) == 1 else None,
+					threshold=True,threshVal=self.mainParent.doubleSpinBox_treshVal.value(),cutout=self._scene.markerSize)
+			elif gauss is True:
+				beads = beadPos.getzBatch(
+					positions,img,method='gauss',parent=self.mainParent if len(rows) == 1 else None,fast=len(rows) > 1)
+			elif radial is True:
+				beads = beadPos.getzBatch(
+					positions,img,method='radial',optimize=optimize,cutout=self._scene.markerSize)
+			else:
+				beads = beadPos.getzBatch(positions,img,method='poly',n=None,optimize=optimize)
+			for row, (x, y), bead in zip(rows, positions, beads):
+				if debug is True: print clrmsg.DEBUG + str(img.shape), bead
+				zopt = bead['z'] if bead['status'] == 'ok' else 'failed'
+				if optimize is False:
+					if bead['status'] == 'ok':
 						self._scene.zValuesDict[activeitems[row]][1] = (0,0,0)
 						self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.black)
 					else:
 						self._scene.zValuesDict[activeitems[row]][1] = (255,0,0)
 						self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.red)
 					self._model.itemFromIndex(self._model.index(row, 2)).setText(str(zopt))
-				elif optimize is True:
-					xopt,yopt,zopt = beadPos.getzPoly(x,y,img,n=None,optimize=True)
-					if debug is True: print clrmsg.DEBUG + str(img.shape), xopt,yopt,zopt
-					if 0 <= xopt <= img.shape[-1] and 0 <= yopt <= img.shape[-2] and 0 <= zopt <= img.shape[-3]:
+				else:
+					xopt, yopt = bead['x'], bead['y']
+					if gauss is True or radial is True:
+						valid = (
+							bead['status'] == 'ok' and
+							abs(x - xopt) <= 2 * self._scene.markerSize and
+							abs(y - yopt) <= 2 * self._scene.markerSize)
+					else:
+						valid = bead['status'] == 'ok'
+					if valid:
 						self._scene.zValuesDict[activeitems[row]][1] = (255,0,0)
 						self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.black)
 					else:
 						self._scene.zValuesDict[activeitems[row]][1] = (0,0,0)
 						self._model.itemFromIndex(self._model.index(row, 2)).setForeground(QtCore.Qt.red)
+						if gauss is True or radial is True:
+							xopt, yopt = x, y
 					self._model.itemFromIndex(self._model.index(row, 0)).setText(str(xopt))
 					self._model.itemFromIndex(self._model.index(row, 1)).setText(str(yopt))
 					self._model.itemFromIndex(self._model.index(row, 2)).setText(str(zopt))
 
+	def getxy(self,img):
+		"""Refine x,y of the selected rows in a 2D image with 2D Gaussian fits (see beadPos.getxyBatch)"""
+		indices = self.selectedIndexes()
+		if indices:
+			rows = sorted(set(index.row() for index in indices))
+			positions = [(
+				float(self._model.data(self._model.index(row, 0)).toString()),
+				float(self._model.data(self._model.index(row, 1)).toString())) for row in rows]
+			## Fit plot is only shown for a single bead, several beads are fitted in one batch
+			beads = beadPos.getxyBatch(
+				positions,img,method='gauss',cutout=self._scene.markerSize,
+				parent=self.mainParent if len(rows) == 1 else None)
+			for row, (x, y), bead in zip(rows, positions, beads):
+				if debug is True: print clrmsg.DEBUG + str(img.shape), bead
+				if bead['status'] == 'ok' and abs(x - bead['x']) <= 2 * self._scene.markerSize and \
+						abs(y - bead['y']) <= 2 * self._scene.markerSize:
+					self._model.itemFromIndex(self._model.index(row, 0)).setText(str(bead['x']))
+					self._model.itemFromIndex(self._model.index(row, 1)).setText(str(bead['y']))
+				elif debug is True:
+					print clrmsg.ERROR, 'Row {0}: x,y optimization failed ({1})'.format(row, bead['status'])
+
 												##################### END #####################
 												#######          Update items           #######
 												###############################################
@@ -311,6 +350,10 @@ class QGraphicsSceneCustom(QtGui.QGraphicsScene):
 		## Circle size
 		self.markerSize = 10
 		self.zValuesDict = {}
+		## Depth from focus map of the image stack, computed in the background when the stack is loaded (see
+		## computeDepthMap)
+		self.depthMap = None
+		self.depthThread = None
 
 	def wheelEvent(self, event):
 		## Scaling
@@ -341,7 +384,9 @@ class QGraphicsSceneCustom(QtGui.QGraphicsScene):
 			return
 		elif event.button() == QtCore.Qt.RightButton:
 			if self.mainWidget.checkBox_MIP.isChecked():
-				self.addCircle(event.scenePos().x(), event.scenePos().y())
+				## z estimate from the depth from focus map, no fitting per click
+				x, y = event.scenePos().x(), event.scenePos().y()
+				self.addCircle(x, y, z=self.depthAt(x, y), estimate=True)
 			else:
 				self.addCircle(event.scenePos().x(), event.scenePos().y(),z=self.mainWidget.spinBox_slice.value())
 		elif event.button() == QtCore.Qt.MiddleButton:
@@ -378,7 +423,33 @@ class QGraphicsSceneCustom(QtGui.QGraphicsScene):
 		elif event.key() == QtCore.Qt.Key_Minus:
 			self.parent().scale(1 / 1.15, 1 / 1.15)
 
-	def addCircle(self,x,y,z=None):
+	def computeDepthMap(self,stack):
+		"""Compute the depth map of the image stack in a background thread (see DepthMapThread), depthAt returns None
+		until it is done"""
+		self.depthMap, self.depthThread = None, None
+		if stack is None or stack.ndim != 3:
+			return
+		## the main widget owns the thread, so it outlives a replaced scene
+		self.depthThread = DepthMapThread(stack, self.mainWidget)
+		self.depthThread.done.connect(self.setDepthMap)
+		self.depthThread.start()
+
+	def setDepthMap(self,depthMap):
+		## ignore a thread of a previous stack
+		if self.sender() is self.depthThread:
+			self.depthMap = depthMap
+
+	def depthAt(self,x,y):
+		"""z of the focus peak at x,y looked up in the depth map of the image stack (see computeDepthMap),
+		None if the map is not computed (yet) or the pixel has no focus peak above the background"""
+		x, y = int(round(x)), int(round(y))
+		if self.depthMap is None or not (0 <= y < self.depthMap.shape[0] and 0 <= x < self.depthMap.shape[1]):
+			return None
+		z = self.depthMap[y, x]
+		return None if np.isnan(z) else float(z)
+
+	def addCircle(self,x,y,z=None,estimate=False):
+		## estimate flags z as a depth map estimate, still to be fitted
 		## First add at 0,0 then move to get position from item.scenePos() or .x() and y.()
 		circle = self.addEllipse(-self.markerSize, -self.markerSize, self.markerSize * 2, self.markerSize * 2, self.pen)
 		circle.setPos(x,y)
@@ -388,8 +459,10 @@ class QGraphicsSceneCustom(QtGui.QGraphicsScene):
 		## and flag for color (rgba)
 		if self._z and z is None:
 			self.zValuesDict[circle] = [0.0,(255, 190, 0)]  # orange
+		elif self._z and estimate is True:
+			self.zValuesDict[circle] = [float(z),(0, 120, 255)]  # blue
 		elif self._z and z is not None:
-			self.zValuesDict[circle] = [float(z),(0, 0, 0)]  # orange
+			self.zValuesDict[circle] = [float(z),(0, 0, 0)]  # black
 		else:
 			self.zValuesDict[circle] = [0.0,(0, 0, 0)]  # black
 		## Reorder to have them in ascending order in the tableview
@@ -497,6 +570,37 @@ class QGraphicsSceneCustom(QtGui.QGraphicsScene):
 		self.mainWidget.colorModels()
 
 
+##############################
+## Depth map thread
+
+
+class DepthMapThread(QtCore.QThread):
+	"""
+	Computes the depth from focus map (z of the focus peak of every x,y pixel, see stackProcessing.depthMap) of an
+	image stack without blocking the GUI and emits done with the map or None if it failed.
+	Pixels whose focus peak is not above the background (median + 3x the robust noise level of the peak map) are
+	set to nan, as there is no bead to estimate z from.
+	"""
+	done = QtCore.pyqtSignal(object)
+
+	def __init__(self, stack, parent=None):
+		QtCore.QThread.__init__(self, parent)
+		self.stack = stack
+
+	def run(self):
+		retVal = stackProcessing.depthMap(self.stack)
+		if type(retVal) == str:
+			if debug is True: print clrmsg.DEBUG + retVal
+			self.done.emit(None)
+			return
+		height, peak = retVal
+		background = np.nanmedian(peak)
+		noise = 1.4826*np.nanmedian(np.abs(peak-background))
+		with np.errstate(invalid='ignore'):
+			height[~(peak > background+3*noise)] = np.nan
+		self.done.emit(height)
+
+
 ##############################
 ## Scatter Plot
 
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Detect fluorescent fiducial beads in 3D image stacks (tiff z-stack) or 2D images automatically.
+
+Beads are searched for as blobs in the maximum intensity projection (MIP) with a multiscale Laplacian of Gaussian
+(LoG). The scale space is searched on binned data first and every coarse blob is refined at full resolution. The
+candidates are then localized in 3D, all at once (see beadPos.getzBatch), and ranked by their blob strength. In 2D
+images the blobs are searched for in the image itself and localized in x,y only (see beadPos.getxyBatch).
+
+Usage:
+	import beadDetect
+	>>> beads = beadDetect.detect('image_stack.tif', maxbeads=50)
+	>>> for bead in beads[beads['status'] == 'ok']: print bead['x'], bead['y'], bead['z'], bead['score']
+
+# @Title			: beadDetect
+# @Project			: 3DCTv2
+# @Description		: Detect fiducial beads in 3D image stacks
+# @Author			: 3DCT contributors
+# @Email			:
+# @Copyright		: Copyright (C) 2026  3DCT contributors
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			: Lindeberg, Int. J. Comput. Vision 30, 1998 for the scale normalized LoG blob detection
+# @Maintainer		:
+# @Date				: 2026/10
+# @Version			: module rev. 1
+# @Status			: stable
+# @Usage			: import beadDetect
+# 					: >>> beads = beadDetect.detect('image_stack.tif', maxbeads=50)
+# @Notes			: The score is the LoG response in units of its noise level (median absolute deviation), so the
+# 					: threshold does not depend on the image intensities.
+# @Python_version	: 2.7.11
+"""
+# ======================================================================================================================
+
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+import beadPos
+import stackProcessing
+
+try:
+	import clrmsg
+	import TDCT_debug
+except:
+	pass
+
+debug = TDCT_debug.debug
+
+## Result record of detect, one per candidate: the fields of beadPos.BEAD, the blob scale (LoG sigma in pixels) and
+## the score (LoG response over its noise level) the candidates are ranked by
+CANDIDATE = np.dtype(beadPos.BEAD.descr[:-1]+[('scale', np.float64), ('score', np.float64), ('status', 'S8')])
+
+
+def detect(
+		img,sigmas=(1, 1.5, 2, 3, 4),binning=2,threshold=5,mindistance=None,method='gauss',cutout=10,maxbeads=None,
+		callback=None):
+	"""Detect beads in an image stack and localize them in 3D
+	img is the path to the z-stack tiff file or a numpy.ndarray (z,y,x), or a 2D numpy.ndarray (y,x) in which the
+	beads are localized in x,y only (see beadPos.getxyBatch, z is nan)
+	sigmas are the blob scales (LoG sigma in pixels) searched for, roughly the bead radius/sqrt(2)
+	binning is the binning factor of the coarse search (1 searches at full resolution only)
+	threshold is the minimal score, the LoG response in units of its noise level
+	mindistance is the minimal distance of two candidates in pixels, the weaker one is dropped (default 2*max(sigmas))
+	method and cutout are passed on to beadPos.getzBatch ('gauss': joint 3D Gaussian fit, 'radial': radial symmetry),
+	the z start values are the closed-form Gaussian fits (fast == True). In 2D images all cutouts are fitted at once
+	(see beadPos.fitgaussianBatch).
+	maxbeads limits the number of candidates that are localized (the strongest ones)
+	callback is called with the progress in percent (0-100), see stackProcessing.report
+
+	Returns a structured array (see CANDIDATE), sorted by score, localized beads (status 'ok') first.
+	"""
+	if isinstance(img, str):
+		stackProcessing.report(callback, 0)
+		mipimg = stackProcessing.projectStack(
+			img, stats=('max',), callback=stackProcessing.subProgress(callback, 0, 40))
+		if isinstance(mipimg, str):
+			raise IOError(mipimg)
+		mipimg = mipimg['max']
+		img = beadPos.loadImage(img)
+	elif img.ndim == 2:
+		mipimg = img
+	else:
+		mipimg = np.amax(img, axis=-3)
+	if img.ndim not in [2, 3] or mipimg.ndim != 2:
+		raise ValueError("I can only handle single channel image stacks (z,y,x) or 2D images, not {0}".format(img.shape))
+	stackProcessing.report(callback, 40)
+	x, y, scale, score = findBlobs(mipimg, sigmas, binning, threshold)
+	stackProcessing.report(callback, 70)
+	keep = suppress(x, y, score, 2*max(sigmas) if mindistance is None else mindistance)
+	x, y, scale, score = x[keep], y[keep], scale[keep], score[keep]
+	if maxbeads is not None:
+		x, y, scale, score = x[:maxbeads], y[:maxbeads], scale[:maxbeads], score[:maxbeads]
+	if debug is True: print clrmsg.DEBUG + '{0} bead candidates'.format(len(x))
+	if img.ndim == 2:
+		beads = beadPos.getxyBatch(np.array([x, y]).T, img, method=method, cutout=cutout)
+	else:
+		beads = beadPos.getzBatch(np.array([x, y]).T, img, method=method, optimize=True, cutout=cutout, fast=True)
+	stackProcessing.report(callback, 100)
+	candidates = np.zeros(len(beads), dtype=CANDIDATE)
+	for field in beads.dtype.names:
+		candidates[field] = beads[field]
+	candidates['scale'], candidates['score'] = scale, score
+	## candidates next to a bead can converge onto it in the localization, only the strongest one is kept
+	ok = np.flatnonzero(candidates['status'] == 'ok')
+	keep = np.ones(len(candidates), dtype=bool)
+	keep[ok] = False
+	keep[ok[suppress(candidates['x'][ok], candidates['y'][ok], score[ok], 1)]] = True
+	candidates = candidates[keep]
+	## stable sort keeps the score order within ok and failed candidates
+	return candidates[np.argsort(candidates['status'] != 'ok', kind='mergesort')]
+
+
+def findBlobs(img,sigmas=(1, 1.5, 2, 3, 4),binning=2,threshold=5):
+	"""Multiscale LoG blob search in a 2D image, coarse to fine
+	The scale space (scale normalized LoG) of the binned image is searched for local maxima above threshold. Every
+	maximum is refined at full resolution to the strongest response of all scales within its binned pixel, which
+	selects the scale as well (the LoG of the smallest scales is inaccurate on the binned image). The blob has to
+	exceed threshold at full resolution as well.
+	Returns the arrays x, y (full resolution pixel), scale (sigma) and score of the blobs, sorted by score."""
+	img = np.asarray(img, dtype=np.float64)
+	sigmas = np.asarray(sigmas, dtype=np.float64)
+	binning = max(int(binning), 1)
+	coarse = binImage(img, binning)
+	## bright blobs give positive responses, sigma^2 normalizes the response across the scales
+	response = np.array([-(s/binning)**2*ndimage.gaussian_laplace(coarse, s/binning) for s in sigmas])
+	score = response/noiseLevel(response)[:, np.newaxis, np.newaxis]
+	## the scale is selected by the normalized response, the noise level differs between the scales
+	peaks = (response == ndimage.maximum_filter(response, size=3, mode='nearest')) & (score > threshold)
+	yb, xb = np.nonzero(peaks.any(axis=0))
+	if len(yb) == 0:
+		return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0), np.zeros(0)
+	if binning > 1:
+		response = np.array([-s**2*ndimage.gaussian_laplace(img, s) for s in sigmas], dtype=np.float32)
+		score = response/noiseLevel(response)[:, np.newaxis, np.newaxis]
+	## full resolution pixels of every binned pixel: (blobs, binning*binning)
+	offsets = np.arange(binning)
+	yy, xx = np.broadcast_arrays(
+		yb[:, np.newaxis, np.newaxis]*binning+offsets[:, np.newaxis], xb[:, np.newaxis, np.newaxis]*binning+offsets)
+	yy, xx = yy.reshape(len(yb), -1), xx.reshape(len(yb), -1)
+	## strongest response over scales and pixels
+	best = response[:, yy, xx].transpose(1, 0, 2).reshape(len(yb), -1).argmax(axis=1)
+	s, k = best//yy.shape[1], best % yy.shape[1]
+	idx = np.arange(len(yb))
+	x, y = xx[idx, k], yy[idx, k]
+	best = score[s, y, x].astype(np.float64)
+	order = np.argsort(-best, kind='mergesort')
+	order = order[best[order] > threshold]
+	return x[order], y[order], sigmas[s[order]], best[order]
+
+
+def binImage(img,binning):
+	"""Mean of binning x binning pixel blocks, the image is cropped to a multiple of binning"""
+	if binning == 1:
+		return img
+	rows, cols = img.shape[0]//binning, img.shape[1]//binning
+	return img[:rows*binning, :cols*binning].reshape(rows, binning, cols, binning).mean(axis=(1, 3))
+
+
+def noiseLevel(response):
+	"""Robust standard deviation (1.4826 * median absolute deviation) of every layer of a stack of responses"""
+	flat = response.reshape(len(response), -1)
+	mad = np.median(np.abs(flat-np.median(flat, axis=1)[:, np.newaxis]), axis=1)*1.4826
+	return np.where(mad > 0, mad, 1)
+
+
+def suppress(x,y,score,mindistance):
+	"""Indices of the blobs that have no stronger blob within mindistance, in the order of the given blobs"""
+	if len(x) == 0:
+		return np.zeros(0, dtype=int)
+	pairs = cKDTree(np.array([x, y], dtype=np.float64).T).query_pairs(mindistance)
+	neighbours = dict((i, []) for i in range(len(x)))
+	for i, j in pairs:
+		neighbours[i].append(j)
+		neighbours[j].append(i)
+	dropped = np.zeros(len(x), dtype=bool)
+	for i in np.argsort(-np.asarray(score), kind='mergesort'):
+		if not dropped[i]:
+			dropped[neighbours[i]] = True
+	keep = np.flatnonzero(~dropped)
+	return keep[np.argsort(-np.asarray(score)[keep], kind='mergesort')]
@@ -5,6 +5,10 @@ Get z axis position of spherical markers from 3D image stacks (tiff z-stack)
 import beadPos.py and call z = beadPos.getz(x,y,img,n=None,optimize=False) to get z position
 at the given x and y pixel coordinate or call x,y,z = beadPos.getz(x,y,img,n=None,optimize=True)
 to get an optimized bead position (optimization of x, y and z)
+For many beads call beads = beadPos.getzBatch(positions,img,method='poly') with an array of x,y positions
+(method='radial' with optimize=True refines x,y non-iteratively by radial symmetry),
+which returns a structured array with x, y, z and the status of every bead. With method='gauss' and
+optimize=True the beads are localized by joint 3D Gaussian fits, which also return widths and uncertainties.
 
 # @Title			: beadPos
 # @Project			: 3DCTv2
@@ -27,7 +31,6 @@ to get an optimized bead position (optimization of x, y and z)
 """
 # ======================================================================================================================
 
-import time
 import math
 import numpy as np
 from scipy.optimize import curve_fit, leastsq
@@ -44,6 +47,16 @@ except:
 repeat = 0
 debug = TDCT_debug.debug
 
+## Result record of getzBatch, one per bead. Widths (sigma) and standard errors are only set by the 3D Gaussian fit.
+BEAD = np.dtype([
+	('x', np.float64), ('y', np.float64), ('z', np.float64), ('amplitude', np.float64),
+	('sigma_x', np.float64), ('sigma_y', np.float64), ('sigma_z', np.float64),
+	('err_x', np.float64), ('err_y', np.float64), ('err_z', np.float64), ('status', 'S8')])
+## Bead status: localized, x,y outside of the image, no peak to fit (e.g. low SNR), fit failed or z out of range
+STATUS = ('ok', 'outside', 'lowsnr', 'failed')
+## Coordinate grids of the 2D Gaussian fits, keyed by cutout shape (see gaussianGrid)
+_grids = {}
+
 
 def getzPoly(x,y,img,n=None,optimize=False):
 	"""x and y are coordinates
@@ -53,11 +66,7 @@ def getzPoly(x,y,img,n=None,optimize=False):
 	If optimize is set to True, the algorithm will try to optimize the x,y,z position
 	!! if optimize is True, 3 values are returned: x,y,z"""
 
-	if not isinstance(img, str) and not isinstance(img, np.ndarray):
-		if clrmsg and debug is True: print clrmsg.ERROR
-		raise TypeError('I can only handle an image path as string or an image volume as numpy.ndarray imported from tifffile.py')
-	elif isinstance(img, str):
-		img = tf.imread(img)
+	img = loadImage(img)
 
 	data_z = img[:,y,x]
 
@@ -91,51 +100,306 @@ def getzPoly(x,y,img,n=None,optimize=False):
 		return data_z_xp_poly
 
 
-def getzGauss(x,y,img,parent=None,optimize=False,threshold=None,threshVal=0.6,cutout=15):
+def getzGauss(x,y,img,parent=None,optimize=False,threshold=None,threshVal=0.6,cutout=15,fast=False,zcutout=None):
 	"""x and y are coordinates
 	img is the path to the z-stack tiff file or a numpy.ndarray from tifffile.py imread function
-	optimize == True kicks off the 2D Gaussian fit and this function will return x,y,z
-	threshold == True filters the image where it cuts off at max - min * threshVal (threshVal between 0.1 and 1)
-	cutout specifies the FOV for the 2D Gaussian fit"""
+	optimize == True kicks off the joint 3D Gaussian fit (see localizeGauss3D) and this function will return x,y,z
+	threshold == True starts the fit from the voxels above max - (max - min) * threshVal (threshVal between 0.1 and 1)
+	cutout specifies the FOV (half size of the sub-volume) for the 3D Gaussian fit, zcutout its half size in z
+	(default derived from the width of the z-fit, see zCutout)
+	fast == True uses the closed-form Gaussian z-fit (see gaussfitBatch) instead of curve_fit"""
 
-	if not isinstance(img, str) and not isinstance(img, np.ndarray):
-		if clrmsg and debug is True: print clrmsg.ERROR
-		raise TypeError('I can only handle an image path as string or an image volume as numpy.ndarray imported from tifffile.py')
-	elif isinstance(img, str):
-		img = tf.imread(img)
+	img = loadImage(img)
 
         x = np.round(x).astype(int)
         y = np.round(y).astype(int)
 	data_z = img[:,y,x]
 	data = np.array([np.arange(len(data_z)), data_z])
-	poptZ, pcov = gaussfit(data,parent)
+	poptZ, pcov = gaussfit(data,parent,fast=fast)
 
 	if optimize is False:
 		return poptZ[1]
 	else:
-		repeats = 5
-		if clrmsg and debug is True: print clrmsg.DEBUG + '2D Gaussian xy optimization running %.f at z = %.f' % (repeats,round(poptZ[1]))
-		for repeat in range(repeats):
-			data = np.copy(img[
-						round(poptZ[1]),
-						y-cutout:y+cutout,
-						x-cutout:x+cutout])
-			if threshold is not None:
-				threshold = data < data.max()-(data.max()-data.min())*threshVal
-				data[threshold] = 0
-			poptXY = fitgaussian(data,parent)
-			if poptXY is None:
-				return x, y, poptZ[1]
-			(height, xopt, yopt, width_x, width_y) = poptXY
-			## x and y are switched when applying the offset
-			x = x-cutout+yopt
-			y = y-cutout+xopt
-			data_z = img[:,y,x]
-			data = np.array([np.arange(len(data_z)), data_z])
-			poptZ, pcov = gaussfit(data,parent,hold=True)
-			if parent: parent.refreshUI()
-			time.sleep(0.01)
-		return x, y, poptZ[1]
+		if clrmsg and debug is True: print clrmsg.DEBUG + '3D Gaussian optimization at z = %.f' % round(poptZ[1])
+		p, perr, ok = localizeGauss3D(
+			[x],[y],[poptZ[1]],img,threshold=threshold,threshVal=threshVal,cutout=cutout,
+			zcutout=zCutout([poptZ[2]],cutout) if zcutout is None else zcutout)
+		if not ok[0]:
+			if parent is not None:
+				parent.widget_matplotlib.matshowPlot(
+					mat=img[int(round(poptZ[1])), y-cutout:y+cutout, x-cutout:x+cutout],contour=np.ones((2*cutout, 2*cutout)),
+					labelContour="XYZ optimization failed\n" +
+					"Try reducing the\nmarker size (equates to\nFOV for gaussian fit)")
+			return x, y, poptZ[1]
+		if parent is not None:
+			plotGauss3D(parent,img,p[0],cutout)
+		return p[0, 1], p[0, 2], p[0, 3]
+
+
+def getzBatch(
+		positions,img,method='poly',n=None,optimize=False,parent=None,threshold=None,threshVal=0.6,cutout=15,fast=False,
+		zcutout=None):
+	"""Localize many beads in one call
+	positions is an array of x,y coordinates with the shape (beads, 2)
+	img is the path to the z-stack tiff file or a numpy.ndarray from tifffile.py imread function (read once)
+	method is 'poly' (parabolic fit as in getzPoly), 'gauss' (Gaussian fit as in getzGauss) or 'radial' (parabolic fit,
+	optimize == True refines x,y non-iteratively with the radial symmetry center, see localizeRadial)
+	n, optimize, parent, threshold, threshVal, cutout and fast are passed on as in getzPoly/getzGauss
+	with fast == True the Gaussian z-fits of all beads are done at once (see gaussfitBatch)
+	with method 'gauss' and optimize == True all beads are localized by joint 3D Gaussian fits (see localizeGauss3D),
+	which also fill in the widths and the standard errors of the positions. The fits are only drawn (parent) for a
+	single bead.
+	zcutout is the half size of their sub-volumes in z, by default derived from the widths of the z-fits (see zCutout).
+
+	The z profiles of all beads are extracted in one fancy-indexing gather and the parabolic fits are solved for
+	all beads at once (see polyfitPeaks). Returns a structured array (see BEAD) with x, y (refined if optimize is
+	True), z, the peak amplitude and the status (see STATUS) of every bead. z is nan if the status is not 'ok'."""
+	if method not in ['poly', 'gauss', 'radial']:
+		raise ValueError("Unknown method '{0}' ('poly', 'gauss', 'radial')".format(method))
+	img = loadImage(img)
+	positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+	beads = np.zeros(len(positions), dtype=BEAD)
+	beads['x'], beads['y'] = positions[:, 0], positions[:, 1]
+	for field in ['z', 'amplitude', 'sigma_x', 'sigma_y', 'sigma_z', 'err_x', 'err_y', 'err_z']:
+		beads[field] = np.nan
+	beads['status'] = 'ok'
+	xi = np.round(positions[:, 0]).astype(int)
+	yi = np.round(positions[:, 1]).astype(int)
+	inside = (xi >= 0) & (xi < img.shape[-1]) & (yi >= 0) & (yi < img.shape[-2])
+	beads['status'][~inside] = 'outside'
+	idx = np.flatnonzero(inside)
+	## only draw the fits of a single bead
+	if len(positions) != 1:
+		parent = None
+	## widths of the Gaussian z-fits
+	zwidth = np.full(len(positions), np.nan)
+	## z profiles of all beads in one gather: (beads, z)
+	profiles = img[:, yi[idx], xi[idx]].T
+	if method in ['poly', 'radial']:
+		z, amplitude, ok = polyfitPeaks(profiles, n)
+		beads['z'][idx], beads['amplitude'][idx] = z, amplitude
+		beads['status'][idx[~ok]] = 'lowsnr'
+	elif fast is True:
+		popt, pcov, ok = gaussfitBatch(profiles-profiles.min(axis=1)[:, np.newaxis])
+		beads['amplitude'][idx], beads['z'][idx], zwidth[idx] = popt[:, 0], popt[:, 1], popt[:, 2]
+		beads['status'][idx[~ok]] = 'lowsnr'
+	else:
+		for i, data_z in zip(idx, profiles):
+			if data_z.max() == data_z.min():
+				beads['status'][i] = 'lowsnr'
+				continue
+			try:
+				poptZ, pcov = gaussfit(np.array([np.arange(len(data_z)), data_z], dtype=np.float64), parent)
+			except RuntimeError:
+				## curve_fit did not converge
+				beads['status'][i] = 'failed'
+				continue
+			beads['amplitude'][i], beads['z'][i], zwidth[i] = poptZ[0], poptZ[1], poptZ[2]
+	if optimize is True and method == 'gauss':
+		i = idx[beads['status'][idx] == 'ok']
+		p, perr, ok = localizeGauss3D(
+			xi[i],yi[i],beads['z'][i],img,threshold=threshold,threshVal=threshVal,cutout=cutout,
+			zcutout=zCutout(zwidth[i],cutout) if zcutout is None else zcutout)
+		beads['status'][i[~ok]] = 'failed'
+		## failed beads keep their position
+		i, p, perr = i[ok], p[ok], perr[ok]
+		beads['x'][i], beads['y'][i], beads['z'][i], beads['amplitude'][i] = p[:, 1], p[:, 2], p[:, 3], p[:, 0]
+		for field, column in [('sigma_x', 4), ('sigma_y', 5), ('sigma_z', 6)]:
+			beads[field][i] = p[:, column]
+		for field, column in [('err_x', 1), ('err_y', 2), ('err_z', 3)]:
+			beads[field][i] = perr[:, column]
+		if parent is not None and len(ok) == 1 and ok[0]:
+			plotGauss3D(parent,img,p[0],cutout)
+	elif optimize is True and method == 'radial':
+		i = idx[beads['status'][idx] == 'ok']
+		x, y, z, amplitude, ok = localizeRadial(xi[i],yi[i],beads['z'][i],img,cutout=cutout,n=n)
+		beads['status'][i[~ok]] = 'failed'
+		i = i[ok]
+		beads['x'][i], beads['y'][i], beads['z'][i], beads['amplitude'][i] = x[ok], y[ok], z[ok], amplitude[ok]
+	elif optimize is True:
+		for i in idx[beads['status'][idx] == 'ok']:
+			try:
+				x_opt_vals, y_opt_vals, z_opt_vals = optimize_z(xi[i],yi[i],beads['z'][i],img,n=None)
+				x, y, z = x_opt_vals[-1], y_opt_vals[-1], z_opt_vals[-1]
+			except Exception as e:
+				if clrmsg and debug is True: print clrmsg.ERROR, 'Bead {0}: {1}'.format(i, e)
+				z = 'failed'
+			if z == 'failed':
+				beads['status'][i] = 'failed'
+			else:
+				beads['x'][i], beads['y'][i], beads['z'][i] = x, y, z
+	## z has to be inside the stack
+	beads['status'][(beads['status'] == 'ok') & ~((beads['z'] >= 0) & (beads['z'] <= img.shape[-3]-1))] = 'failed'
+	for field in ['z', 'sigma_x', 'sigma_y', 'sigma_z', 'err_x', 'err_y', 'err_z']:
+		beads[field][beads['status'] != 'ok'] = np.nan
+	return beads
+
+
+def getxyBatch(positions,img,method='gauss',cutout=15,parent=None):
+	"""Localize many beads in x,y in a 2D image (e.g. a SEM/FIB image or a MIP) in one call
+	positions is an array of x,y coordinates with the shape (beads, 2)
+	img is a 2D numpy.ndarray (y,x)
+	method is 'gauss' (2D Gaussian fits of all cutouts at once, see fitgaussianBatch) or 'radial' (radial symmetry
+	center, see radialCenterBatch)
+	cutout specifies the FOV (half size) of the cutouts. The cutout minimum is subtracted as background for the
+	Gaussian fits. A single bead is fitted with fitgaussian and the fit is drawn (parent).
+
+	Returns a structured array (see BEAD) with the refined x, y, the peak amplitude, the widths ('gauss') and the
+	status (see STATUS) of every bead. z is always nan, failed beads keep their position."""
+	if method not in ['gauss', 'radial']:
+		raise ValueError("Unknown method '{0}' ('gauss', 'radial')".format(method))
+	img = np.asarray(img)
+	if img.ndim != 2:
+		raise ValueError("I can only handle 2D images (y,x), not {0}".format(img.shape))
+	positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+	beads = np.zeros(len(positions), dtype=BEAD)
+	beads['x'], beads['y'] = positions[:, 0], positions[:, 1]
+	for field in ['z', 'amplitude', 'sigma_x', 'sigma_y', 'sigma_z', 'err_x', 'err_y', 'err_z']:
+		beads[field] = np.nan
+	beads['status'] = 'ok'
+	xi = np.round(positions[:, 0]).astype(int)
+	yi = np.round(positions[:, 1]).astype(int)
+	inside = (xi >= 0) & (xi < img.shape[1]) & (yi >= 0) & (yi < img.shape[0])
+	beads['status'][~inside] = 'outside'
+	## the cutout has to fit into the image
+	full = (xi-cutout >= 0) & (xi+cutout <= img.shape[1]) & (yi-cutout >= 0) & (yi+cutout <= img.shape[0])
+	beads['status'][inside & ~full] = 'failed'
+	idx = np.flatnonzero(full)
+	if len(idx) == 0:
+		return beads
+	offsets = np.arange(-cutout, cutout)
+	## cutouts of all beads: (beads, 2*cutout, 2*cutout)
+	data = img[yi[idx, np.newaxis, np.newaxis]+offsets[:, np.newaxis], xi[idx, np.newaxis, np.newaxis]+offsets]
+	data = data.astype(np.float64)
+	if method == 'radial':
+		cx, cy, ok = radialCenterBatch(data)
+		amplitude = data.max(axis=(1, 2))
+		width_x = width_y = np.full(len(idx), np.nan)
+	else:
+		data -= data.min(axis=(1, 2))[:, np.newaxis, np.newaxis]
+		if parent is not None and len(positions) == 1:
+			p = fitgaussian(data[0], parent)
+			ok = np.array([p is not None])
+			p = np.full((1, 5), np.nan) if p is None else p[np.newaxis]
+		else:
+			p, ok = fitgaussianBatch(data)
+		## the Gaussian x is the row and y the column
+		amplitude, cy, cx, width_y, width_x = p.T
+		width_x, width_y = np.abs(width_x), np.abs(width_y)
+	## the center has to be inside of the cutout
+	with np.errstate(invalid='ignore'):
+		ok &= (cx >= 0) & (cx <= 2*cutout-1) & (cy >= 0) & (cy <= 2*cutout-1)
+	beads['status'][idx[~ok]] = 'failed'
+	i = idx[ok]
+	beads['x'][i], beads['y'][i], beads['amplitude'][i] = xi[i]-cutout+cx[ok], yi[i]-cutout+cy[ok], amplitude[ok]
+	beads['sigma_x'][i], beads['sigma_y'][i] = width_x[ok], width_y[ok]
+	return beads
+
+
+def radialCenterBatch(data):
+	"""Radial symmetry center of a stack of equally sized cutouts (cutouts, rows, columns), non-iterative
+	(Parthasarathy, Nat. Methods 9, 2012)
+
+	The intensity gradients between the pixels (Roberts cross) of a radially symmetric spot point to its center.
+	The gradients are smoothed (3x3 box) and the center is the point with the least squares distance to all gradient
+	lines, weighted by the squared gradient magnitude and the inverse distance to the gradient centroid. This is one
+	2x2 linear system per cutout. Returns x (column) and y (row) of the centers in cutout coordinates and a boolean
+	array that is False where the cutout has no gradients (e.g. a flat cutout)."""
+	data = np.asarray(data, dtype=np.float64)
+	## gradients at the pixel corners, midpoints between 2x2 pixels
+	gx = (data[:, :-1, 1:]+data[:, 1:, 1:]-data[:, :-1, :-1]-data[:, 1:, :-1])/2
+	gy = (data[:, 1:, :-1]+data[:, 1:, 1:]-data[:, :-1, :-1]-data[:, :-1, 1:])/2
+	rows, cols = gx.shape[1:]
+	smooth = []
+	for g in [gx, gy]:
+		g = np.pad(g, [(0, 0), (1, 1), (1, 1)], mode='constant')
+		smooth.append(sum(g[:, i:i+rows, j:j+cols] for i in range(3) for j in range(3))/9)
+	gx, gy = smooth
+	Y, X = gaussianGrid((rows, cols))+0.5
+	magnitude = gx**2+gy**2
+	total = magnitude.sum(axis=(1, 2))
+	ok = total > 0
+	total[~ok] = 1
+	cx = (magnitude*X).sum(axis=(1, 2))/total
+	cy = (magnitude*Y).sum(axis=(1, 2))/total
+	distance = np.sqrt((X-cx[:, np.newaxis, np.newaxis])**2+(Y-cy[:, np.newaxis, np.newaxis])**2)
+	## w*(I-d*d.T) of the unit gradient directions d with the weights w = |g|^2/distance
+	w = 1/np.maximum(distance, 1e-3)
+	axx, ayy, axy = (gy**2)*w, (gx**2)*w, -gx*gy*w
+	A = np.array([[axx.sum(axis=(1, 2)), axy.sum(axis=(1, 2))], [axy.sum(axis=(1, 2)), ayy.sum(axis=(1, 2))]])
+	b = np.array([(axx*X+axy*Y).sum(axis=(1, 2)), (axy*X+ayy*Y).sum(axis=(1, 2))])
+	det = A[0, 0]*A[1, 1]-A[0, 1]**2
+	ok &= det > 1e-12*(A[0, 0]+A[1, 1])**2
+	det[~ok] = 1
+	x = (A[1, 1]*b[0]-A[0, 1]*b[1])/det
+	y = (A[0, 0]*b[1]-A[0, 1]*b[0])/det
+	x[~ok], y[~ok] = np.nan, np.nan
+	## pixel centers are at integer positions
+	return x, y, ok
+
+
+def localizeRadial(x,y,z,img,cutout=15,n=None):
+	"""Localize beads with the radial symmetry center in x,y (see radialCenterBatch) and the parabolic fit of the z
+	profile (see polyfitPeaks), all beads at once
+	x, y and z are arrays with the start positions of the beads (z e.g. from the parabolic z-fit)
+	img is the image volume as numpy.ndarray
+	cutout specifies the FOV (half size) of the xy cutouts, taken in the slice of z
+	n is passed on to polyfitPeaks
+
+	Returns the arrays x, y, z, the peak amplitude and a boolean array that is False where the cutout left the image,
+	the cutout had no gradients, the center is outside of the cutout or the z profile at the new position has no
+	peak."""
+	xi, yi = np.round(np.asarray(x, dtype=np.float64)).astype(int), np.round(np.asarray(y, dtype=np.float64)).astype(int)
+	zi = np.round(np.asarray(z, dtype=np.float64)).astype(int)
+	x, y = np.full(len(xi), np.nan), np.full(len(xi), np.nan)
+	z, amplitude = np.full(len(xi), np.nan), np.full(len(xi), np.nan)
+	ok = (
+		(xi-cutout >= 0) & (xi+cutout <= img.shape[-1]) & (yi-cutout >= 0) & (yi+cutout <= img.shape[-2]) &
+		(zi >= 0) & (zi < img.shape[-3]))
+	i = np.flatnonzero(ok)
+	offsets = np.arange(-cutout, cutout)
+	## xy cutouts of all beads: (beads, 2*cutout, 2*cutout)
+	data = img[
+		zi[i, np.newaxis, np.newaxis], yi[i, np.newaxis, np.newaxis]+offsets[:, np.newaxis],
+		xi[i, np.newaxis, np.newaxis]+offsets]
+	cx, cy, found = radialCenterBatch(data)
+	x[i], y[i] = xi[i]-cutout+cx, yi[i]-cutout+cy
+	## nearly parallel gradients (e.g. an intensity ramp without a bead) put the center far outside of the cutout
+	with np.errstate(invalid='ignore'):
+		found &= (cx >= 0) & (cx <= 2*cutout-1) & (cy >= 0) & (cy <= 2*cutout-1)
+	ok[i[~found]] = False
+	i = i[found]
+	## z profiles at the closest pixel
+	profiles = img[:, np.round(y[i]).astype(int), np.round(x[i]).astype(int)].T
+	z[i], amplitude[i], found = polyfitPeaks(profiles, n)
+	ok[i[~found]] = False
+	return x, y, z, amplitude, ok
+
+
+def polyfitPeaks(profiles,n=None):
+	"""Parabolic peak fit (see parabolic.parabolic_polyfit) of many profiles at once
+	profiles is an array with the shape (profiles, samples)
+	n is the number of points around the max value that are used in the polyfit, one for all or one per profile
+	leave n to use the maximum amount of points per profile (see getn)
+
+	Profiles are grouped by the size of their fit window and every group is fitted with one matrix multiply (see
+	parabolic.parabolic_polyfit_batch). Returns the peak positions, the peak values and a boolean array that is
+	False where there was no peak to fit (window outside of the profile, less than 3 samples or no maximum)."""
+	profiles = np.asarray(profiles, dtype=np.float64)
+	if n is None:
+		n = getn(profiles)
+	zv, yv = parabolic.parabolic_polyfit_batch(profiles, np.argmax(profiles, axis=1), n)
+	return zv, yv, ~np.isnan(zv)
+
+
+def loadImage(img):
+	"""Return the image volume of img, given as path to the z-stack tiff file or as numpy.ndarray"""
+	if not isinstance(img, str) and not isinstance(img, np.ndarray):
+		if clrmsg and debug is True: print clrmsg.ERROR
+		raise TypeError('I can only handle an image path as string or an image volume as numpy.ndarray imported from tifffile.py')
+	elif isinstance(img, str):
+		img = tf.imread(img)
+	return img
 
 
 def optimize_z(x,y,z,image,n=None):
@@ -174,105 +438,61 @@ def optimize_z(x,y,z,image,n=None):
 
 def getn(data):
 	"""this function is used to determine the maximum amount of data points for the polyfit function
-	data is a numpy array of values"""
-
-	if len(data)-np.argmax(data) <= np.argmax(data):
-		n = 2*(len(data)-np.argmax(data))-1
-	else:
-		n = 2*np.argmax(data)
-	return n
+	data is a numpy array of values or an array of profiles (profiles, values) to get n for every profile"""
+	data = np.asarray(data)
+	peak = np.argmax(data, axis=-1)
+	n = np.where(data.shape[-1]-peak <= peak, 2*(data.shape[-1]-peak)-1, 2*peak)
+	return int(n) if n.ndim == 0 else n
 
 
 def optimize_xy(x,y,z,image,nx=None,ny=None):
 	"""x and y are coordinates, z is the layer in the z-stack tiff file
 	image can be either the path to the z-stack tiff file or the np.array data of itself
 	n is the number of points around the max value that are used in the polyfit
-	leave n to use the maximum amount of points"""
-	get_nx, get_ny = False, False
+	leave n to use the maximum amount of points
+
+	The peak is fitted in 20 pixel long x profiles in the rows 0-9 pixels above and below the bead and in y
+	profiles in the columns 0-9 pixels left and right of it. All 40 profiles are gathered at once, each of the
+	four directions stops at the first profile without a clear peak (max < 1.1 * mean). The remaining profiles are
+	fitted in one batch (see polyfitPeaks), profiles without a maximum are ignored. Beads closer than 10 pixels to
+	the image border raise an IndexError."""
 	if type(image) == str:
 		img = tf.imread(image)
 	elif type(image) == np.ndarray:
 		img = image
 	## amount of data points around coordinate
 	samplewidth = 10
-	data_x = img[z,y,x-samplewidth:x+samplewidth]
-	data_y = img[z,y-samplewidth:y+samplewidth,x]
-
-	if debug is True: f, axarr = plt.subplots(2, sharex=True)
-
-	if nx is None:
-		get_nx = True
-	if ny is None:
-		get_ny = True
-
-	## optimize x
-	xmaxvals = np.array([], dtype=np.int32)
-	for offset in range(10):
-		data_x = img[z,y-offset,x-samplewidth:x+samplewidth]
-		if data_x.max() < data_x.mean()*1.1:
-			# print "breaking at ",offset
-			# print data_x.max(), data_x.mean(), data_x.mean()*1.1
-			break
-		if get_nx is True:
-			nx = getn(data_x)
-		data_x_xp_poly, data_x_yp_poly = parabolic.parabolic_polyfit(data_x, np.argmax(data_x), nx)
-		xmaxvals = np.append(xmaxvals,[data_x_xp_poly])
-		c = np.random.rand(3,1)
-		if debug is True:
-			axarr[0].plot(range(0,len(data_x)), data_x, color=c)
-			axarr[0].plot(data_x_xp_poly, data_x_yp_poly, 'o', color=c)
-	for offset in range(10):
-		data_x = img[z,y+offset,x-samplewidth:x+samplewidth]
-		if data_x.max() < data_x.mean()*1.1:
-			# print "breaking at ",offset
-			# print data_x.max(), data_x.mean(), data_x.mean()*1.1
-			break
-		if get_nx is True:
-			nx = getn(data_x)
-		data_x_xp_poly, data_x_yp_poly = parabolic.parabolic_polyfit(data_x, np.argmax(data_x), nx)
-		xmaxvals = np.append(xmaxvals,[data_x_xp_poly])
-		c = np.random.rand(3,1)
-		if debug is True:
-			axarr[0].plot(range(0,len(data_x)), data_x, color=c)
-			axarr[0].plot(data_x_xp_poly, data_x_yp_poly, 'o', color=c)
-
-	if debug is True: axarr[0].set_title("mid-mean: "+str(xmaxvals.mean()))
-
-	## optimize y
-	ymaxvals = np.array([], dtype=np.int32)
-	for offset in range(10):
-		data_y = img[z,y-samplewidth:y+samplewidth,x-offset]
-		if data_y.max() < data_y.mean()*1.1:
-			# print "breaking at ",offset
-			# print data_y.max(), data_y.mean(), data_y.mean()*1.1
-			break
-		if get_ny is True:
-			ny = getn(data_y)
-		data_y_xp_poly, data_y_yp_poly = parabolic.parabolic_polyfit(data_y, np.argmax(data_y), ny)
-		ymaxvals = np.append(ymaxvals,[data_y_xp_poly])
-		c = np.random.rand(3,1)
-		if debug is True:
-			axarr[1].plot(range(0,len(data_y)), data_y, color=c)
-			axarr[1].plot(data_y_xp_poly, data_y_yp_poly, 'o', color=c)
-
-	for offset in range(10):
-		data_y = img[z,y-samplewidth:y+samplewidth,x+offset]
-		if data_y.max() < data_y.mean()*1.1:
-			# print "breaking at ",offset
-			# print data_y.max(), data_y.mean(), data_y.mean()*1.1
-			break
-		if get_ny is True:
-			ny = getn(data_y)
-		data_y_xp_poly, data_y_yp_poly = parabolic.parabolic_polyfit(data_y, np.argmax(data_y), ny)
-		ymaxvals = np.append(ymaxvals,[data_y_xp_poly])
-		c = np.random.rand(3,1)
-		if debug is True:
-			axarr[1].plot(range(0,len(data_y)), data_y, color=c)
-			axarr[1].plot(data_y_xp_poly, data_y_yp_poly, 'o', color=c)
-
-	if debug is True: axarr[1].set_title("mid-mean: "+str(ymaxvals.mean()))
+	if x < samplewidth or x+samplewidth > img.shape[-1] or y < samplewidth or y+samplewidth > img.shape[-2]:
+		raise IndexError("Bead at x={0}, y={1} too close to the image border".format(x, y))
+	span = np.arange(-samplewidth, samplewidth)
+	offsets = np.arange(10)
+	## rows above, rows below, columns left, columns right of the bead
+	rows = np.concatenate([y-offsets, y+offsets])
+	cols = np.concatenate([x-offsets, x+offsets])
+	profiles = np.concatenate([
+		img[z, rows[:, np.newaxis], x+span],
+		img[z, y+span, cols[:, np.newaxis]]]).astype(np.float64)
+	## SNR mask, every direction ends at its first profile without a clear peak
+	snr = profiles.max(axis=1) >= profiles.mean(axis=1)*1.1
+	keep = np.cumprod(snr.reshape(4, 10), axis=1).astype(bool).ravel()
+
+	n = getn(profiles)
+	if nx is not None:
+		n[:20] = nx
+	if ny is not None:
+		n[20:] = ny
+	maxvals, peakvals, ok = polyfitPeaks(profiles, n)
+	xmaxvals = maxvals[:20][keep[:20] & ok[:20]]
+	ymaxvals = maxvals[20:][keep[20:] & ok[20:]]
 
 	if debug is True:
+		f, axarr = plt.subplots(2, sharex=True)
+		for i in np.flatnonzero(keep & ok):
+			c = np.random.rand(3,1)
+			axarr[i//20].plot(range(0,len(profiles[i])), profiles[i], color=c)
+			axarr[i//20].plot(maxvals[i], peakvals[i], 'o', color=c)
+		axarr[0].set_title("mid-mean: "+str(xmaxvals.mean()))
+		axarr[1].set_title("mid-mean: "+str(ymaxvals.mean()))
 		plt.draw()
 		plt.pause(0.5)
 		plt.close()
@@ -292,11 +512,18 @@ def gauss(x, *p):
 	return A*np.exp(-(x-mu)**2/(2.*sigma**2))
 
 
-def gaussfit(data,parent=None,hold=False):
+def gaussfit(data,parent=None,hold=False,fast=False):
 	## Fitting gaussian to data
+	## fast == True uses the closed-form estimator (see gaussfitBatch) instead of curve_fit
 	data[1] = data[1]-data[1].min()
-	p0 = [data[1].max(), data[1].argmax(), 1]
-	popt, pcov = curve_fit(gauss, data[0], data[1], p0=p0)
+	if fast is True:
+		popt, pcov, ok = gaussfitBatch(data[1][np.newaxis], x=data[0])
+		if not ok[0]:
+			raise RuntimeError('Gaussian fit failed: no peak in the data')
+		popt, pcov = popt[0], pcov[0]
+	else:
+		p0 = [data[1].max(), data[1].argmax(), 1]
+		popt, pcov = curve_fit(gauss, data[0], data[1], p0=p0)
 
 	if parent is not None:
 		## Draw graphs in GUI
@@ -328,6 +555,69 @@ def gaussfit(data,parent=None,hold=False):
 	return popt, pcov
 
 
+def gaussfitBatch(profiles,x=None,polish=True,threshold=0.1):
+	"""Non-iterative 1D Gaussian fit of many profiles at once
+	profiles is an array with the shape (profiles, samples), background subtracted (see gaussfit)
+	x are the sample positions (shared by all profiles), default 0, 1, 2, ...
+	polish == True refines the estimate with one Gauss-Newton step (analytic Jacobian), kept if it lowers the residual
+	threshold is the fraction of the maximum the samples around the peak have to exceed to be used in the log fit
+
+	The logarithm of a Gaussian is a parabola. It is fitted by weighted least squares with the squared intensities
+	as weights (Guo, IEEE Signal Process. Mag. 28, 2011) to the contiguous samples around the maximum that are above
+	threshold*max, so neither the background noise nor neighbouring beads enter the log fit.
+	Returns popt with the rows (A, mu, sigma) as in gauss, the covariance matrices of the (polished) fit and a
+	boolean array that is False where there was no peak to fit."""
+	y = np.asarray(profiles, dtype=np.float64)
+	x = np.arange(y.shape[1], dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+	## positions relative to the maximum for a well conditioned fit
+	peak = np.argmax(y, axis=1)
+	x0 = x[peak]
+	t = x-x0[:, np.newaxis]
+	## contiguous peak region above threshold
+	idx = np.arange(y.shape[1])
+	below = y <= threshold*y.max(axis=1)[:, np.newaxis]
+	left = np.where(below & (idx < peak[:, np.newaxis]), idx, -1).max(axis=1)
+	right = np.where(below & (idx > peak[:, np.newaxis]), idx, y.shape[1]).min(axis=1)
+	positive = (idx > left[:, np.newaxis]) & (idx < right[:, np.newaxis]) & (y > 0)
+	w = np.where(positive, y**2, 0)
+	logy = np.log(np.where(positive, y, 1))
+	powers = t[:, :, np.newaxis]**np.arange(5)*w[:, :, np.newaxis]
+	A = powers.sum(axis=1)[:, [[0, 1, 2], [1, 2, 3], [2, 3, 4]]]
+	F = (powers[:, :, :3]*logy[:, :, np.newaxis]).sum(axis=1)
+	ok = positive.sum(axis=1) >= 3
+	A[~ok] = np.eye(3)
+	a, b, c = np.linalg.solve(A, F[:, :, np.newaxis])[:, :, 0].T
+	ok &= c < 0
+	c[~ok] = -0.5
+	popt = np.array([np.exp(a-b**2/(4*c)), x0-b/(2*c), np.sqrt(-1/(2*c))]).T
+	popt[~ok] = np.nan
+
+	pcov = np.full((len(y), 3, 3), np.inf)
+	if not ok.any():
+		return popt, pcov, ok
+	y = y[ok]
+
+	def jacobian(popt):
+		height, mu, sigma = popt.T[:, :, np.newaxis]
+		d = x-mu
+		g = np.exp(-d**2/(2*sigma**2))
+		J = np.array([g, height*g*d/sigma**2, height*g*d**2/sigma**3]).transpose(1, 2, 0)
+		return J, y-height*g
+
+	J, res = jacobian(popt[ok])
+	if polish is True:
+		JTJ = np.einsum('pki,pkj->pij', J, J)
+		step = np.linalg.solve(JTJ, np.einsum('pki,pk->pi', J, res)[:, :, np.newaxis])[:, :, 0]
+		J_new, res_new = jacobian(popt[ok]+step)
+		better = (res_new**2).sum(axis=1) < (res**2).sum(axis=1)
+		popt[np.flatnonzero(ok)[better]] += step[better]
+		J[better], res[better] = J_new[better], res_new[better]
+	## covariance from the Jacobian, as in curve_fit
+	dof = max(y.shape[1]-3, 1)
+	pcov[ok] = np.linalg.inv(np.einsum('pki,pkj->pij', J, J))*((res**2).sum(axis=1)/dof)[:, np.newaxis, np.newaxis]
+	return popt, pcov, ok
+
+
 ## Gaussian 2D fit from http://scipy.github.io/old-wiki/pages/Cookbook/FittingData
 def gaussian(height, center_x, center_y, width_x, width_y):
 	"""Returns a Gaussian function with the given parameters"""
@@ -353,19 +643,45 @@ def moments(data):
 	return height, x, y, width_x, width_y
 
 
+def gaussianGrid(shape):
+	"""np.indices(shape) as float, computed once per shape"""
+	shape = tuple(shape)
+	if shape not in _grids:
+		_grids[shape] = np.indices(shape).astype(np.float64)
+	return _grids[shape]
+
+
+def gaussianJacobian(p, X, Y):
+	"""Partial derivatives of gaussian(*p)(X, Y) with respect to (height, x, y, width_x, width_y) and the function
+	values. p has the shape (5, ...) to evaluate many parameter sets at once, the derivatives are stacked in the
+	first axis."""
+	height, center_x, center_y, width_x, width_y = [np.asarray(v)[..., np.newaxis] for v in p]
+	dx, dy = X-center_x, Y-center_y
+	g = np.exp(-((dx/width_x)**2+(dy/width_y)**2)/2)
+	hg = height*g
+	return np.array([g, hg*dx/width_x**2, hg*dy/width_y**2, hg*dx**2/width_x**3, hg*dy**2/width_y**3]), hg
+
+
 def fitgaussian(data,parent=None):
 	"""Returns (height, x, y, width_x, width_y)
-	the Gaussian parameters of a 2D distribution found by a fit"""
+	the Gaussian parameters of a 2D distribution found by a fit
+	The coordinate grid is cached per cutout size (see gaussianGrid) and the Jacobian is analytic"""
+	X, Y = gaussianGrid(data.shape).reshape(2, -1)
+	values = np.ravel(data)
 
 	def errorfunction(p):
-		return np.ravel(gaussian(*p)(*np.indices(data.shape)) - data)
+		return gaussianJacobian(p, X, Y)[1] - values
+
+	def jacobian(p):
+		return gaussianJacobian(p, X, Y)[0]
 
 	params = moments(data)
-	p, success = leastsq(errorfunction, params)
+	p, success = leastsq(errorfunction, params, Dfun=jacobian, col_deriv=True)
 	if np.isnan(p).any():
-		parent.widget_matplotlib.matshowPlot(
-			mat=data,contour=np.ones(data.shape),labelContour="XY optimization failed\n" +
-			"Try reducing the\nmarker size (equates to\nFOV for gaussian fit)")
+		if parent is not None:
+			parent.widget_matplotlib.matshowPlot(
+				mat=data,contour=np.ones(data.shape),labelContour="XY optimization failed\n" +
+				"Try reducing the\nmarker size (equates to\nFOV for gaussian fit)")
 		return None
 	if parent is not None:
 		## Draw graphs in GUI
@@ -381,6 +697,202 @@ def fitgaussian(data,parent=None):
 	return p
 
 
+def levmarBatch(p,values,function,iterations=50,tol=1e-8,converged=None):
+	"""Levenberg-Marquardt least squares fit of many parameter sets at once
+	p are the start values with the shape (sets, parameters), values the data with the shape (sets, samples)
+	function(p) returns the Jacobian (parameters, sets, samples) and the model values (sets, samples) of p
+	converged marks sets that are not fitted (e.g. empty data)
+
+	Every iteration solves one small normal equation system per set (stacked) and the damping is adapted per set.
+	A set is converged once all parameter steps are smaller than tol (relative) or the damping could not find a
+	better step anymore; converged sets drop out of the iteration. Returns the fitted parameters, the Jacobian and
+	the residuals at the solution and a boolean array that is True where the fit converged."""
+	p = np.array(p, dtype=np.float64)
+	converged = np.zeros(len(p), dtype=bool) if converged is None else np.array(converged, dtype=bool)
+	damping = np.full(len(p), 1e-3)
+	J, model = function(p)
+	res = model-values
+	cost = (res**2).sum(axis=1)
+	identity = np.eye(p.shape[1])
+	for iteration in range(iterations):
+		i = np.flatnonzero(~converged)
+		if len(i) == 0:
+			break
+		Ji = J[:, i].transpose(1, 2, 0)
+		JTJ = np.einsum('pki,pkj->pij', Ji, Ji)
+		grad = np.einsum('pki,pk->pi', Ji, res[i])
+		diag = np.einsum('pii->pi', JTJ)+1e-12
+		step = -np.linalg.solve(
+			JTJ+damping[i, np.newaxis, np.newaxis]*diag[:, :, np.newaxis]*identity, grad[:, :, np.newaxis])[:, :, 0]
+		J_new, model_new = function(p[i]+step)
+		res_new = model_new-values[i]
+		cost_new = (res_new**2).sum(axis=1)
+		better = cost_new < cost[i]
+		k = i[better]
+		p[k] += step[better]
+		J[:, k], res[k], cost[k] = J_new[:, better], res_new[better], cost_new[better]
+		damping[k] /= 10
+		damping[i[~better]] *= 10
+		## converged: small steps or no improvement possible anymore
+		small = (np.abs(step) <= tol*(np.abs(p[i])+tol)).all(axis=1)
+		converged[i[small | (damping[i] > 1e10)]] = True
+	return p, J, res, converged
+
+
+def fitgaussianBatch(data,iterations=50,tol=1e-8):
+	"""fitgaussian of a stack of equally sized cutouts (cutouts, rows, columns) in one batched solve
+	Returns the parameters (height, x, y, width_x, width_y) of every cutout as rows and a boolean array that is
+	False where the fit failed (empty cutout, no convergence or invalid parameters)
+
+	All cutouts are fitted together with Levenberg-Marquardt (see levmarBatch). The start values are the intensity
+	weighted centroids and standard deviations."""
+	data = np.asarray(data, dtype=np.float64)
+	X, Y = gaussianGrid(data.shape[1:]).reshape(2, -1)
+	values = data.reshape(len(data), -1)
+	total = values.sum(axis=1)
+	ok = total > 0
+	total[~ok] = 1
+	cx, cy = (values*X).sum(axis=1)/total, (values*Y).sum(axis=1)/total
+	p = np.array([
+		values.max(axis=1), cx, cy,
+		np.sqrt(np.abs((values*(X-cx[:, np.newaxis])**2).sum(axis=1)/total))+1e-3,
+		np.sqrt(np.abs((values*(Y-cy[:, np.newaxis])**2).sum(axis=1)/total))+1e-3]).T
+	p = levmarBatch(p, values, lambda p: gaussianJacobian(p.T, X, Y), iterations, tol, converged=~ok)[0]
+	ok &= np.isfinite(p).all(axis=1) & (p[:, 3] != 0) & (p[:, 4] != 0)
+	return p, ok
+
+
+## Joint 3D Gaussian fit of bead sub-volumes
+def gaussian3DJacobian(p, X, Y, Z):
+	"""Partial derivatives of a 3D Gaussian on a constant background with respect to its parameters
+	(height, x, y, z, width_x, width_y, width_z, background) and the function values at X, Y, Z (x is the column,
+	y the row and z the slice index). p has the shape (8, ...) to evaluate many parameter sets at once, the
+	derivatives are stacked in the first axis."""
+	height, center_x, center_y, center_z, width_x, width_y, width_z, background = [
+		np.asarray(v)[..., np.newaxis] for v in p]
+	dx, dy, dz = X-center_x, Y-center_y, Z-center_z
+	g = np.exp(-((dx/width_x)**2+(dy/width_y)**2+(dz/width_z)**2)/2)
+	hg = height*g
+	return np.array([
+		g, hg*dx/width_x**2, hg*dy/width_y**2, hg*dz/width_z**2,
+		hg*dx**2/width_x**3, hg*dy**2/width_y**3, hg*dz**2/width_z**3, np.ones_like(g)]), hg+background
+
+
+def fitgaussian3DBatch(data,level=0.5,iterations=100,tol=1e-6):
+	"""Fit a 3D Gaussian on a constant background to a stack of equally sized sub-volumes (volumes, z, y, x)
+	level is the fraction of the intensity range (above the minimum) the voxels used for the start values exceed
+
+	The start values are the centroid and the second moments of the voxels above level, the minimum as background
+	and the intensity range as height. All sub-volumes are fitted together with Levenberg-Marquardt and the analytic
+	Jacobian (see levmarBatch), until the steps are smaller than tol (relative) or the fit can not be improved.
+	Returns the parameters (height, x, y, z, width_x, width_y, width_z, background) of every sub-volume as rows in
+	sub-volume coordinates, their standard errors (from the covariance of the fit, as in curve_fit) and a boolean
+	array that is False where the fit failed (no signal, no convergence or the center left the sub-volume)."""
+	data = np.asarray(data, dtype=np.float64)
+	X, Y, Z = gaussianGrid(data.shape[1:])[::-1].reshape(3, -1)
+	values = data.reshape(len(data), -1)
+	low, high = values.min(axis=1), values.max(axis=1)
+	ok = high > low
+	weights = np.clip(values-(low+(high-low)*level)[:, np.newaxis], 0, None)
+	total = weights.sum(axis=1)
+	total[~ok] = 1
+	start = [high-low]
+	for grid in [X, Y, Z]:
+		start.append((weights*grid).sum(axis=1)/total)
+	for grid, center in zip([X, Y, Z], start[1:4]):
+		## the moments of the voxels above level underestimate the width
+		start.append(2*np.sqrt((weights*(grid-center[:, np.newaxis])**2).sum(axis=1)/total)+0.5)
+	start.append(low)
+	p, J, res, converged = levmarBatch(
+		np.array(start).T, values, lambda p: gaussian3DJacobian(p.T, X, Y, Z), iterations, tol, converged=~ok)
+	p[:, 4:7] = np.abs(p[:, 4:7])
+	ok &= converged & np.isfinite(p).all(axis=1) & (p[:, 0] > 0) & (p[:, 4:7] > 0).all(axis=1)
+	ok &= ((p[:, 1:4] >= 0) & (p[:, 1:4] <= np.array(data.shape[:0:-1])-1)).all(axis=1)
+	perr = np.full(p.shape, np.nan)
+	i = np.flatnonzero(ok)
+	if len(i):
+		## covariance from the Jacobian, as in curve_fit
+		Ji = J[:, i].transpose(1, 2, 0)
+		JTJ = np.einsum('pki,pkj->pij', Ji, Ji)
+		variance = (res[i]**2).sum(axis=1)/max(values.shape[1]-p.shape[1], 1)
+		try:
+			pcov = np.linalg.inv(JTJ)
+		except np.linalg.LinAlgError:
+			pcov = np.array([np.linalg.pinv(m) for m in JTJ])
+		perr[i] = np.sqrt(np.abs(np.einsum('pii->pi', pcov))*variance[:, np.newaxis])
+	return p, perr, ok
+
+
+def zCutout(sigma,cutout=15):
+	"""Half size in z of the sub-volumes for the 3D Gaussian fits (see localizeGauss3D)
+	sigma are the widths of the Gaussian z-fits of the beads (in slices). The sub-volumes reach 3 times their median
+	width to both sides, so long z PSFs are not truncated, and at least cutout (their half size in x and y)."""
+	sigma = np.abs(np.asarray(sigma, dtype=np.float64))
+	sigma = sigma[np.isfinite(sigma)]
+	if len(sigma) == 0:
+		return cutout
+	return max(cutout, int(np.ceil(3*np.median(sigma))))
+
+
+def localizeGauss3D(x,y,z,img,threshold=None,threshVal=0.6,cutout=15,zcutout=None,chunk=16):
+	"""Localize beads by a joint 3D Gaussian fit to the sub-volume around each bead (see fitgaussian3DBatch)
+	x, y and z are arrays with the start positions of the beads (z e.g. from the Gaussian z-fit)
+	img is the image volume as numpy.ndarray
+	cutout is the half size of the sub-volume in x and y, zcutout in z (default cutout). The sub-volume is moved
+	into the stack in z, in x and y it has to be inside the image.
+	threshold == True uses the voxels above max - (max - min) * threshVal for the start values (as the threshold of
+	getzGauss), otherwise the voxels above half of the intensity range. The fit itself uses all voxels.
+	chunk sub-volumes are fitted at once, which limits the memory of the batched Jacobian.
+
+	Returns the parameters (height, x, y, z, width_x, width_y, width_z, background) of every bead as rows in image
+	coordinates, their standard errors and a boolean array that is False where the sub-volume left the image or
+	the fit failed."""
+	zcutout = cutout if zcutout is None else zcutout
+	level = 1-threshVal if threshold is not None else 0.5
+	xi, yi = np.round(np.asarray(x, dtype=np.float64)).astype(int), np.round(np.asarray(y, dtype=np.float64)).astype(int)
+	zi = np.round(np.asarray(z, dtype=np.float64)).astype(int)
+	## origin of the sub-volumes
+	depth = min(2*zcutout, img.shape[-3])
+	z0 = np.clip(zi-zcutout, 0, img.shape[-3]-depth)
+	y0, x0 = yi-cutout, xi-cutout
+	ok = (x0 >= 0) & (xi+cutout <= img.shape[-1]) & (y0 >= 0) & (yi+cutout <= img.shape[-2])
+	p = np.full((len(xi), 8), np.nan)
+	perr = np.full((len(xi), 8), np.nan)
+	oz, oxy = np.arange(depth), np.arange(2*cutout)
+	idx = np.flatnonzero(ok)
+	for start in range(0, len(idx), chunk):
+		i = idx[start:start+chunk]
+		## sub-volumes of the beads: (beads, z, y, x)
+		data = img[
+			z0[i, np.newaxis, np.newaxis, np.newaxis]+oz[:, np.newaxis, np.newaxis],
+			y0[i, np.newaxis, np.newaxis, np.newaxis]+oxy[:, np.newaxis],
+			x0[i, np.newaxis, np.newaxis, np.newaxis]+oxy]
+		p[i], perr[i], ok[i] = fitgaussian3DBatch(data, level=level)
+	p[:, 1] += x0
+	p[:, 2] += y0
+	p[:, 3] += z0
+	return p, perr, ok
+
+
+def plotGauss3D(parent,img,p,cutout=15):
+	"""Draw the z profile and the xy plane through the center of a 3D Gaussian fit (see localizeGauss3D) in the GUI"""
+	x, y, z = [int(round(v)) for v in p[1:4]]
+	data_z = img[:, y, x].astype(np.float64)
+	fit = gaussian3DJacobian(p, x, y, np.arange(len(data_z)))[1]
+	parent.widget_matplotlib.setupScatterCanvas(width=4,height=4,dpi=52,toolbar=False)
+	parent.widget_matplotlib.xyPlot(np.arange(len(data_z)), data_z, label='z data',clear=True)
+	parent.widget_matplotlib.xyPlot(np.arange(len(data_z)), fit, label='gaussian fit',clear=False)
+	Y, X = np.mgrid[y-cutout:y+cutout, x-cutout:x+cutout]
+	labelContour = (
+					"      x : %.1f\n"
+					"      y : %.1f\n"
+					"width_x : %.1f\n"
+					"width_y : %.1f") % (p[1], p[2], p[4], p[5])
+	parent.widget_matplotlib.matshowPlot(
+		mat=img[z, y-cutout:y+cutout, x-cutout:x+cutout],contour=gaussian3DJacobian(p, X, Y, z)[1],
+		labelContour=labelContour)
+
+
 # def test1Dgauss(data=None):
 # 	if not data:
 # 		data = np.random.normal(loc=5., size=10000)
@@ -20,7 +20,10 @@ Quadratic Interpolation of Spectral Peaks
 # ======================================================================================================================
 
 from __future__ import division
-from numpy import polyfit, arange
+from numpy import arange, asarray, full, linalg, nan, ones, unique, vander
+
+## Least squares kernels of the parabola fit, keyed by the number of samples (see polyfit_kernel)
+_kernels = {}
 
 
 def parabolic(f, x):
@@ -47,19 +50,61 @@ def parabolic(f, x):
 
 
 def parabolic_polyfit(f, x, n):
-	"""Use the built-in polyfit() function to find the peak of a parabola
+	"""Least squares fit of a parabola to find the peak (same result as polyfit(), but using a cached kernel)
 
 	f is a vector and x is an index for that vector.
 
 	n is the number of samples of the curve used to fit the parabola.
 
 	"""
-	a, b, c = polyfit(arange(x-n//2, x+n//2+1), f[x-n//2:x+n//2+1], 2)
+	a, b, c = polyfit_kernel(2*(n//2)+1).dot(asarray(f[x-n//2:x+n//2+1], dtype=float))
 	xv = -0.5 * b/a
 	yv = a * xv**2 + b * xv + c
+	return (xv + x, yv)
+
+
+def parabolic_polyfit_batch(f, x, n):
+	"""parabolic_polyfit() of many vectors at once
+
+	f is an array of vectors (vectors, samples) and x an array with one index per vector.
+
+	n is the number of samples used to fit the parabola, the same for all vectors or one per vector. All windows
+	of the same size are fitted with one matrix multiply.
+
+	Returns the arrays (xv, yv). Both are nan where the window does not fit into its vector, has less than 3
+	samples or where the samples do not form a maximum.
+
+	"""
+	f = asarray(f, dtype=float)
+	x = asarray(x, dtype=int)
+	half = asarray(n, dtype=int)//2*ones(len(f), dtype=int)
+	xv, yv = full(len(f), nan), full(len(f), nan)
+	for h in unique(half[half > 0]):
+		rows = ((half == h) & (x-h >= 0) & (x+h < f.shape[1])).nonzero()[0]
+		if len(rows) == 0:
+			continue
+		windows = f[rows[:, None], x[rows, None]+arange(-h, h+1)]
+		a, b, c = polyfit_kernel(2*h+1).dot(windows.T)
+		peak = a < 0
+		a, b, c, rows = a[peak], b[peak], c[peak], rows[peak]
+		xv[rows] = -0.5 * b/a
+		yv[rows] = a * xv[rows]**2 + b * xv[rows] + c
+		xv[rows] += x[rows]
 	return (xv, yv)
 
 
+def polyfit_kernel(samples):
+	"""Least squares kernel of a parabola through equally spaced samples, centered on the middle sample
+
+	The kernel is the pseudo-inverse of the Vandermonde matrix, kernel.dot(f) returns the coefficients (a, b, c)
+	of a*t**2 + b*t + c with t = -(samples//2) ... samples//2. Kernels are computed once per number of samples.
+
+	"""
+	if samples not in _kernels:
+		_kernels[samples] = linalg.pinv(vander(arange(samples)-samples//2, 3))
+	return _kernels[samples]
+
+
 if __name__ == "__main__":
 	from numpy import argmax
 	import matplotlib.pyplot as plt
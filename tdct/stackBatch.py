@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Headless batch reslicing of image stack files and FEI MAPS/LA image sequences.
+
+Jobs are given as image stack files and/or image sequence directories on the command line, or as a manifest file
+(csv or tab separated) with the columns path, ss_in, ss_out and optionally method and saveorigstack. The jobs are
+run in a pool of worker processes. For every job a status file is written, so an interrupted run can be started
+again and only redoes the jobs that did not finish (or whose output files went missing).
+
+Usage:
+	python -u stackBatch.py -i 300 -o 161.25 stack1.tif stack2.tif sequence_dir/
+	python -u stackBatch.py -m manifest.csv -w 4 -d /path/to/output
+
+e.g. manifest.csv:
+	path,ss_in,ss_out,method
+	/data/stack1.tif,300,161.25,linear
+	/data/sequence_dir,300,161.25,spline
+
+# @Title			: stackBatch
+# @Project			: 3DCTv2
+# @Description		: Headless batch reslicing of image stacks
+# @Author			: 3DCT contributors
+# @Email			:
+# @Copyright		: Copyright (C) 2026  3DCT contributors
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		:
+# @Date				: 2026/10
+# @Version			: module rev. 1
+# @Status			: stable
+# @Usage			: python -u stackBatch.py -i 300 -o 161.25 stack1.tif stack2.tif sequence_dir/
+# 					: python -u stackBatch.py -m manifest.csv -w 4 -d /path/to/output
+# @Notes			: Status files are written to <output directory>/.stackBatch (or next to the input if no output
+# 					: directory is given)
+# @Python_version	: 2.7.11
+"""
+# ======================================================================================================================
+
+import sys
+import os
+import csv
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+import stackProcessing
+import clrmsg
+
+STATUSDIR = '.stackBatch'
+
+
+def loadManifest(path, method='linear', saveorigstack=True):
+	"""Read jobs from a manifest file. Delimiter (comma, tab, semicolon) is detected from the header line.
+	Relative paths are relative to the manifest file."""
+	with open(path, 'rb') as f:
+		header = f.readline()
+		f.seek(0)
+		delimiter = csv.Sniffer().sniff(header, delimiters=',\t;').delimiter
+		jobs = []
+		for row in csv.DictReader(f, delimiter=delimiter):
+			if not row.get('path'):
+				continue
+			jobs.append(makeJob(
+				os.path.join(os.path.dirname(os.path.abspath(path)), row['path'].strip()),
+				row['ss_in'], row['ss_out'],
+				method=(row.get('method') or method).strip(),
+				saveorigstack=str(row.get('saveorigstack') or saveorigstack).strip().lower() in ['1', 'true', 'yes']))
+	return jobs
+
+
+def makeJob(path, ss_in, ss_out, method='linear', saveorigstack=True, outdir=None, streaming=False):
+	"""Return a job dictionary"""
+	return {
+		'path': os.path.abspath(path),
+		'ss_in': float(ss_in),
+		'ss_out': float(ss_out),
+		'method': method,
+		'saveorigstack': bool(saveorigstack),
+		'outdir': os.path.abspath(outdir) if outdir else None,
+		'streaming': bool(streaming)}
+
+
+def jobId(job):
+	"""Identifier of a job, derived from its input path and parameters"""
+	key = json.dumps([job[k] for k in sorted(job)])
+	name = os.path.basename(os.path.normpath(job['path']))
+	return "{0}_{1}".format(name, hashlib.sha1(key).hexdigest()[:12])
+
+
+def statusPath(job, statusdir=None):
+	"""Path of the status file of a job"""
+	if statusdir is None:
+		if job['outdir']:
+			statusdir = os.path.join(job['outdir'], STATUSDIR)
+		elif os.path.isdir(job['path']):
+			statusdir = os.path.join(job['path'], STATUSDIR)
+		else:
+			statusdir = os.path.join(os.path.dirname(job['path']), STATUSDIR)
+	return os.path.join(statusdir, jobId(job)+'.json')
+
+
+def readStatus(job, statusdir=None):
+	"""Return the status dictionary of a job or None if the job never ran"""
+	try:
+		with open(statusPath(job, statusdir)) as f:
+			return json.load(f)
+	except (IOError, ValueError):
+		return None
+
+
+def writeStatus(job, status, statusdir=None, **kwargs):
+	fname = statusPath(job, statusdir)
+	if not os.path.isdir(os.path.dirname(fname)):
+		os.makedirs(os.path.dirname(fname))
+	record = {'job': job, 'status': status, 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+	record.update(kwargs)
+	with open(fname+'.tmp', 'w') as f:
+		json.dump(record, f, indent=1)
+	if os.path.exists(fname):
+		os.remove(fname)
+	os.rename(fname+'.tmp', fname)
+
+
+def isDone(job, statusdir=None):
+	"""True if the job finished in an earlier run and all its output files still exist"""
+	status = readStatus(job, statusdir)
+	return (
+		status is not None and status['status'] == 'done' and
+		all(os.path.isfile(fname) for fname in status.get('outputs', [])))
+
+
+def runJob(job, statusdir=None):
+	"""Run a single job and record its status. Returns (job id, status)"""
+	writeStatus(job, 'running', statusdir)
+	ping = time.time()
+	try:
+		outputs = stackProcessing.main(
+			job['path'], job['ss_in'], job['ss_out'], interpolationmethod=job['method'],
+			saveorigstack=job['saveorigstack'], showgraph=False, customSaveDir=job['outdir'],
+			streaming=job['streaming'])
+	except Exception as e:
+		writeStatus(job, 'failed', statusdir, error=str(e))
+		return jobId(job), 'failed'
+	if type(outputs) == str:
+		writeStatus(job, 'failed', statusdir, error=outputs)
+		return jobId(job), 'failed'
+	writeStatus(job, 'done', statusdir, outputs=outputs, seconds=time.time()-ping)
+	return jobId(job), 'done'
+
+
+def runJobStar(args):
+	"""multiprocessing.Pool helper, unpacks the arguments for runJob"""
+	return runJob(*args)
+
+
+def run(jobs, workers=1, statusdir=None, force=False, callback=None):
+	"""Run jobs in a pool of worker processes. Finished jobs are skipped unless force is True.
+
+	callback is called with (job id, status) after every job. Returns a dictionary mapping job ids to
+	'done', 'failed' or 'skipped'.
+	"""
+	results = {}
+	todo = []
+	for job in jobs:
+		if force is False and isDone(job, statusdir):
+			results[jobId(job)] = 'skipped'
+			if callback: callback(jobId(job), 'skipped')
+		else:
+			todo.append(job)
+	workers = max(1, min(workers, len(todo)))
+	if workers > 1:
+		pool = multiprocessing.Pool(processes=workers)
+		try:
+			for retVal in pool.imap_unordered(runJobStar, [(job, statusdir) for job in todo]):
+				results[retVal[0]] = retVal[1]
+				if callback: callback(*retVal)
+			pool.close()
+		finally:
+			pool.join()
+	else:
+		for job in todo:
+			retVal = runJob(job, statusdir)
+			results[retVal[0]] = retVal[1]
+			if callback: callback(*retVal)
+	return results
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Batch reslicing of image stack files and FEI MAPS/LA image sequences')
+	parser.add_argument('paths', nargs='*', help='image stack files and/or image sequence directories')
+	parser.add_argument('-m', '--manifest', help='csv/tsv file with the columns path, ss_in, ss_out[, method, saveorigstack]')
+	parser.add_argument('-i', '--ss_in', type=float, help='focus step size of the original stacks')
+	parser.add_argument('-o', '--ss_out', type=float, help='focus step size of the resliced stacks')
+	parser.add_argument('-M', '--method', default='linear', help="interpolation method (default: linear)")
+	parser.add_argument('-d', '--outdir', help='output directory (default: next to the input)')
+	parser.add_argument('-w', '--workers', type=int, default=1, help='number of worker processes (default: 1)')
+	parser.add_argument('-s', '--statusdir', help='directory for the job status files')
+	parser.add_argument('--streaming', action='store_true', help='stream single stack files slab by slab')
+	parser.add_argument('--noorigstack', action='store_true', help="don't save image sequences as single stack files")
+	parser.add_argument('-f', '--force', action='store_true', help='also redo jobs that already finished')
+	args = parser.parse_args(argv)
+
+	jobs = []
+	if args.manifest:
+		jobs.extend(loadManifest(args.manifest, method=args.method, saveorigstack=not args.noorigstack))
+	if args.paths:
+		if args.ss_in is None or args.ss_out is None:
+			parser.error('--ss_in and --ss_out are required for jobs given as paths')
+		for path in args.paths:
+			jobs.append(makeJob(path, args.ss_in, args.ss_out, args.method, not args.noorigstack))
+	if not jobs:
+		parser.error('nothing to do, please specify paths or a manifest')
+	for job in jobs:
+		if args.outdir:
+			job['outdir'] = os.path.abspath(args.outdir)
+		job['streaming'] = args.streaming
+
+	def report(jobid, status):
+		print clrmsg.OK if status != 'failed' else clrmsg.ERROR, jobid, status
+
+	results = run(jobs, workers=args.workers, statusdir=args.statusdir, force=args.force, callback=report)
+	failed = [jobid for jobid, status in results.items() if status == 'failed']
+	print clrmsg.INFO, "{0} jobs: {1} done, {2} skipped, {3} failed".format(
+		len(results), results.values().count('done'), results.values().count('skipped'), len(failed))
+	return 1 if failed else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
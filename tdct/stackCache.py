@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of resliced image stacks.
+
+Entries are keyed by a fast content hash of the input file, its modification time and the interpolation
+parameters, so the same stack resliced with the same parameters is only computed once. With a full content hash
+the key does not depend on the modification time, the same stack is found no matter where it was copied to or what
+it is called.
+The cache is limited in size; the least recently used entries are evicted first.
+
+Usage:
+	import stackCache
+	>>> key = stackCache.key('image_stack.tif', ss_in=300, ss_out=161.25, method='linear')
+	>>> stackCache.fetch(key, 'image_stack_resliced.tif')  # True if cached, file is written to the given path
+	>>> stackCache.store(key, 'image_stack_resliced.tif', source='image_stack.tif')
+	>>> for entry in stackCache.inspect(): print entry['key'], entry['size'], entry['source']
+
+	or from the command line:
+	python -u stackCache.py [--clear] [--maxsize 20]
+
+# @Title			: stackCache
+# @Project			: 3DCTv2
+# @Description		: On-disk cache of resliced image stacks
+# @Author			: 3DCT contributors
+# @Email			:
+# @Copyright		: Copyright (C) 2026  3DCT contributors
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		:
+# @Date				: 2026/10
+# @Version			: module rev. 1
+# @Status			: stable
+# @Usage			: import stackCache
+# 					: >>> stackCache.inspect()
+# @Notes			: The cache directory defaults to ~/.3DCT/cache and can be changed with the environment variable
+# 					: TDCT_CACHE. Files are copied (not linked) so rewriting an output file never alters the cache.
+# @Python_version	: 2.7.11
+"""
+# ======================================================================================================================
+
+import sys
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import clrmsg
+
+## Default cache directory
+CACHEDIR = os.environ.get('TDCT_CACHE', os.path.join(os.path.expanduser('~'), '.3DCT', 'cache'))
+## Default maximum cache size in bytes
+MAXSIZE = 20*1024**3
+## Bump when the interpolation output changes, so old entries are not used anymore
+VERSION = 1
+## Size and number of the blocks sampled for the content hash
+BLOCKSIZE = 1024**2
+BLOCKS = 16
+
+_hashes = {}
+
+
+def fileHash(path, full=False):
+	"""Content hash of a file
+
+	Hashes the file size and BLOCKS evenly spaced blocks of BLOCKSIZE bytes (first and last block included)
+	instead of the whole file, unless full is True. Results are remembered per path, modification time and file size.
+	"""
+	stat = os.stat(path)
+	memo = (os.path.realpath(path), stat.st_mtime, stat.st_size, full)
+	if memo in _hashes:
+		return _hashes[memo]
+	sha1 = hashlib.sha1(str(stat.st_size))
+	with open(path, 'rb') as f:
+		if full is True:
+			for block in iter(lambda: f.read(BLOCKSIZE), ''):
+				sha1.update(block)
+		elif stat.st_size <= BLOCKS*BLOCKSIZE:
+			sha1.update(f.read())
+		else:
+			for i in range(BLOCKS):
+				f.seek(i*(stat.st_size-BLOCKSIZE)/(BLOCKS-1))
+				sha1.update(f.read(BLOCKSIZE))
+	_hashes[memo] = sha1.hexdigest()
+	return _hashes[memo]
+
+
+def key(path, fullhash=False, **parameters):
+	"""Cache key of an input file and the parameters it is processed with
+
+	The sampled content hash misses edits that keep the file size, so the modification time is part of the key.
+	With fullhash True the whole file is hashed instead and the modification time is left out.
+	"""
+	content = [fileHash(path, full=True)] if fullhash is True else [fileHash(path), os.stat(path).st_mtime]
+	return hashlib.sha1(json.dumps([VERSION]+content+[sorted(parameters.items())])).hexdigest()
+
+
+def entryPath(key, cachedir=None):
+	return os.path.join(cachedir or CACHEDIR, key+'.tif')
+
+
+def fetch(key, file_out, cachedir=None):
+	"""Write the cached stack of key to file_out. Returns False if there is no such entry."""
+	fname = entryPath(key, cachedir)
+	if not os.path.isfile(fname):
+		return False
+	## Mark as recently used
+	os.utime(fname, None)
+	shutil.copyfile(fname, file_out)
+	return True
+
+
+def store(key, file_out, cachedir=None, maxsize=None, **info):
+	"""Add file_out to the cache under key and evict old entries if the cache grows larger than maxsize.
+
+	info (e.g. source file and parameters) is saved alongside the entry and shown by inspect.
+	"""
+	fname = entryPath(key, cachedir)
+	if not os.path.isdir(os.path.dirname(fname)):
+		os.makedirs(os.path.dirname(fname))
+	shutil.copyfile(file_out, fname+'.tmp')
+	if os.path.exists(fname):
+		os.remove(fname)
+	os.rename(fname+'.tmp', fname)
+	info.update({'key': key, 'created': time.strftime('%Y-%m-%d %H:%M:%S')})
+	with open(os.path.splitext(fname)[0]+'.json', 'w') as f:
+		json.dump(info, f, indent=1)
+	evict(maxsize, cachedir)
+
+
+def inspect(cachedir=None):
+	"""Return a list of all cache entries, most recently used first.
+
+	Every entry is a dictionary with the keys key, path, size (bytes), used (time of last use) and the info
+	given when it was stored (e.g. source).
+	"""
+	cachedir = cachedir or CACHEDIR
+	if not os.path.isdir(cachedir):
+		return []
+	entries = []
+	for fname in os.listdir(cachedir):
+		if not fname.endswith('.tif'):
+			continue
+		path = os.path.join(cachedir, fname)
+		try:
+			with open(os.path.splitext(path)[0]+'.json') as f:
+				entry = json.load(f)
+		except (IOError, ValueError):
+			entry = {}
+		stat = os.stat(path)
+		entry.update({'key': fname[:-4], 'path': path, 'size': stat.st_size, 'used': stat.st_mtime})
+		entries.append(entry)
+	return sorted(entries, key=lambda entry: entry['used'], reverse=True)
+
+
+def evict(maxsize=None, cachedir=None):
+	"""Remove least recently used entries until the cache is not larger than maxsize bytes.
+	Returns the keys of the removed entries."""
+	maxsize = MAXSIZE if maxsize is None else maxsize
+	entries = inspect(cachedir)
+	total = sum(entry['size'] for entry in entries)
+	removed = []
+	while entries and total > maxsize:
+		entry = entries.pop()
+		remove(entry['key'], cachedir)
+		total -= entry['size']
+		removed.append(entry['key'])
+	return removed
+
+
+def remove(key, cachedir=None):
+	fname = entryPath(key, cachedir)
+	for path in [fname, os.path.splitext(fname)[0]+'.json']:
+		if os.path.exists(path):
+			os.remove(path)
+
+
+def clear(cachedir=None):
+	"""Remove all entries"""
+	for entry in inspect(cachedir):
+		remove(entry['key'], cachedir)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Inspect the cache of resliced image stacks')
+	parser.add_argument('-d', '--cachedir', help='cache directory (default: {0})'.format(CACHEDIR))
+	parser.add_argument('--maxsize', type=float, help='evict entries until the cache is smaller than this (GB)')
+	parser.add_argument('--clear', action='store_true', help='remove all entries')
+	args = parser.parse_args(argv)
+	if args.clear:
+		clear(args.cachedir)
+	if args.maxsize is not None:
+		evict(int(args.maxsize*1024**3), args.cachedir)
+	entries = inspect(args.cachedir)
+	for entry in entries:
+		print "{0}  {1:8.1f} MB  {2}  {3}".format(
+			entry['key'][:12], entry['size']/1024.**2,
+			time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['used'])), entry.get('source', ''))
+	print clrmsg.INFO, "{0} entries, {1:.1f} MB in {2}".format(
+		len(entries), sum(entry['size'] for entry in entries)/1024.**2, args.cachedir or CACHEDIR)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
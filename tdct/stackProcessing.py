@@ -5,12 +5,19 @@ Can be used as standalone application, i.e. run python -u stackProcessing.py
 or import stackProcessing.py and use main function like:
 	stackProcessing.main(imgpath, original_steppsize, interpolated_stepsize, interpolationmethod)
 
-e.g: stackProcessing("image_stack.tif", 300, 161.25, 'linear') => fast (~25x faster)
-or: stackProcessing("image_stack.tif", 300, 161.25, 'spline') => slow
+e.g: stackProcessing("image_stack.tif", 300, 161.25, 'linear') => fast (~12x faster than 'spline')
+or: stackProcessing("image_stack.tif", 300, 161.25, 'cubic') => fast, sharper ('lanczos' alike)
+or: stackProcessing("image_stack.tif", 300, 161.25, 'spline')
 
 where 300 is the focus step size the image stack was acquired with and 161.25 the step size
 of the interpolated stack.
 
+Isotropic (cube) voxels, resampled in x and y as well, with the xy pixel size read from the file:
+	stackProcessing.isotropic("image_stack.tif", voxelsize=161.25)
+
+Depth from focus, the sub-slice z position and intensity of the focus peak of every x,y pixel:
+	height, peak = stackProcessing.depthMap("image_stack.tif")
+
 The spline method also returns a graph representing the interpolation in z of one x,y pixel in the
 middle for comparison between the original data and the linear as well as the spline interpolation.
 
@@ -45,8 +52,9 @@ kwargs:
 # 					: or import stackProcessing.py and use main function like:
 # 					: stackProcessing.main(imgpath, original_steppsize, interpolated_stepsize, interpolationmethod)
 # 					:
-# 					: e.g: stackProcessing("image_stack.tif", 300, 161.25, 'linear') => fast (~25x faster)
-# 					: or: stackProcessing("image_stack.tif", 300, 161.25, 'spline') => slow
+# 					: e.g: stackProcessing("image_stack.tif", 300, 161.25, 'linear') => fast (~12x faster than 'spline')
+# 					: or: stackProcessing("image_stack.tif", 300, 161.25, 'cubic') => fast, sharper ('lanczos' alike)
+# 					: or: stackProcessing("image_stack.tif", 300, 161.25, 'spline')
 # 					:
 # 					: where 300 is the focus step size the image stack was acquired with and 161.25 the step size
 # 					: of the interpolated stack.
@@ -73,8 +81,9 @@ kwargs:
 import sys
 import os
 import re
-import fnmatch
 import time
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 import numpy as np
 from scipy import interpolate
 import matplotlib
@@ -95,34 +104,83 @@ try:
 	from PyQt4 import QtGui
 	import clrmsg
 	import TDCT_debug
+	import tiffMetadata
+	import stackCache
+	import stackWriter
+	import parabolic
 except:
 	sys.exit("Please install tifffile, e.g.: pip install tifffile")
 
 debug = TDCT_debug.debug
 
+## FEI MAPS/LA image sequence naming scheme, e.g. 'Tile_001-001-000_0-000.tif' (tile, z, channel)
+SEQUENCEPATTERN = re.compile(r'^Tile_(\d+-\d+)-(\d+)_(\d+)-\d+\.tif$')
+
+
+def main(
+		img_path, ss_in, ss_out, qtprocessbar=None, interpolationmethod='linear', saveorigstack=True, showgraph=False,
+		customSaveDir=None, streaming=False, slabsize=16, workers=1, memorycap=None, callback=None, threads=4,
+		cache=False, fullhash=False, compress=0, tile=None):
+	"""Main function handling the file type and parsing of filenames/directories
+
+	If streaming is set True, single image stack files are not loaded as a whole but read page by page and the
+	interpolated slices are appended to the output file slab by slab (see interpolStream). Use this for stacks
+	that, together with their resliced copy, do not fit into memory.
+
+	For image sequences the channels are independent of each other. With workers > 1 they are processed in a
+	pool of worker processes. memorycap (in MB) limits the number of concurrently processed channels based on
+	the estimated memory footprint of one channel. showgraph is ignored when running in parallel.
+
+	callback is called with the progress in percent (0-100) and can cancel processing (see report). If no
+	callback is given but a qtprocessbar, the progress is forwarded to the Qt progress bar.
+	threads is the number of threads decoding the slices of one image sequence channel (see readSequence).
+
+	If cache is True (or the path of a cache directory), resliced single image stack files are looked up in and
+	added to the cache of resliced stacks (see stackCache). A stack that was already resliced with the same
+	parameters is copied from the cache instead of being computed again. Inputs are identified by a sampled content
+	hash and their modification time, or with fullhash True by a hash of the whole file (copies of a stack hit the
+	same entry).
 
-def main(img_path, ss_in, ss_out, qtprocessbar=None, interpolationmethod='linear', saveorigstack=True, showgraph=False, customSaveDir=None):
-	"""Main function handling the file type and parsing of filenames/directories"""
+	compress (zlib level 0-9) and tile ((y,x) tile size) set the output format of z,y,x stacks (see stackWriter).
+
+	Returns the list of written files or an error message string if processing failed.
+	"""
 
 	## Raise "error" when program has nothing to do due to all arguments set to none/false
 	if interpolationmethod == 'none' and saveorigstack is False and showgraph is False:
-		print clrmsg.WARNING, "At least let me do something! Setting everything to False... very funny -.-"
-		return
+		msg = "At least let me do something! Setting everything to False... very funny -.-"
+		print clrmsg.WARNING, msg
+		return "ERROR: "+msg
+	if callback is None and qtprocessbar:
+		callback = qtProgress(qtprocessbar)
 	## For single image stack files
 	if os.path.isfile(img_path) is True:
+		if customSaveDir:
+			file_out_int = os.path.join(customSaveDir, os.path.splitext(os.path.split(img_path)[1])[0]+"_resliced.tif")
+		else:
+			file_out_int = os.path.join(img_path, os.path.splitext(img_path)[0]+"_resliced.tif")  # revisit
+		if cache and interpolationmethod in METHODS and showgraph is False:
+			cachedir = cache if isinstance(cache, str) else None
+			cachekey = stackCache.key(
+				img_path, fullhash=fullhash, ss_in=ss_in, ss_out=ss_out, method=interpolationmethod, streaming=streaming,
+				compress=compress, tile=tile)
+			if stackCache.fetch(cachekey, file_out_int, cachedir):
+				if debug is True: print clrmsg.DEBUG, "Resliced stack taken from cache: ", file_out_int
+				report(callback, 100)
+				return [file_out_int]
+		else:
+			cachekey = None
 		if debug is True: print clrmsg.DEBUG, "Loading image: ", img_path
-		if qtprocessbar:
-			qtprocessbar.setValue(20)
-			QtGui.QApplication.processEvents()
-		img = tf.imread(img_path)
-		if len(img.shape) < 3:
-			print clrmsg.ERROR, "ERROR: This seems to be a 2D image with the shape {0}. Please select a stack image file.".format(img.shape)
-			return
-		if debug is True: print clrmsg.DEBUG, "		...done."
+		report(callback, 20)
+		if streaming is False:
+			img = readStack(img_path)
+			if len(img.shape) < 3:
+				msg = "ERROR: This seems to be a 2D image with the shape {0}. Please select a stack image file.".format(img.shape)
+				print clrmsg.ERROR, msg
+				return msg
+			if debug is True: print clrmsg.DEBUG, "		...done."
 		## Get pixel size
-		if qtprocessbar:
-			qtprocessbar.setValue(40)
-			QtGui.QApplication.processEvents()
+		report(callback, 40)
 		try:
 			pixelsize = pxSize(img_path)
 			if pixelsize is not None:
@@ -135,64 +193,68 @@ def main(img_path, ss_in, ss_out, qtprocessbar=None, interpolationmethod='linear
 			px_info = False
 		## Start Processing
 		if debug is True: print clrmsg.DEBUG, px_info
-		if qtprocessbar:
-			qtprocessbar.setValue(60)
-			QtGui.QApplication.processEvents()
-		if customSaveDir:
-			file_out_int = os.path.join(customSaveDir, os.path.splitext(os.path.split(img_path)[1])[0]+"_resliced.tif")
-		else:
-			file_out_int = os.path.join(img_path, os.path.splitext(img_path)[0]+"_resliced.tif")  # revisit
+		report(callback, 60)
 		if debug is True: print clrmsg.DEBUG, "Interpolating..."
-		img_int = interpol(img, ss_in, ss_out, interpolationmethod, showgraph)
-		if qtprocessbar:
-			qtprocessbar.setValue(80)
-			QtGui.QApplication.processEvents()
+		if streaming is True:
+			if debug is True: print clrmsg.DEBUG, "Streaming interpolated stack to: ", file_out_int
+			metadata = {'PixelSize': str(pixelsize),'FocusStepSize': str(ss_out/1000)} if px_info is True else None
+			img_int = interpolStream(
+				img_path, file_out_int, ss_in, ss_out, interpolationmethod, slabsize=slabsize, metadata=metadata,
+				compress=compress, tile=tile, callback=subProgress(callback, 60, 100))
+			if type(img_int) == str:
+				print clrmsg.ERROR, img_int
+				return img_int
+			if cachekey:
+				cacheStore(
+					cachekey, file_out_int, cache, source=os.path.abspath(img_path), ss_in=ss_in, ss_out=ss_out,
+					method=interpolationmethod)
+			report(callback, 100)
+			return [file_out_int]
+		img_int = interpol(
+			img, ss_in, ss_out, interpolationmethod, showgraph, threads=threads, callback=subProgress(callback, 60, 80))
+		report(callback, 80)
 		if type(img_int) == str:
-			if debug is True: print clrmsg.DEBUG, img_int
-			return
+			print clrmsg.ERROR, img_int
+			return img_int
+		outputs = []
 		if img_int is not None:
 			if debug is True: print clrmsg.DEBUG, "Saving interpolated stack as: ", file_out_int
-			if px_info is True:
-				tf.imsave(file_out_int, img_int, metadata={'PixelSize': str(pixelsize),'FocusStepSize': str(ss_out/1000)})
+			if img_int.ndim == 4:
+				## Multichannel stacks are saved as one ImageJ hyperstack (read back as c,z,y,x)
+				saveHyperstack(file_out_int, img_int, img_path, ss_out)
+			elif px_info is True:
+				stackWriter.saveStack(
+					file_out_int, img_int, metadata={'PixelSize': str(pixelsize),'FocusStepSize': str(ss_out/1000)},
+					compress=compress, tile=tile)
 			else:
-				tf.imsave(file_out_int, img_int)
+				stackWriter.saveStack(file_out_int, img_int, compress=compress, tile=tile)
+			outputs.append(file_out_int)
 			if debug is True: print clrmsg.DEBUG, "		...done."
-		if qtprocessbar:
-			qtprocessbar.setValue(100)
-			QtGui.QApplication.processEvents()
+			if cachekey:
+				cacheStore(
+					cachekey, file_out_int, cache, source=os.path.abspath(img_path), ss_in=ss_in, ss_out=ss_out,
+					method=interpolationmethod)
+		report(callback, 100)
+		return outputs
 	## For image sequence (only FEI MAPS/LA image sequences at the moment)
 	elif os.path.isdir(img_path):
-		if qtprocessbar:
-			qtprocessbar.setValue(5)
-			QtGui.QApplication.processEvents()
-		## bugfix for linux: os.listdir returns unsorted file list
-		files = sorted(os.listdir(img_path))
+		report(callback, 5)
 		if debug is True: print clrmsg.DEBUG, "Checking directory: ", img_path
-		channels = []
-		## Setting trigger for FEI MAPS/LA filename scheme (only one that can be handled at the moment)
-		match = False
-		## Getting number of channels
-		for filename in files:
-			if fnmatch.fnmatch(filename, 'Tile_*.tif'):
-				match = True
-				channels.append(filename[17])  # 'Tile_001-001-001_1-000.tif' 17th character is the amount of channels
-		if match is False:
-			print clrmsg.ERROR,(
+		## FEI MAPS/LA filename scheme (only one that can be handled at the moment)
+		index = sequenceIndex(img_path)
+		if not index:
+			msg = (
 				"ERROR: I only know FEI MAPS image sequences looking like e.g. 'Tile_001-001-001_1-000.tif'. " +
 				"I did not find images matching this naming scheme")
-			return
-		## Channel numbers in filename i zero-based, so add 1 for total number
-		channels = int(max(channels))+1
+			print clrmsg.ERROR, msg
+			return msg
+		filelists = sequenceChannels(index)
+		channels = len(filelists)
 		## Get pixel size
-		if qtprocessbar:
-			qtprocessbar.setValue(10)
-			QtGui.QApplication.processEvents()
+		report(callback, 10)
 		try:
-			for filename in files:
-				if fnmatch.fnmatch(filename, 'Tile_*.tif'):
-					pixelsize = pxSize(os.path.join(img_path,filename))
-					pixelsizeZ = pxSize(os.path.join(img_path,filename),z=True)
-					break
+			meta = tiffMetadata.read(filelists[min(filelists)][0])
+			pixelsize, pixelsizeZ = meta['pixelSize'], meta['focusStep']
 			if pixelsize is not None:
 				px_info = True
 				if debug is True: print clrmsg.DEBUG, 'Adding pixel size information:', pixelsize
@@ -202,143 +264,319 @@ def main(img_path, ss_in, ss_out, qtprocessbar=None, interpolationmethod='linear
 			print clrmsg.ERROR, 'Error while adding pixel size information:', e, '... skipping'
 			px_info = False
 		## Start Processing
-		if qtprocessbar:
-			qtprocessbar.setValue(20)
-			QtGui.QApplication.processEvents()
+		report(callback, 20)
 		if debug is True: print clrmsg.DEBUG, px_info
-		for i in range(channels):
-			if qtprocessbar:
-				qtprocessbar.setValue(qtprocessbar.value()+int(20/channels))
-				QtGui.QApplication.processEvents()
-			if debug is True: print clrmsg.DEBUG, "Processing channel {0} of {1}".format(i+1, channels)
-			filelist = []
-			## Gather filenames from same channel
-			for filename in files:
-				if fnmatch.fnmatch(filename, 'Tile_*{0}-000.tif'.format(i)):
-					filelist.append(os.path.join(img_path,filename))
-			## Default pattern is not compatible with OME header from FEI MAPS/Live Acquisition Software
-			img = tf.imread(filelist, pattern='')
-			if qtprocessbar:
-				qtprocessbar.setValue(qtprocessbar.value()+int(20/channels))
-				QtGui.QApplication.processEvents()
-			## Generate file output name
-			if customSaveDir:
-				file_out_int = os.path.join(customSaveDir, os.path.basename(os.path.normpath(img_path))+"_"+str(i)+"_resliced.tif")
-			else:
-				file_out_int = os.path.join(img_path, os.path.basename(os.path.normpath(img_path))+"_"+str(i)+"_resliced.tif")
-			## Possibility to save the image sequence files as one single stack file for easier handling and better overview
-			if saveorigstack is True:
-				if customSaveDir:
-					file_out_orig = os.path.join(customSaveDir, os.path.basename(os.path.normpath(img_path))+"_"+str(i)+".tif")
-				else:
-					file_out_orig = os.path.join(img_path, os.path.basename(os.path.normpath(img_path))+"_"+str(i)+".tif")
-				if debug is True: print clrmsg.DEBUG, "Saving original image stack as single stack file: {0} |shape: {1}".format(file_out_orig,img.shape)
-				if px_info is True:
-					tf.imsave(file_out_orig, img, metadata={'PixelSize': str(pixelsize),'FocusStepSize': str(pixelsizeZ)})
-				else:
-					tf.imsave(file_out_orig, img)
-				if debug is True: print clrmsg.DEBUG, "		...done."
-				if qtprocessbar:
-					qtprocessbar.setValue(qtprocessbar.value()+int(20/channels))
-					QtGui.QApplication.processEvents()
-			## In case only the original image sequence is saved as a single stack file the interpolation is skipped
-			if interpolationmethod == 'none' and showgraph is False:
-				pass
-			else:
-				if debug is True: print clrmsg.DEBUG, "Interpolating..."
-				img_int = interpol(img, ss_in, ss_out, interpolationmethod, showgraph)
-				## Error handling from 'interpol' function
-				if type(img_int) == str:
-					print clrmsg.ERROR, img_int
-					return
-				elif img_int is not None:
-					if debug is True: print clrmsg.DEBUG, "Saving interpolated stack as: ", file_out_int
-					if px_info is True:
-						tf.imsave(file_out_int, img_int, metadata={'PixelSize': str(pixelsize),'FocusStepSize': str(ss_out/1000)})
-					else:
-						tf.imsave(file_out_int, img_int)
-					if debug is True: print clrmsg.DEBUG, "		...done."
-				if qtprocessbar:
-					qtprocessbar.setValue(qtprocessbar.value()+int(20/channels))
-					QtGui.QApplication.processEvents()
-		if qtprocessbar:
-			qtprocessbar.setValue(100)
-			QtGui.QApplication.processEvents()
+		if px_info is True:
+			metadata_orig = {'PixelSize': str(pixelsize),'FocusStepSize': str(pixelsizeZ)}
+			metadata_int = {'PixelSize': str(pixelsize),'FocusStepSize': str(ss_out/1000)}
+		else:
+			metadata_orig, metadata_int = None, None
+		jobs = []
+		for i in sorted(filelists):
+			jobs.append((
+				img_path, i, filelists[i], ss_in, ss_out, interpolationmethod, saveorigstack, showgraph, customSaveDir,
+				metadata_orig, metadata_int, threads, compress, tile))
+		workers = channelWorkers(workers, memorycap, jobs)
+		outputs = []
+		if workers > 1:
+			if debug is True: print clrmsg.DEBUG, "Processing {0} channels with {1} worker processes".format(channels, workers)
+			## No interactive graphs from worker processes
+			jobs = [job[:7]+(False,)+job[8:] for job in jobs]
+			pool = multiprocessing.Pool(processes=workers)
+			try:
+				for done, retVal in enumerate(pool.imap_unordered(processChannelStar, jobs)):
+					if type(retVal) == str:
+						print clrmsg.ERROR, retVal
+						pool.terminate()
+						return retVal
+					outputs.extend(retVal)
+					report(callback, 20+int(80*(done+1)/channels))
+				pool.close()
+			except Cancelled:
+				pool.terminate()
+				raise
+			finally:
+				pool.join()
+		else:
+			for done, job in enumerate(jobs):
+				if debug is True: print clrmsg.DEBUG, "Processing channel {0} of {1}".format(done+1, channels)
+				retVal = processChannel(*job)
+				if type(retVal) == str:
+					print clrmsg.ERROR, retVal
+					return retVal
+				outputs.extend(retVal)
+				report(callback, 20+int(80*(done+1)/channels))
+		report(callback, 100)
+		return sorted(outputs)
+	else:
+		msg = 'ERROR: Path is neither a valid file nor a valid directory!'
+		print clrmsg.ERROR, msg
+		return msg
+
+
+def processChannel(
+		img_path, channel, filelist, ss_in, ss_out, interpolationmethod, saveorigstack, showgraph, customSaveDir,
+		metadata_orig=None, metadata_int=None, threads=4, compress=0, tile=None):
+	"""Process one channel of an image sequence: read the sequence, optionally save the original stack and save
+	the interpolated stack. Returns the written files or an error message string if the interpolation failed.
+
+	The original stack is written in the background while the interpolation is running."""
+	img = readSequence(filelist, threads=threads)
+	## Generate file output name
+	basename = os.path.basename(os.path.normpath(img_path))+"_"+str(channel)
+	file_out_orig = os.path.join(customSaveDir if customSaveDir else img_path, basename+".tif")
+	file_out_int = os.path.join(customSaveDir if customSaveDir else img_path, basename+"_resliced.tif")
+	outputs = []
+	## Possibility to save the image sequence files as one single stack file for easier handling and better overview
+	if saveorigstack is True:
+		if debug is True: print clrmsg.DEBUG, "Saving original image stack as single stack file: {0} |shape: {1}".format(file_out_orig,img.shape)
+		writer = stackWriter.StackWriter(file_out_orig, img.shape, img.dtype, compress, tile, metadata_orig)
+		writer.write(img, copy=False)
+		outputs.append(file_out_orig)
+	else:
+		writer = None
+	## In case only the original image sequence is saved as a single stack file the interpolation is skipped
+	if interpolationmethod == 'none' and showgraph is False:
+		img_int = None
+	else:
+		if debug is True: print clrmsg.DEBUG, "Interpolating..."
+		img_int = interpol(img, ss_in, ss_out, interpolationmethod, showgraph)
+	if writer:
+		writer.close()
+		if debug is True: print clrmsg.DEBUG, "Original image stack saved."
+	## Error handling from 'interpol' function
+	if type(img_int) == str:
+		return img_int
+	elif img_int is not None:
+		if debug is True: print clrmsg.DEBUG, "Saving interpolated stack as: ", file_out_int
+		stackWriter.saveStack(file_out_int, img_int, metadata=metadata_int, compress=compress, tile=tile)
+		outputs.append(file_out_int)
+		if debug is True: print clrmsg.DEBUG, "		...done."
+	return outputs
+
+
+def cacheStore(cachekey, file_out, cache, **info):
+	"""Add a resliced stack to the cache. Failing to do so (e.g. disk full) is not fatal."""
+	try:
+		stackCache.store(cachekey, file_out, cache if isinstance(cache, str) else None, **info)
+	except (IOError, OSError) as e:
+		print clrmsg.WARNING, "Could not add resliced stack to cache:", e
+
+
+def saveHyperstack(file_out, img, img_path, ss_out):
+	"""Save a c,z,y,x stack as ImageJ hyperstack
+
+	ImageJ stores hyperstacks in t,z,c,y,x order, the stack is written as z,c,y,x and read back as c,z,y,x by
+	readStack.
+	The pixel size of img_path is stored as resolution (pixels per micron) for ImageJ and, like for single
+	channel stacks, together with the focus step size as PixelSize/FocusStepSize in the image description.
+	"""
+	metadata = {'FocusStepSize': str(ss_out/1000)}
+	kwargs = {}
+	try:
+		meta = tiffMetadata.read(img_path)
+	except Exception as e:
+		print clrmsg.ERROR, 'Error while adding pixel size information:', e, '... skipping'
+		meta = {'pixelSize': None}
+	if meta['pixelSize']:
+		pixelsize = meta['pixelSize']*1E6 if meta['pixelSizeUnit'] == 'm' else meta['pixelSize']
+		metadata.update({'PixelSize': str(pixelsize), 'unit': 'micron'})
+		kwargs['resolution'] = (1/pixelsize, 1/pixelsize)
+	tf.imsave(file_out, img.transpose(1, 0, 2, 3), imagej=True, metadata=metadata, **kwargs)
+
+
+def readStack(img_path):
+	"""Read a tiff file like tf.imread, but return ImageJ hyperstacks (z,c,y,x) as c,z,y,x like all other
+	multichannel stacks."""
+	with tf.TiffFile(img_path) as tif:
+		img = tif.asarray()
+		if img.ndim == 4 and tif.series[0].axes == 'ZCYX':
+			img = np.ascontiguousarray(img.transpose(1, 0, 2, 3))
+	return img
+
+
+def sequenceIndex(dirpath):
+	"""Index a FEI MAPS/LA image sequence directory in one pass.
+
+	File names look like 'Tile_XXX-YYY-ZZZ_C-000.tif' where XXX-YYY is the tile, ZZZ the z slice and C the
+	channel. Returns a dictionary mapping (tile, channel, z) to the file path. Files not following the naming
+	scheme are ignored.
+	"""
+	index = {}
+	for filename in os.listdir(dirpath):
+		match = SEQUENCEPATTERN.match(filename)
+		if match:
+			tile, z, channel = match.group(1), int(match.group(2)), int(match.group(3))
+			index[(tile, channel, z)] = os.path.join(dirpath, filename)
+	return index
+
+
+def sequenceChannels(index):
+	"""Return a dictionary mapping every channel of a sequence index to its file paths, ordered by tile and z"""
+	filelists = {}
+	for tile, channel, z in sorted(index):
+		filelists.setdefault(channel, []).append(index[(tile, channel, z)])
+	return filelists
+
+
+def readSequence(filelist, threads=4):
+	"""Read an image sequence into one stack.
+
+	The stack is allocated once from the shape of the first image and the slices are decoded into it by a pool of
+	threads (file reading and decoding release the GIL).
+	"""
+	## Default pattern is not compatible with OME header from FEI MAPS/Live Acquisition Software
+	first = tf.imread(filelist[0], pattern='')
+	img = np.empty((len(filelist),)+first.shape, first.dtype)
+	img[0] = first
+
+	def readSlice(i):
+		img[i] = tf.imread(filelist[i], pattern='')
+
+	if threads > 1 and len(filelist) > 2:
+		pool = ThreadPool(min(threads, len(filelist)-1))
+		try:
+			pool.map(readSlice, range(1, len(filelist)))
+		finally:
+			pool.close()
+			pool.join()
 	else:
-		print clrmsg.ERROR, 'ERROR: Path is neither a valid file nor a valid directory!'
+		for i in range(1, len(filelist)):
+			readSlice(i)
+	return img
+
+
+def processChannelStar(args):
+	"""multiprocessing.Pool helper, unpacks the arguments for processChannel"""
+	return processChannel(*args)
+
+
+def channelWorkers(workers, memorycap, jobs):
+	"""Number of worker processes for processing channels concurrently.
+
+	The memory footprint of one channel is estimated from the file sizes of its image sequence plus the
+	interpolated stack. memorycap is given in MB, None means no limit."""
+	workers = max(1, min(workers, len(jobs), multiprocessing.cpu_count()))
+	if workers > 1 and memorycap:
+		img_path, channel, filelist, ss_in, ss_out, interpolationmethod = jobs[0][:6]
+		footprint = sum(os.path.getsize(filename) for filename in filelist)
+		if interpolationmethod != 'none':
+			footprint *= 1+float(ss_in)/ss_out
+		workers = max(1, min(workers, int(memorycap*2**20/max(footprint, 1))))
+	return workers
+
+
+class Cancelled(Exception):
+	"""Raised when a progress callback requests to cancel processing"""
+	pass
+
+
+def report(callback, value):
+	"""Report the progress in percent (0-100) to callback
+
+	Progress callbacks are plain callables taking the progress value, so they work with any GUI toolkit, from a
+	worker thread or on the command line. A callback returning True requests to cancel processing: Cancelled is
+	raised at the next progress report and files already opened for writing are closed (and stay incomplete).
+	"""
+	if callback and callback(value) is True:
+		raise Cancelled("Processing cancelled at {0}%".format(int(value)))
+
+
+def subProgress(callback, start, stop):
+	"""Return a callback mapping the progress (0-100) of a processing step onto start-stop of callback"""
+	if not callback:
+		return None
+	return lambda value: callback(start+(stop-start)*value/100.)
+
+
+def qtProgress(qtprocessbar):
+	"""Return a progress callback forwarding values (0-100) to a Qt progress bar.
+
+	Only for processing on the GUI thread: events are processed whenever the displayed value changes. Background
+	workers forward the progress to the GUI thread instead (see TDCT_main.Worker).
+	"""
+	def callback(value):
+		if int(value) != qtprocessbar.value():
+			qtprocessbar.setValue(int(value))
+			QtGui.QApplication.processEvents()
+	return callback
 
 
 def pxSize(img_path,z=False):
 	"""Extract pixel size from meta/exif data. Tailored for image headers from FEI dual beam electron microscopes
-	and CorrSight light microscope"""
-	with tf.TiffFile(img_path) as tif:
-		for page in tif:
-			for tag in page.tags.values():
-				if isinstance(tag.value, str):
-					for keyword in ['PhysicalSizeX','PixelWidth','PixelSize'] if not z else ['PhysicalSizeZ','FocusStepSize']:
-						tagposs = [m.start() for m in re.finditer(keyword, tag.value)]
-						for tagpos in tagposs:
-							if keyword == 'PhysicalSizeX' or keyword == 'PhysicalSizeZ':
-								for piece in tag.value[tagpos:tagpos+30].split('"'):
-									try:
-										pixelsize = float(piece)
-										return pixelsize
-									except:
-										pass
-							elif keyword == 'PixelWidth':
-								for piece in tag.value[tagpos:tagpos+30].split('='):
-									try:
-										try:
-											pixelsize = float(piece.strip().split('\r\n')[0])
-										except:
-											pixelsize = float(piece.strip().split(r'\r\n')[0])
-										return pixelsize
-									except:
-										pass
-							elif keyword == 'PixelSize' or 'FocusStepSize':
-								for piece in tag.value[tagpos:tagpos+30].split('"'):
-									try:
-										pixelsize = float(piece)
-										return pixelsize
-									except:
-										pass
-
-
-def interpol(img, ss_in, ss_out, interpolationmethod, showgraph):
-	"""Main function for interpolating image stacks via polyfit"""
+	and CorrSight light microscope. The header is parsed once per file, see tiffMetadata."""
+	return tiffMetadata.pxSize(img_path,z=z)
+
+
+def interpol(img, ss_in, ss_out, interpolationmethod, showgraph, threads=4, callback=None):
+	"""Main function for interpolating image stacks via polyfit
+
+	Multichannel stacks in the form of c,z,y,x are resliced into one c,z,y,x stack. All channels share the same
+	slice positions (and linear weight table) and up to threads channels are interpolated in parallel.
+	callback is called with the progress in percent (0-100) while interpolating and can cancel it, see report.
+	"""
 	## Depending on tiff format the file can have different shapes; e.g. z,y,x or c,z,y,x
 	if len(img.shape) == 4 and img.shape[0] == 1:
 		img = np.squeeze(img, axis=0)
-	elif len(img.shape) == 4 and img.shape[0] > 1:
-		return "ERROR: I'm sorry, I cannot handle multichannel files: "+str(img.shape)
 
-	if len(img.shape) == 3:
+	if len(img.shape) in [3, 4]:
 		## Number of slices in original stack
-		sl_in = img.shape[0]
+		sl_in = img.shape[-3]
 		## Number of slices in interpolated stack
 		# Discarding last data point. e.g. 56 in i.e.
 		# 55 steps * (309 nm original spacing / 161.25 nm new spacing) = 105.39 -> int() = 105 + 1 = 106
 		sl_out = int((sl_in-1)*(ss_in/ss_out)) + 1
 		## Interpolate image stack shape
-		img_int_shape = (sl_out, img.shape[1], img.shape[2])
+		img_int_shape = img.shape[:-3] + (sl_out, img.shape[-2], img.shape[-1])
 	else:
-		return "ERROR: I only know tiff stack image formats in z,y,x or c,z,y,x with one channel"
+		return "ERROR: I only know tiff stack image formats in z,y,x or c,z,y,x"
 
 	if showgraph is True:
 		if __name__ == '__main__':
-			showgraph_(img, ss_in, ss_out, sl_in, sl_out, block=False)
+			showgraph_(img if img.ndim == 3 else img[0], ss_in, ss_out, sl_in, sl_out, block=False)
 		else:
-			showgraph_(img, ss_in, ss_out, sl_in, sl_out, block=True)
+			showgraph_(img if img.ndim == 3 else img[0], ss_in, ss_out, sl_in, sl_out, block=True)
 	if interpolationmethod == 'none':
 		return None
 	elif interpolationmethod == 'linear':
 		if debug is True: print clrmsg.DEBUG, "Nr. of slices (in/out): ", sl_in, sl_out
-		return linear(img, img_int_shape, ss_in, ss_out, sl_in, sl_out)
+		weights = linearWeights(sl_in, ss_in, ss_out)
+		interpolate_ = lambda img, out, callback: linear(
+			img, out.shape, ss_in, ss_out, sl_in, sl_out, weights=weights, out=out, callback=callback)
+	elif interpolationmethod in KERNELS:
+		if debug is True: print clrmsg.DEBUG, "Nr. of slices (in/out): ", sl_in, sl_out
+		weights = kernelWeights(sl_in, ss_in, ss_out, interpolationmethod)
+		interpolate_ = lambda img, out, callback: convolve(
+			img, out.shape, ss_in, ss_out, sl_in, sl_out, weights=weights, out=out, callback=callback)
 	elif interpolationmethod == 'spline':
 		if debug is True: print clrmsg.DEBUG, "Nr. of slices (in/out): ", sl_in, sl_out
-		return spline(img, img_int_shape, ss_in, ss_out, sl_in, sl_out)
+		interpolate_ = lambda img, out, callback: spline(
+			img, out.shape, ss_in, ss_out, sl_in, sl_out, out=out, callback=callback)
 	else:
-		return "Please specify the interpolation method ('linear', 'spline', 'none')."
+		return "Please specify the interpolation method ('linear', 'cubic', 'lanczos', 'spline', 'none')."
+
+	img_int = np.zeros(img_int_shape,img.dtype)
+	if img.ndim == 3:
+		return interpolate_(img, img_int, callback)
+	if debug is True: print clrmsg.DEBUG, "Interpolating {0} channels".format(img.shape[0])
+	## The progress of all channels is the mean of the channel progresses
+	progress = [0]*img.shape[0]
+
+	def channelProgress(c):
+		if not callback:
+			return None
+
+		def channelCallback(value):
+			progress[c] = value
+			return callback(sum(progress)/len(progress))
+		return channelCallback
+	pool = ThreadPool(max(1, min(threads, img.shape[0])))
+	try:
+		pool.map(lambda c: interpolate_(img[c], img_int[c], channelProgress(c)), range(img.shape[0]))
+	finally:
+		pool.close()
+		pool.join()
+	return img_int
 
 
 def showgraph_(img, ss_in, ss_out, sl_in, sl_out, block=True):
@@ -369,67 +607,485 @@ def showgraph_(img, ss_in, ss_out, sl_in, sl_out, block=True):
 	plt.show(block)
 
 
-def spline(img, img_int_shape, ss_in, ss_out, sl_in, sl_out):
+def spline(img, img_int_shape, ss_in, ss_out, sl_in, sl_out, tilesize=256, out=None, callback=None):
 	"""
 	Spline interpolation
 
-	# possible depricated due to changes in code -> marked for futur code changes
+	Cubic splines (not-a-knot, same as InterpolatedUnivariateSpline with k=3) are fitted and evaluated along z
+	for a whole xy tile at once instead of creating one spline object per pixel.
+
 	ss_in : step size input stack
 	ss_out : step size output stack
 	sl_in : slices input stack
 	sl_out : slices output stack
+	tilesize : edge length of the xy tiles processed in one go
+	out : preallocated output stack, a new one is created if None
+	callback : called with the progress in percent (0-100) after every row of tiles, see report
 	"""
 	## Known x values in interpolated stack size.
-	zx = np.arange(0,sl_out,ss_in/ss_out)
+	zx = np.arange(sl_in)*(ss_in/ss_out)
 	zxnew = np.arange(0, (sl_in-1)*ss_in/ss_out, 1)  # First slice of original and interpolated are both 0. n-1 to discard last slice
-	if ss_in/ss_out < 1.0:
-		zx_mod = []
-		for i in range(img.shape[0]):
-			zx_mod.append(zx[i])
-		zx = zx_mod
 
 	## Create new numpy array for the interpolated image stack
-	img_int = np.zeros(img_int_shape,img.dtype)
+	img_int = np.zeros(img_int_shape,img.dtype) if out is None else out
 	if debug is True: print clrmsg.DEBUG, "Interpolated stack shape: ", img_int.shape
 
-	r_sl_out = range(sl_out)
-
 	ping = time.time()
-	for px in range(img.shape[-1]):
-		for py in range(img.shape[-2]):
-			spl = interpolate.InterpolatedUnivariateSpline(zx, img[:,py,px])
-			np.put(img_int[:,py,px], r_sl_out, spl(zxnew))
-		sys.stdout.write("\r%d%%" % int(px*100/img.shape[-1]))
+	for py in range(0, img.shape[-2], tilesize):
+		for px in range(0, img.shape[-1], tilesize):
+			tile = img[:, py:py+tilesize, px:px+tilesize]
+			spl = interpolate.CubicSpline(zx, tile, axis=0)
+			castDtype(spl(zxnew), img_int[:len(zxnew), py:py+tilesize, px:px+tilesize])
+		sys.stdout.write("\r%d%%" % int(min(py+tilesize, img.shape[-2])*100/img.shape[-2]))
 		sys.stdout.flush()
+		report(callback, 100.*min(py+tilesize, img.shape[-2])/img.shape[-2])
 	pong = time.time()
 	if debug is True: print clrmsg.DEBUG, "This interpolation took {0} seconds".format(pong - ping)
 	return img_int
 
 
-def linear(img, img_int_shape, ss_in, ss_out, sl_in, sl_out):
-	"""Linear interpolation"""
+def linear(img, img_int_shape, ss_in, ss_out, sl_in, sl_out, weights=None, out=None, callback=None):
+	"""Linear interpolation
+
+	Every interpolated slice is accumulated from its two neighbouring input slices in a preallocated float32
+	buffer (float64 for float64 stacks) and rounded back into the output stack.
+
+	weights : precomputed table from linearWeights (e.g. shared by all channels of a stack)
+	out : preallocated output stack, a new one is created if None
+	callback : called with the progress in percent (0-100) after every slice, see report
+	"""
+	idx, w0, w1 = linearWeights(sl_in, ss_in, ss_out) if weights is None else weights
+
+	## Create new numpy array for the interpolated image stack
+	img_int = np.zeros(img_int_shape,img.dtype) if out is None else out
+	if debug is True: print clrmsg.DEBUG, "Interpolated stack shape: ", img_int.shape
+
+	buf = np.empty(img.shape[1:], np.float64 if img.dtype == np.float64 else np.float32)
+	tmp = np.empty_like(buf)
+	ping = time.time()
+	for sl_counter in range(len(idx)):
+		np.multiply(img[idx[sl_counter]], w0[sl_counter], out=buf)
+		np.multiply(img[idx[sl_counter]+1], w1[sl_counter], out=tmp)
+		buf += tmp
+		castDtype(buf, img_int[sl_counter])
+		report(callback, 100.*(sl_counter+1)/len(idx))
+	pong = time.time()
+	if debug is True: print clrmsg.DEBUG, "This interpolation took {0} seconds".format(pong - ping)
+	return img_int
+
+
+def linearWeights(sl_in, ss_in, ss_out):
+	"""Precompute the linear interpolation table
+
+	Returns the index of the lower input slice and the weights of the lower (w0) and upper (w1) input slice
+	for every interpolated slice.
+	"""
 	##  Determine interpolated slice positions
 	sl_int = np.arange(0,sl_in-1,ss_out/ss_in)  # sl_in-1 because last slice is discarded (no extrapolation)
+	## Calculate distances from every interpolated image to its next original image
+	idx = sl_int.astype(int)
+	w1 = (sl_int-idx).astype(np.float32)
+	w0 = (1-w1).astype(np.float32)
+	return idx, w0, w1
+
+
+def convolve(img, img_int_shape, ss_in, ss_out, sl_in, sl_out, kernel='cubic', weights=None, out=None, callback=None):
+	"""Interpolation with a separable kernel (see kernelWeights)
+
+	Every interpolated slice is the weighted sum of its neighbouring input slices (4 for 'cubic', 6 for
+	'lanczos'), accumulated in a preallocated float32 buffer (float64 for float64 stacks) and rounded and clipped
+	back into the output stack.
+
+	weights : precomputed table from kernelWeights (e.g. shared by all channels of a stack)
+	out : preallocated output stack, a new one is created if None
+	callback : called with the progress in percent (0-100) after every slice, see report
+	"""
+	idx, w = kernelWeights(sl_in, ss_in, ss_out, kernel) if weights is None else weights
 
 	## Create new numpy array for the interpolated image stack
-	img_int = np.zeros(img_int_shape,img.dtype)
+	img_int = np.zeros(img_int_shape,img.dtype) if out is None else out
 	if debug is True: print clrmsg.DEBUG, "Interpolated stack shape: ", img_int.shape
 
-	## Calculate distances from every interpolated image to its next original image
-	sl_counter = 0
+	buf = np.empty(img.shape[1:], np.float64 if img.dtype == np.float64 else np.float32)
+	tmp = np.empty_like(buf)
 	ping = time.time()
-	for i in sl_int:
-		int_i = int(i)
-		lower = i-int_i
-		upper = 1-(lower)
-		img_int[sl_counter,:,:] = img[int_i,:,:]*upper + img[int_i+1,:,:]*lower
-		sl_counter += 1
+	for sl_counter in range(len(idx)):
+		castDtype(convolveSlice(img.__getitem__, idx[sl_counter], w[sl_counter], buf, tmp), img_int[sl_counter])
+		report(callback, 100.*(sl_counter+1)/len(idx))
 	pong = time.time()
 	if debug is True: print clrmsg.DEBUG, "This interpolation took {0} seconds".format(pong - ping)
 	return img_int
 
 
-def norm_img(img,copy=False,qtprocessbar=None):
+def convolveSlice(getSlice, idx, w, buf, tmp):
+	"""Weighted sum of the input slices idx (fetched with getSlice) into buf"""
+	np.multiply(getSlice(idx[0]), w[0], out=buf)
+	for tap in range(1, len(idx)):
+		if w[tap] != 0:
+			np.multiply(getSlice(idx[tap]), w[tap], out=tmp)
+			buf += tmp
+	return buf
+
+
+def keys(x, a=-0.5):
+	"""Keys cubic convolution kernel"""
+	x = np.abs(x)
+	return np.where(
+		x <= 1, ((a+2)*x-(a+3))*x*x+1,
+		np.where(x < 2, ((a*x-5*a)*x+8*a)*x-4*a, 0))
+
+
+def lanczos(x, a=3):
+	"""Lanczos kernel"""
+	return np.where(np.abs(x) < a, np.sinc(x)*np.sinc(x/a), 0)
+
+
+def triangle(x):
+	"""Linear interpolation kernel"""
+	return np.maximum(1-np.abs(x), 0)
+
+
+## Separable interpolation kernels: function and support (half width in slices)
+KERNELS = {'cubic': (keys, 2), 'lanczos': (lanczos, 3)}
+## All interpolation methods
+METHODS = ['linear', 'cubic', 'lanczos', 'spline']
+
+
+def kernelWeights(sl_in, ss_in, ss_out, kernel):
+	"""Precompute the tap table of a separable interpolation kernel
+
+	kernel : 'cubic' (Keys cubic convolution, a = -0.5, 4 taps) or 'lanczos' (Lanczos-3, 6 taps)
+
+	Returns the input slice indices and their weights, both shaped (interpolated slices, taps). Taps beyond the
+	first/last slice are clamped to it and the weights of every interpolated slice are normalized to a sum of 1.
+	"""
+	## Interpolated slice positions, same as linearWeights
+	return tapWeights(np.arange(0,sl_in-1,ss_out/ss_in), sl_in, kernel)
+
+
+def tapWeights(positions, n_in, kernel, scale=1.):
+	"""Tap table for sampling n_in input samples at positions (in input sample units) with kernel ('linear', 'cubic'
+	or 'lanczos'). Returns indices and weights shaped (positions, taps), see kernelWeights.
+	For downsampling by a factor scale > 1 the kernel is stretched by scale, so it low-pass filters the input to the
+	output sampling rate instead of picking every scale-th sample (aliasing)."""
+	func, support = KERNELS[kernel] if kernel in KERNELS else (triangle, 1)
+	scale = max(float(scale), 1.)
+	reach = int(np.ceil(support*scale))
+	idx = np.floor(positions).astype(int)[:, np.newaxis] + np.arange(1-reach, reach+1)
+	w = func((positions[:, np.newaxis]-idx)/scale)
+	w /= w.sum(axis=1, keepdims=True)
+	return np.clip(idx, 0, n_in-1), w.astype(np.float32)
+
+
+def castDtype(buf, out):
+	"""Write the float array buf into out. For integer types values are rounded and clipped to the range of
+	the data type instead of being truncated or wrapped around. buf is modified in place."""
+	if np.issubdtype(out.dtype, np.integer):
+		np.rint(buf, out=buf)
+		np.clip(buf, np.iinfo(out.dtype).min, np.iinfo(out.dtype).max, out=buf)
+	np.copyto(out, buf, casting='unsafe')
+	return out
+
+
+def stackPages(tif):
+	"""Return the pages of the first image series of an opened TiffFile together with the z,y,x shape they form.
+
+	Single channel stacks in the form of c,z,y,x with c == 1 are treated as z,y,x.
+	Returns an error message string if the series is not a single channel image stack.
+	"""
+	series = tif.series[0]
+	shape = tuple(series.shape)
+	if len(shape) == 4 and shape[0] == 1:
+		shape = shape[1:]
+	if len(shape) != 3 or len(series.pages) != shape[0]:
+		return "ERROR: I only know tiff stack image formats in z,y,x or c,z,y,x with one channel: "+str(series.shape), None
+	return series.pages, shape
+
+
+def interpolStream(
+		img_path, file_out, ss_in, ss_out, interpolationmethod='linear', slabsize=16, metadata=None, halo=4,
+		compress=0, tile=None, callback=None):
+	"""Interpolate an image stack file without loading it as a whole
+
+	Input slices are read page by page when an output slab needs them and are dropped again once no following
+	output slice depends on them. Interpolated slices are appended to file_out as soon as their slab is done.
+	Peak memory therefore scales with slabsize (and halo for 'spline'), not with the stack depth.
+
+	slabsize : number of output slices computed in one go
+	metadata : dict written to the output tiff description (e.g. pixel size)
+	halo : additional input slices on each side of a slab used to fit the cubic spline. The spline is fitted
+		   locally, results deviate slightly from the whole-volume spline (influence decays ~0.27**halo).
+	compress, tile : output format (see stackWriter), slices are written by a background thread
+	callback : called with the progress in percent (0-100), see report
+
+	Returns the shape of the written stack or an error message string.
+	"""
+	if interpolationmethod not in METHODS:
+		return "Please specify the interpolation method ('linear', 'cubic', 'lanczos', 'spline')."
+	with tf.TiffFile(img_path) as tif:
+		pages, shape = stackPages(tif)
+		if type(pages) == str:
+			return pages
+		dtype = tif.series[0].dtype
+		sl_out = int((shape[0]-1)*(ss_in/ss_out)) + 1
+		if debug is True: print clrmsg.DEBUG, "Nr. of slices (in/out): ", shape[0], sl_out
+		ping = time.time()
+		with stackWriter.StackWriter(file_out, (sl_out,)+shape[1:], dtype, compress, tile, metadata) as tif_out:
+			slices = resliceSlices(pages, shape, dtype, ss_in, ss_out, interpolationmethod, slabsize, halo)
+			for z, img_int in enumerate(slices):
+				tif_out.write(img_int)
+				report(callback, 100*(z+1)/sl_out)
+		pong = time.time()
+		if debug is True: print clrmsg.DEBUG, "This interpolation took {0} seconds".format(pong - ping)
+	return (sl_out,)+shape[1:]
+
+
+def resliceSlices(pages, shape, dtype, ss_in, ss_out, interpolationmethod='linear', slabsize=16, halo=4):
+	"""Generator yielding the interpolated slices of a stack given as tiff pages (see stackPages)
+
+	The yielded array is reused for the next slice, copy it if it is needed longer. See interpolStream for
+	slabsize and halo.
+	"""
+	sl_in = shape[0]
+	sl_out = int((sl_in-1)*(ss_in/ss_out)) + 1
+	## Output slice positions in input slice units, same as the in memory interpolation
+	idx, w0, w1 = linearWeights(sl_in, ss_in, ss_out)
+	if interpolationmethod in KERNELS:
+		taps, w = kernelWeights(sl_in, ss_in, ss_out, interpolationmethod)
+	sl_int = np.arange(0,sl_in-1,ss_out/ss_in)
+	img_int = np.empty(shape[1:], dtype)
+	buf = np.empty(shape[1:], np.float64 if dtype == np.float64 else np.float32)
+	tmp = np.empty_like(buf)
+	cache = {}
+
+	def getSlice(i):
+		if i not in cache:
+			cache[i] = pages[i].asarray()
+		return cache[i]
+
+	for start in range(0, len(sl_int), slabsize):
+		sl_slab = sl_int[start:start+slabsize]
+		lo = int(sl_slab[0])
+		hi = min(int(sl_slab[-1])+1, sl_in-1)
+		if interpolationmethod == 'spline':
+			lo, hi = max(0, lo-halo), min(sl_in-1, hi+halo)
+		elif interpolationmethod in KERNELS:
+			lo = taps[start:start+slabsize].min()
+		## Release input slices no longer needed
+		for i in [i for i in cache if i < lo]:
+			del cache[i]
+		if interpolationmethod == 'linear':
+			for sl_counter in range(start, start+len(sl_slab)):
+				np.multiply(getSlice(idx[sl_counter]), w0[sl_counter], out=buf)
+				np.multiply(getSlice(idx[sl_counter]+1), w1[sl_counter], out=tmp)
+				buf += tmp
+				yield castDtype(buf, img_int)
+		elif interpolationmethod in KERNELS:
+			for sl_counter in range(start, start+len(sl_slab)):
+				yield castDtype(convolveSlice(getSlice, taps[sl_counter], w[sl_counter], buf, tmp), img_int)
+		else:
+			slab = np.array([getSlice(i) for i in range(lo, hi+1)])
+			slab_int = interpolate.CubicSpline(np.arange(lo, hi+1), slab, axis=0)(sl_slab)
+			for sl in slab_int:
+				yield castDtype(sl, img_int)
+	## Keep the shape of the in memory interpolation (slices without input data stay empty)
+	img_int[:] = 0
+	for i in range(sl_out-len(sl_int)):
+		yield img_int
+
+
+def isotropic(
+		img_path, voxelsize=None, ss_in=None, pixelsize=None, interpolationmethod='linear', customSaveDir=None,
+		slabsize=16, tilesize=256, compress=0, tile=None, callback=None):
+	"""Resample an image stack file to isotropic (cube) voxels in z, y and x
+
+	z is resampled page by page and slab by slab like in interpolStream. Every resampled slice is then resampled
+	in y and x in tiles of tilesize x tilesize output pixels, each tile only reading the input pixels its taps
+	reach (the halo, see resampleXY). Memory stays bounded by a few slices, independent of the stack size.
+
+	voxelsize : edge length of the output voxels in nm, default is the xy pixel size (only z is resampled then)
+	ss_in : focus step size of the stack in nm, read from the tiff metadata if None
+	pixelsize : xy pixel size of the stack in nm, read from the tiff metadata if None
+	interpolationmethod : 'linear', 'cubic', 'lanczos' or 'spline' (spline is used in z only, xy uses 'cubic')
+	compress, tile : output format (see stackWriter)
+	callback : called with the progress in percent (0-100), see report
+
+	The result is saved as <name>_isotropic.tif. Returns the list of written files or an error message string.
+	"""
+	if interpolationmethod not in METHODS:
+		return "Please specify the interpolation method ('linear', 'cubic', 'lanczos', 'spline')."
+	if ss_in is None or pixelsize is None:
+		try:
+			meta = tiffMetadata.read(img_path)
+		except Exception as e:
+			return "ERROR: Unable to read the pixel size: {0}".format(e)
+		if ss_in is None:
+			if meta['focusStep'] is None:
+				return "ERROR: No focus step size information found, please specify ss_in."
+			## focus step size is stored in um
+			ss_in = meta['focusStep']*1000
+		if pixelsize is None:
+			if meta['pixelSize'] is None:
+				return "ERROR: No xy pixel size information found, please specify pixelsize."
+			pixelsize = meta['pixelSize']*(1E9 if meta['pixelSizeUnit'] == 'm' else 1000)
+	ss_in, pixelsize = float(ss_in), float(pixelsize)
+	voxelsize = pixelsize if voxelsize is None else float(voxelsize)
+	if debug is True: print clrmsg.DEBUG, "Voxel size in/out (z, xy, nm):", ss_in, pixelsize, voxelsize
+	fpath, fname = os.path.split(img_path)
+	file_out = os.path.join(customSaveDir if customSaveDir else fpath, os.path.splitext(fname)[0]+"_isotropic.tif")
+	kernel = 'cubic' if interpolationmethod == 'spline' else interpolationmethod
+
+	with tf.TiffFile(img_path) as tif:
+		pages, shape = stackPages(tif)
+		if type(pages) == str:
+			return pages
+		dtype = tif.series[0].dtype
+		sl_out = int((shape[0]-1)*(ss_in/voxelsize)) + 1
+		## Output pixel positions in input pixel units, the kernels are widened for downsampling (antialiasing)
+		ytable = tapWeights(
+			np.arange(int((shape[1]-1)*pixelsize/voxelsize)+1)*(voxelsize/pixelsize), shape[1], kernel,
+			scale=voxelsize/pixelsize)
+		xtable = tapWeights(
+			np.arange(int((shape[2]-1)*pixelsize/voxelsize)+1)*(voxelsize/pixelsize), shape[2], kernel,
+			scale=voxelsize/pixelsize)
+		shape_out = (sl_out, len(ytable[0]), len(xtable[0]))
+		if debug is True: print clrmsg.DEBUG, "Stack shape in/out:", shape, shape_out
+		metadata = {'PixelSize': str(voxelsize/1000), 'FocusStepSize': str(voxelsize/1000)}
+		img_out = np.empty(shape_out[1:], dtype)
+		ping = time.time()
+		with stackWriter.StackWriter(file_out, shape_out, dtype, compress, tile, metadata) as writer:
+			slices = resliceSlices(pages, shape, dtype, ss_in, voxelsize, interpolationmethod, slabsize)
+			for z, img in enumerate(slices):
+				if pixelsize == voxelsize:
+					writer.write(img)
+				else:
+					writer.write(resampleXY(img, ytable, xtable, img_out, tilesize))
+				report(callback, 100*(z+1)/sl_out)
+		pong = time.time()
+		if debug is True: print clrmsg.DEBUG, "Isotropic resampling took {0} seconds".format(pong - ping)
+	return [file_out]
+
+
+def resampleXY(img, ytable, xtable, out, tilesize=256):
+	"""Resample a y,x image with the tap tables ytable and xtable (see tapWeights) into out
+
+	out is computed in tiles of tilesize x tilesize pixels. Each tile reads only the input region its taps reach,
+	i.e. the input tile plus a halo of up to 3 pixels ('lanczos') times the downsampling factor, and applies the y
+	and x taps by broadcasting.
+	"""
+	yidx, yw = ytable
+	xidx, xw = xtable
+	ftype = np.float64 if img.dtype == np.float64 else np.float32
+	for ty in range(0, out.shape[0], tilesize):
+		rows, rw = yidx[ty:ty+tilesize], yw[ty:ty+tilesize]
+		top, bottom = rows.min(), rows.max()+1
+		for tx in range(0, out.shape[1], tilesize):
+			cols, cw = xidx[tx:tx+tilesize], xw[tx:tx+tilesize]
+			left, right = cols.min(), cols.max()+1
+			region = img[top:bottom, left:right].astype(ftype)
+			## y taps: (rows, taps, columns) -> (rows, columns), then x taps: (rows, columns, taps) -> (rows, columns)
+			band = (region[rows-top]*rw[:, :, np.newaxis]).sum(axis=1)
+			castDtype((band[:, cols-left]*cw[np.newaxis]).sum(axis=2), out[ty:ty+len(rows), tx:tx+len(cols)])
+	return out
+
+
+## Stages of pipeline in processing order
+STAGES = ['reslice', 'normalize', 'mip']
+
+
+def pipeline(
+		img_path, stages=('reslice', 'normalize', 'mip'), ss_in=None, ss_out=None, interpolationmethod='linear',
+		customSaveDir=None, normalizemip=False, slabsize=16, halo=4, callback=None, compress=0, tile=None):
+	"""Reslice, normalize and/or create a MIP of an image stack file in a single pass
+
+	The stack is read once, page by page, and every slice is streamed through the selected stages in the order
+	reslice -> normalize -> mip. Every stage writes its own output file, named as if the stages had been run one
+	after the other on the output of the previous one (e.g. stack_resliced.tif, norm_stack_resliced.tif and
+	MIP_norm_stack_resliced.tif). The results are the same for 'linear', 'cubic' and 'lanczos'. 'spline' is fitted
+	per slab plus halo and deviates slightly from the whole-volume spline of main (see interpolStream). Only the
+	current slab and the projection are held in memory.
+
+	stages : any of 'reslice', 'normalize' and 'mip'
+	ss_in, ss_out, interpolationmethod : see main, needed for 'reslice' ('linear', 'cubic', 'lanczos' or 'spline')
+	normalizemip : normalize the MIP itself (see mip)
+	slabsize, halo : see interpolStream
+	compress, tile : format of the stack outputs (see stackWriter), each one is written by its own thread
+	callback : called with the progress in percent (0-100), see report
+
+	Only single channel (z,y,x) stacks are supported. Returns the list of written files or an error message string.
+	"""
+	for stage in stages:
+		if stage not in STAGES:
+			return "ERROR: Unknown stage '{0}' ('reslice', 'normalize', 'mip').".format(stage)
+	if 'reslice' in stages:
+		if ss_in is None or ss_out is None:
+			return "ERROR: Reslicing needs the focus step size of the original and resliced stack (ss_in, ss_out)."
+		if interpolationmethod not in METHODS:
+			return "Please specify the interpolation method ('linear', 'cubic', 'lanczos', 'spline')."
+	fpath, fname = os.path.split(img_path)
+	outdir = customSaveDir if customSaveDir else fpath
+	files = {}
+	if 'reslice' in stages:
+		fname = os.path.splitext(fname)[0]+"_resliced.tif"
+		files['reslice'] = os.path.join(outdir, fname)
+	if 'normalize' in stages:
+		fname = "norm_"+fname
+		files['normalize'] = os.path.join(outdir, fname)
+	if 'mip' in stages:
+		files['mip'] = os.path.join(outdir, ("MIP_norm_" if normalizemip else "MIP_")+fname)
+	metadata = None
+	if 'reslice' in stages:
+		try:
+			pixelsize = pxSize(img_path)
+			if pixelsize is not None:
+				metadata = {'PixelSize': str(pixelsize),'FocusStepSize': str(ss_out/1000)}
+		except Exception as e:
+			print clrmsg.ERROR, 'Error while adding pixel size information:', e, '... skipping'
+
+	with tf.TiffFile(img_path) as tif:
+		pages, shape = stackPages(tif)
+		if type(pages) == str:
+			return pages
+		dtype = tif.series[0].dtype
+		if 'reslice' in stages:
+			slices = resliceSlices(pages, shape, dtype, ss_in, ss_out, interpolationmethod, slabsize, halo)
+			shape = (int((shape[0]-1)*(ss_in/ss_out)) + 1,)+shape[1:]
+		else:
+			slices = (page.asarray() for page in pages)
+		writers = dict(
+			(stage, stackWriter.StackWriter(files[stage], shape, dtype, compress, tile, metadata))
+			for stage in ['reslice', 'normalize'] if stage in stages)
+		ping = time.time()
+		try:
+			for z, img in enumerate(slices):
+				if 'reslice' in writers:
+					writers['reslice'].write(img)
+				if 'normalize' in writers:
+					img = norm_img(img, copy=True)
+					writers['normalize'].write(img, copy=False)
+				if 'mip' in stages:
+					if z == 0:
+						img_mip = np.array(img)
+					else:
+						np.maximum(img_mip, img, out=img_mip)
+				report(callback, 100*(z+1)/shape[0])
+		except:
+			exc_info = sys.exc_info()
+			for writer in writers.values():
+				writer.__exit__(*exc_info)
+			raise exc_info[0], exc_info[1], exc_info[2]
+		for writer in writers.values():
+			writer.close()
+		pong = time.time()
+		if debug is True: print clrmsg.DEBUG, "The pipeline {0} took {1} seconds".format(stages, pong - ping)
+	if 'mip' in stages:
+		if normalizemip:
+			img_mip = norm_img(img_mip)
+		tf.imsave(files['mip'], img_mip)
+	return [files[stage] for stage in STAGES if stage in stages]
+
+
+def norm_img(img,copy=False,qtprocessbar=None,chunksize=16,callback=None):
 	"""Normalizing image
 
 	Supported data types are (u)int8, (u)int16, float32 and float64.
@@ -440,73 +1096,67 @@ def norm_img(img,copy=False,qtprocessbar=None):
 	[z,y,x]
 	[z,c,y,x]
 	[c,z,y,x]
+
+	Every 2D plane (every channel of y,x,c images) is scaled to the full range of the data type (1 for float). The
+	maxima are computed in one pass and applied by broadcasting, chunksize slices along the first axis at a time.
+	Integer results are rounded and saturated. img is normalized in place unless copy is True or img is read-only.
+	callback is called with the progress in percent (0-100), see report.
 	"""
-	if copy is True:
-		img = np.copy(img)
-	else:
-		# quick bug fix for immutable numpy array read-only error
+	if callback is None and qtprocessbar:
+		callback = qtProgress(qtprocessbar)
+	if copy is True or not img.flags.writeable:
 		img = np.copy(img)
 	dtype = str(img.dtype)
-	if dtype == "uint16" or dtype == "int16": typesize = 65535
-	elif dtype == "uint8" or dtype == "int8": typesize = 255
+	if dtype in ["uint16", "int16", "uint8", "int8"]: typesize = np.iinfo(img.dtype).max
 	elif dtype == "float32" or dtype == "float64": typesize = 1
-	else: print clrmsg.ERROR, "Sorry, I don't know this file type yet: ", dtype
+	else:
+		print clrmsg.ERROR, "Sorry, I don't know this file type yet: ", dtype
+		return img
 	if debug is True: print clrmsg.DEBUG, "Shape/type:", img.shape, dtype
 	## 2D image
 	if img.ndim == 2:
 		if debug is True: print clrmsg.DEBUG, "2D image"
-		img *= typesize/img.max()
+		axis = (0,1)
 	## 3D or multichannel image
 	elif img.ndim == 3:
 		## tiffimage reads z,y,x for stacks but y,x,c if it is multichannel image (or z,c,y,x if it is a multicolor image stack)
 		if img.shape[-1] > 4:
 			if debug is True: print clrmsg.DEBUG, "Image stack"
-			if qtprocessbar:
-				maximum = int(int(img.shape[0])*1.25)
-				qtprocessbar.setMaximum(maximum)
-				qtprocessbar.setValue(maximum*0.1)
-				QtGui.QApplication.processEvents()
-			for i in range(int(img.shape[0])):
-				img[i,:,:] *= typesize/img[i,:,:].max()
-				if qtprocessbar:
-					qtprocessbar.setValue(qtprocessbar.value()+1)
-					QtGui.QApplication.processEvents()
+			axis = (1,2)
 		else:
 			if debug is True: print clrmsg.DEBUG, "Multichannel image"
-			if qtprocessbar:
-				maximum = int(int(img.shape[2])*1.25)
-				qtprocessbar.setMaximum(maximum)
-				qtprocessbar.setValue(maximum*0.1)
-				QtGui.QApplication.processEvents()
-			for i in range(int(img.shape[2])):
-				img[:,:,i] *= typesize/img[:,:,i].max()
-				if qtprocessbar:
-					qtprocessbar.setValue(qtprocessbar.value()+1)
-					QtGui.QApplication.processEvents()
+			axis = (0,1)
 	## 3D and multichannel image
-	elif len(img.shape) == 4:
+	elif img.ndim == 4:
 		if debug is True: print clrmsg.DEBUG, "3D and multichannel image"
-		if qtprocessbar:
-			maximum = int((int(img.shape[0])+int(img.shape[1]))*1.25)
-			qtprocessbar.setMaximum(maximum)
-			qtprocessbar.setValue(maximum*0.1)
-			QtGui.QApplication.processEvents()
-		for i in range(int(img.shape[0])):
-			for ii in range(int(img.shape[1])):
-				img[i,ii,:,:] *= typesize/img[i,ii,:,:].max()
-				if qtprocessbar:
-					qtprocessbar.setValue(qtprocessbar.value()+1)
-					QtGui.QApplication.processEvents()
+		axis = (2,3)
+	else:
+		print clrmsg.ERROR, "I'm sorry, I don't know this image shape: {0}".format(img.shape)
+		return img
+	## one maximum per plane/channel, shaped for broadcasting against img
+	scale = np.amax(img, axis=axis, keepdims=True).astype(np.float32)
+	## empty planes stay empty instead of turning into nan
+	scale[scale == 0] = np.inf
+	np.divide(typesize, scale, out=scale)
+	report(callback, 10)
+	for i in range(0, img.shape[0], chunksize):
+		chunk = img[i:i+chunksize]
+		chunkscale = scale[i:i+chunksize] if scale.shape[0] > 1 else scale
+		if img.dtype.kind == 'f':
+			np.multiply(chunk, chunkscale, out=chunk, casting='unsafe')
+		else:
+			castDtype(np.multiply(chunk, chunkscale, dtype=np.float32), chunk)
+		report(callback, 10+90*min(i+chunksize, img.shape[0])/img.shape[0])
 	return img
 
 
-def normalize(path,qtprocessbar=None, customSaveDir=None):
+def normalize(path,qtprocessbar=None, customSaveDir=None, callback=None):
 	if debug is True: print clrmsg.DEBUG, "Normalizing:", path
-	img = tf.imread(path)
-	if qtprocessbar:
-		qtprocessbar.setValue(10)
-		QtGui.QApplication.processEvents()
-	img = norm_img(img,qtprocessbar=qtprocessbar)
+	if callback is None and qtprocessbar:
+		callback = qtProgress(qtprocessbar)
+	img = readStack(path)
+	report(callback, 10)
+	img = norm_img(img,callback=subProgress(callback, 10, 90))
 	fpath,fname = os.path.split(path)
 	fname_norm = os.path.join(fpath,"norm_"+fname)
 	if customSaveDir:
@@ -515,19 +1165,105 @@ def normalize(path,qtprocessbar=None, customSaveDir=None):
 		fname_norm = os.path.join(fpath, "norm_"+fname)
 	if debug is True: print clrmsg.DEBUG, "Saving..."
 	if len(img.shape) == 4:
-		tf.imsave(fname_norm, img, imagej=True)
+		## ImageJ hyperstack order z,c,y,x (see saveHyperstack)
+		tf.imsave(fname_norm, img.transpose(1, 0, 2, 3), imagej=True)
 	else:
 		tf.imsave(fname_norm, img)
+	report(callback, 100)
 	if debug is True: print clrmsg.DEBUG, "		...done"
 	if debug is True: print clrmsg.DEBUG, "Finished normalizing."
 
 
-def mip(path,qtprocessbar=None, customSaveDir=None, normalize=False):
+def projectStack(img_path, stats=('max',), qtprocessbar=None, callback=None):
+	"""Z projections of an image stack file, read page by page
+
+	Every page is folded into running accumulators as soon as it is read, the stack is never held in memory as a
+	whole. Peak memory is one frame plus the requested projections per channel.
+
+	stats : any of
+		'max'		: maximum intensity projection (dtype of the stack)
+		'min'		: minimum intensity projection (dtype of the stack)
+		'mean'		: average intensity projection (float32)
+		'argmax'	: z index of the maximum intensity (uint16), a coarse depth map
+
+	Returns a dictionary of projections with the shape y,x for z,y,x stacks and c,y,x for c,z,y,x stacks
+	(the same layout as np.amax(img, axis=-3)) or an error message string.
+	callback is called with the progress in percent (0-100), see report.
+	"""
+	if callback is None and qtprocessbar:
+		callback = qtProgress(qtprocessbar)
+	for stat in stats:
+		if stat not in ['max', 'min', 'mean', 'argmax']:
+			return "ERROR: Unknown projection '{0}' ('max', 'min', 'mean', 'argmax').".format(stat)
+	with tf.TiffFile(img_path) as tif:
+		series = tif.series[0]
+		shape = tuple(series.shape)
+		if len(shape) == 3:
+			channels, slices = 1, shape[0]
+		elif len(shape) == 4 and series.axes == 'ZCYX':
+			## ImageJ hyperstack, frames are stored z,c
+			slices, channels = shape[0], shape[1]
+		elif len(shape) == 4:
+			channels, slices = shape[0], shape[1]
+		else:
+			return "ERROR: I'm sorry, I don't know this image shape: {0}".format(shape)
+		if series.axes == 'ZCYX':
+			index = lambda c, z: z*channels+c
+		else:
+			index = lambda c, z: c*slices+z
+		if len(series.pages) == channels*slices:
+			frame = lambda c, z: series.pages[index(c, z)].asarray()
+		else:
+			## e.g. ImageJ files with all data in one contiguous page
+			try:
+				data = tif.asarray(memmap=True)
+			except ValueError:
+				## not memory-mappable (compressed)
+				data = tif.asarray()
+			data = data.reshape((channels*slices,)+shape[-2:])
+			frame = lambda c, z: data[index(c, z)]
+		proj = {}
+		for c in range(channels):
+			img = frame(c, 0)
+			if c == 0:
+				proj = {
+					'max': np.empty((channels,)+img.shape, dtype=img.dtype),
+					'min': np.empty((channels,)+img.shape, dtype=img.dtype),
+					'mean': np.empty((channels,)+img.shape, dtype=np.float32),
+					'argmax': np.zeros((channels,)+img.shape, dtype=np.uint16)}
+				proj = dict((stat, proj[stat]) for stat in stats)
+				acc_max = np.empty(img.shape, dtype=img.dtype)
+				acc_sum = np.empty(img.shape, dtype=np.float64)
+				mask = np.empty(img.shape, dtype=bool)
+			acc_max[:] = img
+			if 'min' in proj: proj['min'][c] = img
+			if 'mean' in proj: acc_sum[:] = img
+			for z in range(1, slices):
+				img = frame(c, z)
+				if 'argmax' in proj:
+					np.greater(img, acc_max, out=mask)
+					proj['argmax'][c][mask] = z
+				np.maximum(acc_max, img, out=acc_max)
+				if 'min' in proj: np.minimum(proj['min'][c], img, out=proj['min'][c])
+				if 'mean' in proj: np.add(acc_sum, img, out=acc_sum)
+				report(callback, 100*(c*slices+z+1)/(channels*slices))
+			if 'max' in proj: proj['max'][c] = acc_max
+			if 'mean' in proj: np.divide(acc_sum, slices, out=proj['mean'][c], casting='unsafe')
+	if len(shape) == 3:
+		for stat in proj:
+			proj[stat] = proj[stat][0]
+	return proj
+
+
+def mip(path,qtprocessbar=None, customSaveDir=None, normalize=False, callback=None):
 	if debug is True: print clrmsg.DEBUG, "Creating normalized Maximum Intensity Projection (MIP):", path
-	img = tf.imread(path)
-	if qtprocessbar:
-		qtprocessbar.setValue(10)
-		QtGui.QApplication.processEvents()
+	if callback is None and qtprocessbar:
+		callback = qtProgress(qtprocessbar)
+	img = projectStack(path, callback=subProgress(callback, 0, 90))
+	if type(img) == str:
+		print clrmsg.ERROR, img
+		return img
+	img = img['max']
 	fpath,fname = os.path.split(path)
 	if customSaveDir:
 		fname_mip = os.path.join(customSaveDir, "MIP_"+fname)
@@ -535,23 +1271,65 @@ def mip(path,qtprocessbar=None, customSaveDir=None, normalize=False):
 	else:
 		fname_mip = os.path.join(fpath, "MIP_"+fname)
 		fname_mip_norm = os.path.join(fpath, "MIP_norm_"+fname)
-	if len(img.shape) == 4:
-		img = np.amax(img, axis=1)
-		if normalize:
-			if debug is True: print clrmsg.DEBUG, "Normalizing..."
-			img = norm_img(img)
-		if debug is True: print clrmsg.DEBUG, "Saving..."
-		tf.imsave(fname_mip_norm if normalize else fname_mip, img, imagej=True)
-		if debug is True: print clrmsg.DEBUG, "		...done"
-	elif len(img.shape) == 3:
-		img = np.amax(img, axis=0)
-		if normalize:
-			if debug is True: print clrmsg.DEBUG, "Normalizing..."
-			img = norm_img(img)
-		if debug is True: print clrmsg.DEBUG, "Saving..."
-		tf.imsave(fname_mip_norm if normalize else fname_mip, img)
-		if debug is True: print clrmsg.DEBUG, "		...done"
-	else: print clrmsg.ERROR, "I'm sorry, I don't know this image shape: {0}".format(img.shape)
+	if normalize:
+		if debug is True: print clrmsg.DEBUG, "Normalizing..."
+		img = norm_img(img)
+	if debug is True: print clrmsg.DEBUG, "Saving..."
+	## c,y,x projections of multichannel stacks are saved as ImageJ hyperstack
+	tf.imsave(fname_mip_norm if normalize else fname_mip, img, imagej=img.ndim == 3)
+	report(callback, 100)
+	if debug is True: print clrmsg.DEBUG, "		...done"
+
+
+def depthMap(img, n=3, tilesize=256, callback=None):
+	"""Depth from focus: sub-slice z position and intensity of the maximum of the z profile of every x,y pixel
+
+	img is a z,y,x image stack (numpy.ndarray) or the path to the stack file (memory-mapped if possible)
+	n is the number of slices around the maximum a parabola is fitted to (least squares, see parabolic.polyfit_kernel),
+	3 is the three-point parabola through the maximum and its neighbours (as parabolic.parabolic)
+
+	The stack is processed in y,x tiles of tilesize pixels, every tile with one argmax, one gather of the slices
+	around the maxima and one matrix multiply.
+	Returns the height map (z of the peak) and the peak intensity map (float32, y,x), both nan where the fit window
+	does not fit into the stack (maximum in the first or last n//2 slices) or the profile has no maximum, or an
+	error message string.
+	callback is called with the progress in percent (0-100), see report.
+	"""
+	if isinstance(img, str):
+		with tf.TiffFile(img) as tif:
+			try:
+				img = tif.asarray(memmap=True)
+			except ValueError:
+				## not memory-mappable (compressed)
+				img = tif.asarray()
+	if img.ndim != 3:
+		return "ERROR: I can only handle single channel image stacks (z,y,x), not {0}".format(img.shape)
+	half = n//2
+	if half < 1 or img.shape[0] < 2*half+1:
+		return "ERROR: Can't fit {0} slices of a stack with {1} slices.".format(2*half+1, img.shape[0])
+	kernel = parabolic.polyfit_kernel(2*half+1)
+	offsets = np.arange(-half, half+1)[:, np.newaxis]
+	height = np.full(img.shape[1:], np.nan, dtype=np.float32)
+	peak = np.full(img.shape[1:], np.nan, dtype=np.float32)
+	tiles = [(y, x) for y in range(0, img.shape[1], tilesize) for x in range(0, img.shape[2], tilesize)]
+	for i, (y, x) in enumerate(tiles):
+		tile = img[:, y:y+tilesize, x:x+tilesize]
+		shape = tile.shape[1:]
+		tile = tile.reshape(img.shape[0], -1)
+		k = np.argmax(tile, axis=0)
+		valid = (k >= half) & (k < img.shape[0]-half)
+		k = np.clip(k, half, img.shape[0]-1-half)
+		## slices around the maxima: (n, pixels)
+		a, b, c = kernel.dot(tile[k+offsets, np.arange(tile.shape[1])].astype(np.float64))
+		valid &= a < 0
+		a[~valid] = -1
+		xv = -0.5*b/a
+		yv = a*xv**2+b*xv+c
+		xv[~valid], yv[~valid] = np.nan, np.nan
+		height[y:y+tilesize, x:x+tilesize] = (xv+k).reshape(shape)
+		peak[y:y+tilesize, x:x+tilesize] = yv.reshape(shape)
+		report(callback, 100.*(i+1)/len(tiles))
+	return height, peak
 
 
 if __name__ == '__main__':
@@ -582,7 +1360,7 @@ if __name__ == '__main__':
 	pb_hd.start(10)
 
 	## Set up variables
-	choices = ['linear', 'spline']
+	choices = METHODS
 	int_method = Tkinter.StringVar(root)
 	int_method.set('linear')
 	showgraph = Tkinter.IntVar()
@@ -655,12 +1433,12 @@ if __name__ == '__main__':
 		for filename in files:
 			if filename.endswith('.tif'):
 				print "Normalizing:", filename
-				img = tf.imread(filename)
+				img = readStack(filename)
 				img = norm_img(img)
 				fpath,fname = os.path.split(filename)
 				fname_norm = os.path.join(fpath,"norm_"+fname)
 				if len(img.shape) == 4:
-					tf.imsave(fname_norm, img, imagej=True)
+					tf.imsave(fname_norm, img.transpose(1, 0, 2, 3), imagej=True)
 				else:
 					tf.imsave(fname_norm, img)
 				print "		...done"
@@ -673,31 +1451,20 @@ if __name__ == '__main__':
 		for filename in files:
 			if filename.endswith('.tif'):
 				print "Creating normalized Maximum Intensity Projection (MIP):", filename
-				img = tf.imread(filename)
+				img_MIP = projectStack(filename)
 				fpath,fname = os.path.split(filename)
 				fname_norm = os.path.join(fpath,"MIP_"+fname)
-				if len(img.shape) == 4:
-					img_MIP = np.zeros((img.shape[0],img.shape[2],img.shape[3]), dtype=img.dtype)
-					for i in range(0,img.shape[0]):
-						for ii in range(0,img.shape[2]):
-							for iii in range(0,img.shape[3]):
-								img_MIP[i,ii,iii] = img[i,:,ii,iii].max()
-					img_MIP = norm_img(img_MIP)
-					tf.imsave(fname_norm, img_MIP, imagej=True)
-				elif len(img.shape) == 3:
-					img_MIP = np.zeros((img.shape[1],img.shape[2]), dtype=img.dtype)
-					for i in range(0,img.shape[1]):
-						for ii in range(0,img.shape[2]):
-							img_MIP[i,ii] = img[:,i,ii].max()
-					img_MIP = norm_img(img_MIP)
-					tf.imsave(fname_norm, img_MIP)
-				else: print "I'm sorry, I don't know this image shape: {0}".format(img.shape)
+				if type(img_MIP) == str:
+					print img_MIP
+					continue
+				img_MIP = norm_img(img_MIP['max'])
+				tf.imsave(fname_norm, img_MIP, imagej=img_MIP.ndim == 3)
 				print "		...done"
 		print "Maximum Intensity Projection finished."
 		print "="*40
 
 	## Set up UI elements
-	w = Tkinter.Label(root, text="Interpolation method (linear=fast, spline=slow):")
+	w = Tkinter.Label(root, text="Interpolation method (linear/cubic/lanczos=fast, spline=slow):")
 	w.grid(row=3,column=0,sticky=Tkinter.W)
 	w = Tkinter.OptionMenu(root, int_method, *choices)
 	w.grid(row=4,column=0,sticky=Tkinter.W)
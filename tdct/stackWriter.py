@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Write image stacks slice by slice as (optionally compressed and tiled) tiff or BigTIFF files.
+
+Slices are handed to a background thread that compresses and writes them, so computing the next slices, writing
+other files and the (network) file system I/O overlap. zlib releases the GIL while compressing.
+
+Usage:
+	import stackWriter
+	>>> with stackWriter.StackWriter('stack.tif', shape=(100, 512, 512), dtype='uint16', compress=6) as writer:
+	>>> 	for img in slices:
+	>>> 		writer.write(img)
+
+# @Title			: stackWriter
+# @Project			: 3DCTv2
+# @Description		: Write image stacks slice by slice as compressed/tiled tiff or BigTIFF files
+# @Author			: 3DCT contributors
+# @Email			:
+# @Copyright		: Copyright (C) 2026  3DCT contributors
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		:
+# @Date				: 2026/10
+# @Version			: module rev. 1
+# @Status			: stable
+# @Usage			: import stackWriter
+# 					: >>> writer = stackWriter.StackWriter('stack.tif', shape, dtype, compress=6)
+# @Notes			: Compression is zlib (deflate), the only compression tifffile writes. The full stack shape has to be
+# 					: known in advance, it is stored in the description of the first page.
+# @Python_version	: 2.7.11
+"""
+# ======================================================================================================================
+
+import sys
+import json
+import threading
+import Queue
+import numpy as np
+import tifffile as tf
+
+## Files larger than this (bytes) are written as BigTIFF
+BIGTIFF = 2**31-2**25
+
+
+class StackWriter(object):
+	"""Write a z,y,x stack slice by slice
+
+	file_out : output file name
+	shape : z,y,x shape of the whole stack
+	dtype : data type of the stack
+	compress : zlib compression level 0-9 (0 = uncompressed)
+	tile : (y,x) tile size (multiples of 16) or None to write strips
+	metadata : dict stored as JSON in the description of the first page (e.g. pixel size)
+	bigtiff : True/False or None to decide from the uncompressed size
+	background : write in a background thread. write() only blocks if more than queuesize slices are pending.
+	"""
+
+	def __init__(
+			self, file_out, shape, dtype, compress=0, tile=None, metadata=None, bigtiff=None, background=True,
+			queuesize=8):
+		if not 0 <= compress <= 9:
+			raise ValueError("Invalid zlib compression level: {0}".format(compress))
+		if tile is not None and (len(tile) != 2 or tile[0] % 16 or tile[1] % 16):
+			raise ValueError("Tile sizes must be multiples of 16: {0}".format(tile))
+		self.file_out = file_out
+		self.shape = tuple(int(i) for i in shape)
+		self.dtype = np.dtype(dtype)
+		self.compress = compress
+		self.tile = tuple(tile) if tile else None
+		if bigtiff is None:
+			bigtiff = np.prod(self.shape)*self.dtype.itemsize > BIGTIFF
+		description = dict(metadata or {})
+		description['shape'] = list(self.shape)
+		self.description = json.dumps(description)
+		self.written = 0
+		self.error = None
+		self.tif = tf.TiffWriter(file_out, bigtiff=bigtiff)
+		self.queue = Queue.Queue(queuesize) if background else None
+		if background:
+			self.thread = threading.Thread(target=self._run)
+			self.thread.daemon = True
+			self.thread.start()
+
+	def write(self, img, copy=True):
+		"""Write one y,x slice or a z,y,x block of slices.
+
+		Set copy False if img is not modified afterwards (e.g. a whole stack), otherwise it is copied before it is
+		queued, so buffers can be reused by the caller.
+		"""
+		self._raise()
+		if self.queue is None:
+			self._save(img)
+		else:
+			self.queue.put(np.array(img, copy=True) if copy else img)
+
+	def close(self):
+		"""Wait for all pending slices, close the file and raise errors from the writer thread"""
+		if self.queue is not None and self.thread.is_alive():
+			self.queue.put(None)
+			self.thread.join()
+		self.tif.close()
+		self._raise()
+		if self.written != self.shape[0]:
+			raise IOError("{0}: {1} of {2} slices written".format(self.file_out, self.written, self.shape[0]))
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		if exc_type is None:
+			self.close()
+		else:
+			## Do not hide the original exception
+			if self.queue is not None and self.thread.is_alive():
+				self.queue.put(None)
+				self.thread.join()
+			self.tif.close()
+
+	def _run(self):
+		while True:
+			img = self.queue.get()
+			if img is None:
+				return
+			if self.error is None:
+				try:
+					self._save(img)
+				except Exception:
+					self.error = sys.exc_info()
+
+	def _save(self, img):
+		if img.ndim == 2:
+			img = img[np.newaxis]
+		if img.shape[1:] != self.shape[1:] or self.written+img.shape[0] > self.shape[0]:
+			raise ValueError("{0}: slices of shape {1} do not fit the stack shape {2} ({3} slices written)".format(
+				self.file_out, img.shape, self.shape, self.written))
+		for sl in img:
+			## Only the first page carries the description with the stack shape, so all pages form one series
+			self.tif.save(
+				sl.astype(self.dtype, copy=False), compress=self.compress, tile=self.tile,
+				description=self.description if self.written == 0 else None, metadata=None, contiguous=False)
+			self.written += 1
+
+	def _raise(self):
+		if self.error is not None:
+			raise self.error[0], self.error[1], self.error[2]
+
+
+def saveStack(file_out, img, metadata=None, compress=0, tile=None):
+	"""Save a whole z,y,x stack with StackWriter (without background thread)"""
+	with StackWriter(file_out, img.shape, img.dtype, compress, tile, metadata, background=False) as writer:
+		writer.write(img, copy=False)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+# @Title			: test_beadDetect
+# @Project			: 3DCTv2
+# @Description		: pytest test
+# @Author			: 3DCT contributors
+# @Email			:
+# @Copyright		: Copyright (C) 2026  3DCT contributors
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		:
+# @Date				: 2026/10
+# @Version			: module rev. 1
+# @Status			: stable
+# @Usage			: pytest
+# @Notes			:
+# @Python_version	: 2.7.12
+"""
+# ======================================================================================================================
+from tdct import beadDetect
+import numpy as np
+import tifffile as tf
+
+beadDetect.debug = False
+
+## x, y, z and height of the test beads
+BEADS = [(30.4, 25.7, 12.2, 600), (90.8, 70.1, 20.6, 400), (50.2, 100.6, 8.9, 200)]
+
+
+def beadVolume():
+	zz, yy, xx = np.mgrid[0:30, 0:128, 0:128]
+	img = 100+np.random.RandomState(0).poisson(20, zz.shape).astype(np.float64)
+	for x, y, z, h in BEADS:
+		img += h*np.exp(-((xx-x)**2+(yy-y)**2)/8.-(zz-z)**2/18.)
+	return img.astype('uint16')
+
+
+def test_detect(tmpdir):
+	img = beadVolume()
+	beads = beadDetect.detect(img)
+	assert list(beads['status']) == ['ok', 'ok', 'ok']
+	## ranked by strength
+	assert list(beads['score']) == sorted(beads['score'], reverse=True)
+	for bead, (x, y, z, h) in zip(beads, BEADS):
+		assert abs(bead['x']-x) < 0.05 and abs(bead['y']-y) < 0.05 and abs(bead['z']-z) < 0.05
+	assert np.allclose(beads['scale'], 2)
+	fn = str(tmpdir.join('beads.tif'))
+	tf.imsave(fn, img)
+	progress = []
+	beads = beadDetect.detect(fn, method='radial', maxbeads=2, callback=lambda value: progress.append(value))
+	assert list(beads['status']) == ['ok', 'ok'] and abs(beads['x'][1]-90.8) < 0.1
+	assert progress[-1] == 100
+
+
+def test_detect2D():
+	img = beadVolume().max(axis=0)
+	beads = beadDetect.detect(img)
+	assert list(beads['status']) == ['ok', 'ok', 'ok']
+	for bead, (x, y, z, h) in zip(beads, BEADS):
+		assert abs(bead['x']-x) < 0.1 and abs(bead['y']-y) < 0.1 and np.isnan(bead['z'])
+	beads = beadDetect.detect(img, method='radial', maxbeads=1)
+	assert abs(beads['x'][0]-30.4) < 0.1 and abs(beads['y'][0]-25.7) < 0.1
+
+
+def test_findBlobs():
+	yy, xx = np.mgrid[0:64, 0:64]
+	img = np.random.RandomState(0).rand(64, 64)+50*np.exp(-((xx-12.3)**2+(yy-41.6)**2)/8.)
+	img[20, 30] = 100
+	for binning in [1, 2]:
+		x, y, scale, score = beadDetect.findBlobs(img, sigmas=(1, 2, 3), binning=binning)
+		assert list(x) == [12, 30] and list(y) == [42, 20] and list(scale) == [2, 1]
+	assert len(beadDetect.findBlobs(np.ones((64, 64)))[0]) == 0
+	assert list(beadDetect.suppress(np.array([0, 3, 10]), np.array([0, 0, 0]), [1, 2, 3], 5)) == [2, 1]
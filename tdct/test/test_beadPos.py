@@ -20,7 +20,8 @@
 # @Python_version	: 2.7.12
 """
 # ======================================================================================================================
-from tdct import beadPos
+import pytest
+from tdct import beadPos, parabolic
 import numpy as np
 
 beadPos.debug = False
@@ -37,10 +38,16 @@ def test_getzPoly(testVolume):
 def test_getzGauss(testVolume):
 	retVal = beadPos.getzGauss(70,20,testVolume,parent=None,optimize=False,threshold=None,threshVal=0.6,cutout=15)
 	assert abs(retVal-40.00000000073846) < 0.0001
-	retVal = beadPos.getzGauss(70,20,testVolume,parent=None,optimize=True,threshold=None,threshVal=0.6,cutout=15)
-	valExp = (70.05369545524978, 20.05369545976798, 40.00000000073846)
+	retVal = beadPos.getzGauss(
+		70,20,testVolume,parent=None,optimize=True,threshold=None,threshVal=0.6,cutout=15,zcutout=15)
+	valExp = (69.99586559154922, 19.99586559154921, 39.99586559154922)
 	for i in range(3):
 		assert abs(retVal[i]-valExp[i]) < 0.0001
+	## the default sub-volume covers 3 z widths of the sphere (sigma 7.5 slices) instead of the truncated +-15 slices
+	assert beadPos.zCutout([7.5, np.nan, -7.5], 15) == 23 and beadPos.zCutout([2.], 15) == 15
+	retVal = beadPos.getzGauss(70,20,testVolume,parent=None,optimize=True,threshold=None,threshVal=0.6,cutout=15)
+	for i, val in enumerate([70, 20, 40]):
+		assert abs(retVal[i]-val) < 0.001
 
 
 def test_1Dgauss():
@@ -52,6 +59,26 @@ def test_1Dgauss():
 	assert round(popt[1]) == 5
 
 
+def test_gaussfitBatch():
+	np.random.seed(0)
+	x = np.arange(60.)
+	profiles = np.array([500*np.exp(-(x-m)**2/(2*s**2)) for m, s in [(30.3, 3), (12.7, 2.5), (2.2, 1.5)]])
+	profiles += np.random.rand(*profiles.shape)*20
+	popt, pcov, ok = beadPos.gaussfitBatch(profiles-profiles.min(axis=1)[:, np.newaxis])
+	assert ok.all()
+	for i in range(len(profiles)):
+		poptExp, pcovExp = beadPos.gaussfit(np.array([x, profiles[i]]))
+		assert np.allclose(popt[i], poptExp, rtol=1e-3)
+		assert np.allclose(np.sqrt(np.diag(pcov[i])), np.sqrt(np.diag(pcovExp)), rtol=0.05)
+	popt, pcov, ok = beadPos.gaussfitBatch(np.zeros((1, 10)))
+	assert not ok[0] and np.isnan(popt[0]).all()
+	zz, yy, xx = np.mgrid[0:30, 0:40, 0:40]
+	img = (10+200*np.exp(-((xx-20)**2+(yy-20)**2)/8.-(zz-12.4)**2/18.)).astype('uint16')
+	beads = beadPos.getzBatch([(20,20), (2,2)],img,method='gauss',fast=True)
+	assert list(beads['status']) == ['ok', 'lowsnr']
+	assert abs(beads['z'][0]-beadPos.getzGauss(20,20,img)) < 0.01
+
+
 def test_2Dgauss():
 	# Create Gaussian test data
 	Xin, Yin = np.mgrid[0:201, 0:201]
@@ -63,3 +90,127 @@ def test_2Dgauss():
 	params = beadPos.fitgaussian(data)
 
 	assert (round(params[1]), round(params[2])) == (100, 100)
+
+
+def test_getzBatch(testVolume):
+	positions = [(70,20), (5,5), (200,20)]
+	beads = beadPos.getzBatch(positions,testVolume,method='poly')
+	assert list(beads['status']) == ['ok', 'lowsnr', 'outside']
+	assert abs(beads['z'][0]-beadPos.getzPoly(70,20,testVolume)) < 0.0001
+	assert np.isnan(beads['z'][1:]).all()
+	assert (beads['x'] == [70, 5, 200]).all()
+	beads = beadPos.getzBatch(positions,testVolume,method='gauss',optimize=True,cutout=15)
+	assert list(beads['status']) == ['ok', 'lowsnr', 'outside']
+	valExp = beadPos.getzGauss(70,20,testVolume,optimize=True,cutout=15)
+	for i, field in enumerate(['x', 'y', 'z']):
+		assert abs(beads[field][0]-valExp[i]) < 0.0001
+	assert beads['err_x'][0] < 0.1 and np.isnan(beads['sigma_x'][1:]).all()
+
+
+def test_getzBatch_parent(testVolume, monkeypatch):
+	## The z-fits are only drawn for a single bead
+	parents = []
+	gaussfit = beadPos.gaussfit
+	def gaussfitSpy(data, parent=None):
+		parents.append(parent)
+		return gaussfit(data)
+	monkeypatch.setattr(beadPos, 'gaussfit', gaussfitSpy)
+	parent = object()
+	beadPos.getzBatch([(70,20), (71,21)],testVolume,method='gauss',parent=parent)
+	assert parents == [None, None]
+	beadPos.getzBatch([(70,20)],testVolume,method='gauss',parent=parent)
+	assert parents[-1] is parent
+
+
+def test_fitgaussianBatch():
+	X, Y = np.mgrid[0:20, 0:20]
+	data = np.array([beadPos.gaussian(h, cx, cy, wx, wy)(X, Y) for h, cx, cy, wx, wy in [
+		(100, 9.3, 10.2, 2., 3.), (50, 8.7, 11.1, 2.5, 2.5), (80, 10, 10, 4., 1.5)]])
+	data[1] += np.random.RandomState(0).rand(20, 20)
+	params, ok = beadPos.fitgaussianBatch(np.concatenate([data, np.zeros((1, 20, 20))]))
+	assert list(ok) == [True, True, True, False]
+	for i in range(3):
+		assert np.allclose(params[i], beadPos.fitgaussian(data[i]), rtol=1e-4)
+	assert np.allclose(params[0], [100, 9.3, 10.2, 2., 3.])
+
+
+def test_getxyBatch():
+	yy, xx = np.mgrid[0:80, 0:100]
+	img = 10+np.random.RandomState(0).rand(80, 100)
+	for x, y in [(30.4, 25.7), (70.8, 50.1)]:
+		img += 200*np.exp(-((xx-x)**2+(yy-y)**2)/8.)
+	positions = [(30, 26), (71, 50), (5, 40), (120, 20)]
+	for method in ['gauss', 'radial']:
+		beads = beadPos.getxyBatch(positions,img,method=method,cutout=10)
+		assert list(beads['status']) == ['ok', 'ok', 'failed', 'outside']
+		assert np.allclose(beads['x'][:2], [30.4, 70.8], atol=0.05)
+		assert np.allclose(beads['y'][:2], [25.7, 50.1], atol=0.05)
+		assert (beads['x'][2:] == [5, 120]).all() and np.isnan(beads['z']).all()
+	beads = beadPos.getxyBatch(positions,img,method='gauss',cutout=10)
+	assert np.allclose(beads['sigma_x'][:2], 2, atol=0.05) and np.allclose(beads['amplitude'][:2], 200, rtol=0.02)
+	## single bead with the fit drawn, same result
+	class Plot(object):
+		def matshowPlot(self, **kwargs):
+			self.kwargs = kwargs
+	class Parent(object):
+		widget_matplotlib = Plot()
+	parent = Parent()
+	bead = beadPos.getxyBatch(positions[:1],img,method='gauss',cutout=10,parent=parent)
+	assert np.allclose([bead['x'][0], bead['y'][0]], [beads['x'][0], beads['y'][0]], atol=1e-4)
+	assert parent.widget_matplotlib.kwargs['mat'].shape == (20, 20)
+
+
+def test_fitgaussian3DBatch():
+	zz, yy, xx = np.mgrid[0:16, 0:20, 0:20]
+	pExp = [(200, 9.3, 10.2, 7.6, 2., 2.5, 3.5, 10), (80, 11.1, 8.7, 8.2, 1.5, 1.5, 4., 50)]
+	data = np.array([h*np.exp(-((xx-x)/sx)**2/2-((yy-y)/sy)**2/2-((zz-z)/sz)**2/2)+b for h, x, y, z, sx, sy, sz, b in pExp])
+	data += np.random.RandomState(0).rand(*data.shape)-0.5
+	params, perr, ok = beadPos.fitgaussian3DBatch(np.concatenate([data, np.ones((1, 16, 20, 20))]))
+	assert list(ok) == [True, True, False]
+	assert np.allclose(params[:2], pExp, rtol=0.01, atol=0.02)
+	assert (perr[:2, 1:4] < 0.01).all() and np.isnan(perr[2]).all()
+	## image coordinates, sub-volume moved into the stack in z, bead too close to the border
+	img = np.full((30, 60, 60), 10.)
+	img[2:18, 30:50, 10:30] = data[0]
+	p, perr, ok = beadPos.localizeGauss3D([19, 3], [40, 30], [8, 8], img, cutout=10, zcutout=12)
+	assert list(ok) == [True, False]
+	assert np.allclose(p[0, 1:4], [19.3, 40.2, 9.6], atol=0.01)
+
+
+def test_radialCenterBatch():
+	Y, X = np.mgrid[0:20, 0:20]
+	centers = [(9.3, 10.2), (11.7, 8.4)]
+	data = np.array([100*np.exp(-((X-x)**2+(Y-y)**2)/8.) for x, y in centers]+[np.ones((20, 20))])
+	x, y, ok = beadPos.radialCenterBatch(data)
+	assert list(ok) == [True, True, False]
+	assert np.allclose(np.array([x[:2], y[:2]]).T, centers, atol=0.02)
+	zz, yy, xx = np.mgrid[0:30, 0:60, 0:60]
+	img = (10+1000*np.exp(-((xx-30.3)**2+(yy-25.6)**2)/8.-(zz-12.4)**2/18.)).astype('uint16')
+	beads = beadPos.getzBatch([(30,26), (5,5)],img,method='radial',optimize=True,cutout=10)
+	assert list(beads['status']) == ['ok', 'lowsnr']
+	assert abs(beads['x'][0]-30.3) < 0.05 and abs(beads['y'][0]-25.6) < 0.05
+	assert abs(beads['z'][0]-beadPos.getzPoly(30,26,img)) < 0.0001
+	## an intensity ramp has nearly parallel gradients, its center lies far outside of the cutout
+	img = (10+(100+20*xx+0.01*yy)*np.exp(-(zz-12.4)**2/18.)).astype('float32')
+	img += np.random.RandomState(0).rand(*img.shape)*0.01
+	beads = beadPos.getzBatch([(30,26)],img,method='radial',optimize=True,cutout=10)
+	assert list(beads['status']) == ['failed'] and (beads['x'], beads['y']) == (30, 26)
+
+
+def test_polyfitPeaks():
+	profiles = np.array([[2, 3, 1, 6, 4, 2, 3, 1], [1, 2, 4, 8, 4, 2, 1, 0], [5, 5, 5, 5, 5, 5, 5, 5]])
+	zv, yv, ok = beadPos.polyfitPeaks(profiles, n=2)
+	assert list(ok) == [True, True, False]
+	assert abs(zv[0]-parabolic.parabolic_polyfit(profiles[0], 3, 2)[0]) < 0.0001
+	assert abs(yv[1]-parabolic.parabolic_polyfit(profiles[1], 3, 2)[1]) < 0.0001
+	zv, yv, ok = beadPos.polyfitPeaks(profiles)
+	assert abs(zv[1]-parabolic.parabolic_polyfit(profiles[1], 3, beadPos.getn(profiles[1]))[0]) < 0.0001
+
+
+def test_optimize_xy():
+	zz, yy, xx = np.mgrid[0:20, 0:60, 0:60]
+	img = (1000*np.exp(-((xx-30.3)**2+(yy-25.6)**2)/8.-(zz-10)**2/18.)).astype('uint16')
+	retVal = beadPos.optimize_xy(29,26,10,img)
+	assert abs(retVal[0]-30.3) < 0.25 and abs(retVal[1]-25.6) < 0.25
+	with pytest.raises(IndexError):
+		beadPos.optimize_xy(5,30,10,img)
@@ -38,3 +38,16 @@ def test_parabolic_polyfit():
 	# assert parabolic.parabolic_polyfit(f, argmax(f), 2) == (3.2142857142857295, 6.1607142857143131)
 	assert abs(retVal[0] - 3.2142857142857295) < 0.0001
 	assert abs(retVal[1] - 6.1607142857143131) < 0.0001
+
+
+def test_parabolic_polyfit_batch():
+	import numpy as np
+	f = np.array([[2, 3, 1, 6, 4, 2, 3, 1], [1, 2, 4, 8, 7, 2, 1, 0], [1, 2, 4, 8, 7, 2, 1, 0], [5, 3, 1, 0, 1, 3, 5, 7]])
+	xv, yv = parabolic.parabolic_polyfit_batch(f, [3, 3, 3, 3], [2, 5, 8, 4])
+	for i, n in enumerate([2, 5]):
+		retVal = np.polyfit(np.arange(3-n//2, 3+n//2+1), f[i, 3-n//2:3+n//2+1], 2)
+		assert abs(xv[i] - (-0.5*retVal[1]/retVal[0])) < 0.0001
+		assert abs(yv[i] - parabolic.parabolic_polyfit(f[i], 3, n)[1]) < 0.0001
+	## window outside of the vector, no maximum
+	assert np.isnan(xv[2:]).all() and np.isnan(yv[2:]).all()
+	assert parabolic.polyfit_kernel(5) is parabolic.polyfit_kernel(5)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+# @Title			: test_stackBatch
+# @Project			: 3DCTv2
+# @Description		: pytest test
+# @Author			: 3DCT contributors
+# @Email			:
+# @Copyright		: Copyright (C) 2026  3DCT contributors
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		:
+# @Date				: 2026/10
+# @Version			: module rev. 1
+# @Status			: stable
+# @Usage			: pytest
+# @Notes			:
+# @Python_version	: 2.7.12
+"""
+# ======================================================================================================================
+import os
+from tdct import stackBatch, stackProcessing
+import numpy as np
+import tifffile as tf
+
+stackProcessing.debug = False
+
+
+def test_manifest(tmpdir):
+	manifest = tmpdir.join('jobs.tsv')
+	manifest.write('path\tss_in\tss_out\tmethod\nstack.tif\t300\t161.25\tspline\n/data/seq\t300\t150\t\n')
+	jobs = stackBatch.loadManifest(str(manifest))
+	assert len(jobs) == 2
+	assert jobs[0]['path'] == str(tmpdir.join('stack.tif'))
+	assert (jobs[0]['ss_in'], jobs[0]['ss_out'], jobs[0]['method']) == (300., 161.25, 'spline')
+	assert (jobs[1]['path'], jobs[1]['method']) == ('/data/seq', 'linear')
+	assert stackBatch.jobId(jobs[0]) != stackBatch.jobId(stackBatch.makeJob(str(tmpdir.join('stack.tif')), 300, 150))
+
+
+def test_resume(tmpdir):
+	outdir = tmpdir.mkdir('out')
+	paths = []
+	for i in range(2):
+		paths.append(str(tmpdir.join('stack{0}.tif'.format(i))))
+		tf.imsave(paths[-1], np.random.randint(255, size=(5, 10, 10)).astype('uint8'))
+	jobs = [stackBatch.makeJob(path, 300, 150, outdir=str(outdir)) for path in paths]
+	results = stackBatch.run(jobs)
+	assert sorted(results.values()) == ['done', 'done']
+	assert sorted(os.listdir(str(outdir))) == ['.stackBatch', 'stack0_resliced.tif', 'stack1_resliced.tif']
+	assert stackBatch.readStatus(jobs[0])['outputs'] == [str(outdir.join('stack0_resliced.tif'))]
+	## Finished jobs are not redone, unless their output is gone
+	os.remove(str(outdir.join('stack1_resliced.tif')))
+	results = stackBatch.run(jobs)
+	assert results[stackBatch.jobId(jobs[0])] == 'skipped'
+	assert results[stackBatch.jobId(jobs[1])] == 'done'
+	assert os.path.isfile(str(outdir.join('stack1_resliced.tif')))
+	## Failing jobs are recorded
+	job = stackBatch.makeJob(str(tmpdir.join('missing.tif')), 300, 150, outdir=str(outdir))
+	assert stackBatch.run([job]).values() == ['failed']
+	assert stackBatch.readStatus(job)['status'] == 'failed'
+	assert stackBatch.readStatus(job)['error'].startswith('ERROR: Path is neither')
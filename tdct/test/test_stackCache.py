@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Title			: test_stackCache
+# @Project			: 3DCTv2
+# @Description		: pytest test
+# @Author			: 3DCT contributors
+# @Email			:
+# @Copyright		: Copyright (C) 2026  3DCT contributors
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		:
+# @Date				: 2026/10
+# @Version			: module rev. 1
+# @Status			: stable
+# @Usage			: pytest
+# @Notes			:
+# @Python_version	: 2.7.12
+"""
+# ======================================================================================================================
+from tdct import stackCache, stackProcessing
+import os
+import numpy as np
+import tifffile as tf
+
+
+def test_main_cache(tmpdir, monkeypatch):
+	cachedir = str(tmpdir.mkdir('cache'))
+	fn = str(tmpdir.join('stack.tif'))
+	tf.imsave(fn, (np.arange(8*6*5).reshape(8, 6, 5) % 200).astype('uint8'))
+	outputs = stackProcessing.main(fn, 300., 161.25, customSaveDir=str(tmpdir), cache=cachedir)
+	compArray = tf.imread(outputs[0])
+	entries = stackCache.inspect(cachedir)
+	assert len(entries) == 1 and entries[0]['source'] == fn and entries[0]['method'] == 'linear'
+	## The full content hash is a separate entry
+	stackProcessing.main(fn, 300., 161.25, customSaveDir=str(tmpdir), cache=cachedir, fullhash=True)
+	assert len(stackCache.inspect(cachedir)) == 2
+	## Repeated requests are served from the cache
+	os.remove(outputs[0])
+	monkeypatch.setattr(stackProcessing, 'interpol', None)
+	outputs = stackProcessing.main(fn, 300., 161.25, customSaveDir=str(tmpdir), cache=cachedir)
+	assert np.testing.assert_array_equal(tf.imread(outputs[0]), compArray) is None
+	## and with the full content hash also for copies of the input
+	copy = str(tmpdir.mkdir('copy').join('stack_copy.tif'))
+	tf.imsave(copy, tf.imread(fn))
+	outputs = stackProcessing.main(copy, 300., 161.25, cache=cachedir, fullhash=True)
+	assert np.testing.assert_array_equal(tf.imread(outputs[0]), compArray) is None
+	assert len(stackCache.inspect(cachedir)) == 2
+	monkeypatch.undo()
+	## Different parameters are a different entry, also for the output format
+	stackProcessing.main(fn, 300., 100., customSaveDir=str(tmpdir), cache=cachedir)
+	assert len(stackCache.inspect(cachedir)) == 3
+	outputs = stackProcessing.main(fn, 300., 161.25, customSaveDir=str(tmpdir), cache=cachedir, compress=6)
+	assert len(stackCache.inspect(cachedir)) == 4
+	with tf.TiffFile(outputs[0]) as tif:
+		assert tif.pages[0].compression == 'deflate'
+	stackProcessing.main(fn, 300., 161.25, customSaveDir=str(tmpdir), cache=cachedir, tile=(16, 16))
+	assert len(stackCache.inspect(cachedir)) == 5
+
+
+def test_key(tmpdir):
+	fn = str(tmpdir.join('stack.tif'))
+	with open(fn, 'wb') as f:
+		f.write('x'*1000)
+	os.utime(fn, (1, 1))
+	keys = [stackCache.key(fn, method='linear'), stackCache.key(fn, fullhash=True, method='linear')]
+	## An edit that keeps the file size changes the modification time
+	with open(fn, 'r+b') as f:
+		f.write('y')
+	os.utime(fn, (2, 2))
+	assert stackCache.key(fn, method='linear') != keys[0]
+	assert stackCache.key(fn, fullhash=True, method='linear') != keys[1]
+	## The full hash only depends on the content
+	with open(fn, 'r+b') as f:
+		f.write('x')
+	os.utime(fn, (3, 3))
+	assert stackCache.key(fn, fullhash=True, method='linear') == keys[1]
+	assert stackCache.key(fn, method='linear', ss_out=100.) != stackCache.key(fn, method='linear')
+
+
+def test_evict(tmpdir):
+	cachedir = str(tmpdir.mkdir('cache'))
+	for i in range(3):
+		fn = str(tmpdir.join('out{0}.tif'.format(i)))
+		with open(fn, 'wb') as f:
+			f.write('x'*1000)
+		stackCache.store('key{0}'.format(i), fn, cachedir, maxsize=10**6)
+		os.utime(stackCache.entryPath('key{0}'.format(i), cachedir), (i, i))
+	## Using an entry makes it the most recently used one
+	assert stackCache.fetch('key0', str(tmpdir.join('fetched.tif')), cachedir) is True
+	assert stackCache.fetch('missing', str(tmpdir.join('fetched.tif')), cachedir) is False
+	assert stackCache.evict(2500, cachedir) == ['key1']
+	assert [entry['key'] for entry in stackCache.inspect(cachedir)] == ['key0', 'key2']
+	stackCache.clear(cachedir)
+	assert stackCache.inspect(cachedir) == []
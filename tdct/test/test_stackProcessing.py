@@ -20,18 +20,42 @@
 # @Python_version	: 2.7.12
 """
 # ======================================================================================================================
+import pytest
 from tdct import stackProcessing
+import os
 import numpy as np
 
 stackProcessing.debug = False
 
 
 def test_norm_img():
-	compArray = np.array([[127, 127, 127],[254, 254, 254]], dtype='uint8')
+	compArray = np.array([[128, 128, 128],[255, 255, 255]], dtype='uint8')
 	retArray = stackProcessing.norm_img(np.array([[1,1,1],[2,2,2]],dtype='uint8'))
 	assert np.testing.assert_array_equal(retArray, compArray) is None
 
 
+def test_norm_img_shapes():
+	stack = np.arange(2*3*6*5, dtype='uint16').reshape(2, 3, 6, 5)
+	stack[1, 2] = 0
+	retArray = stackProcessing.norm_img(stack, copy=True)
+	assert stack.max() == 149
+	assert retArray.dtype == np.uint16
+	assert np.testing.assert_array_equal(retArray.max(axis=(2,3)), [[65535, 65535, 65535], [65535, 65535, 0]]) is None
+	assert np.testing.assert_array_equal(
+		retArray, np.rint(stack*(65535./np.maximum(stack.max(axis=(2,3), keepdims=True), 1)))) is None
+	## y,x,c normalizes per channel, in place
+	rgb = np.array([[[1, 2, 10]], [[4, 8, 20]]], dtype='uint8')
+	retArray = stackProcessing.norm_img(rgb, copy=False)
+	assert retArray is rgb
+	assert np.testing.assert_array_equal(rgb, [[[64, 64, 128]], [[255, 255, 255]]]) is None
+	## z,y,x float and read-only input
+	zyx = np.linspace(0, 2, 3*5*5).reshape(3, 5, 5)
+	zyx.flags.writeable = False
+	retArray = stackProcessing.norm_img(zyx, chunksize=2)
+	assert retArray is not zyx
+	np.testing.assert_allclose(retArray.max(axis=(1,2)), 1)
+
+
 def test_pxSize(image_RGB, image_Grey):
 	pixelSize = stackProcessing.pxSize(str(image_RGB),z=False)
 	assert pixelSize == 123.
@@ -49,16 +73,16 @@ def test_interpolation():
 	calcArray[2] += 100
 	calcArray[3] += 150
 	compArray = np.array([
-		[[0, 0, 0, 0, 0],
-			[0, 0, 0, 0, 0],
-			[0, 0, 0, 0, 0],
-			[0, 0, 0, 0, 0],
-			[0, 0, 0, 0, 0]],
-		[[17, 17, 17, 17, 17],
-			[17, 17, 17, 17, 17],
-			[17, 17, 17, 17, 17],
-			[17, 17, 17, 17, 17],
-			[17, 17, 17, 17, 17]],
+		[[1, 1, 1, 1, 1],
+			[1, 1, 1, 1, 1],
+			[1, 1, 1, 1, 1],
+			[1, 1, 1, 1, 1],
+			[1, 1, 1, 1, 1]],
+		[[18, 18, 18, 18, 18],
+			[18, 18, 18, 18, 18],
+			[18, 18, 18, 18, 18],
+			[18, 18, 18, 18, 18],
+			[18, 18, 18, 18, 18]],
 		[[34, 34, 34, 34, 34],
 			[34, 34, 34, 34, 34],
 			[34, 34, 34, 34, 34],
@@ -69,11 +93,11 @@ def test_interpolation():
 			[51, 51, 51, 51, 51],
 			[51, 51, 51, 51, 51],
 			[51, 51, 51, 51, 51]],
-		[[67, 67, 67, 67, 67],
-			[67, 67, 67, 67, 67],
-			[67, 67, 67, 67, 67],
-			[67, 67, 67, 67, 67],
-			[67, 67, 67, 67, 67]],
+		[[68, 68, 68, 68, 68],
+			[68, 68, 68, 68, 68],
+			[68, 68, 68, 68, 68],
+			[68, 68, 68, 68, 68],
+			[68, 68, 68, 68, 68]],
 		[[84, 84, 84, 84, 84],
 			[84, 84, 84, 84, 84],
 			[84, 84, 84, 84, 84],
@@ -84,11 +108,11 @@ def test_interpolation():
 			[101, 101, 101, 101, 101],
 			[101, 101, 101, 101, 101],
 			[101, 101, 101, 101, 101]],
-		[[117, 117, 117, 117, 117],
-			[117, 117, 117, 117, 117],
-			[117, 117, 117, 117, 117],
-			[117, 117, 117, 117, 117],
-			[117, 117, 117, 117, 117]],
+		[[118, 118, 118, 118, 118],
+			[118, 118, 118, 118, 118],
+			[118, 118, 118, 118, 118],
+			[118, 118, 118, 118, 118],
+			[118, 118, 118, 118, 118]],
 		[[134, 134, 134, 134, 134],
 			[134, 134, 134, 134, 134],
 			[134, 134, 134, 134, 134],
@@ -101,6 +125,318 @@ def test_interpolation():
 			[0, 0, 0, 0, 0]]], dtype="uint8")
 	retArray = stackProcessing.interpol(calcArray, 300., 100., "spline", showgraph=False)
 	assert np.testing.assert_array_equal(retArray, compArray) is None
-	compArray[0] += 1
 	retArray = stackProcessing.interpol(calcArray, 300., 100., "linear", showgraph=False)
 	assert np.testing.assert_array_equal(retArray, compArray) is None
+
+
+def test_interpolation_multichannel(tmpdir):
+	import tifffile as tf
+	from tdct import tiffMetadata
+	zz, yy, xx = np.mgrid[0:9, 0:12, 0:10]
+	calcArray = np.array([100+50*np.sin(zz/2.)+yy, 10*zz+xx, 200-zz*yy]).astype('uint8')
+	for method in ['spline', 'linear']:
+		retArray = stackProcessing.interpol(calcArray, 300., 161.25, method, showgraph=False, threads=2)
+		assert retArray.shape == (3, 15, 12, 10)
+		for c in range(3):
+			compArray = stackProcessing.interpol(calcArray[c], 300., 161.25, method, showgraph=False)
+			assert np.testing.assert_array_equal(retArray[c], compArray) is None
+	## Saved as one (linear) hyperstack with pixel size information, ImageJ stores z,c,y,x
+	fn = str(tmpdir.join('stack.tif'))
+	tf.imsave(fn, calcArray.transpose(1, 0, 2, 3), imagej=True, metadata={'PixelSize': '0.2'})
+	outputs = stackProcessing.main(fn, 300., 161.25, customSaveDir=str(tmpdir))
+	assert outputs == [str(tmpdir.join('stack_resliced.tif'))]
+	assert np.testing.assert_array_equal(stackProcessing.readStack(outputs[0]), retArray) is None
+	assert np.testing.assert_array_equal(tf.imread(outputs[0]), retArray.transpose(1, 0, 2, 3)) is None
+	with tf.TiffFile(outputs[0]) as tif:
+		description = tif.pages[0].tags['image_description'].value
+	assert 'channels=3\n' in description and 'slices=15\n' in description
+	meta = tiffMetadata.read(outputs[0])
+	assert (meta['pixelSize'], meta['focusStep']) == (0.2, 0.16125)
+
+
+def test_spline_tiles():
+	from scipy.interpolate import InterpolatedUnivariateSpline
+	calcArray = np.random.randint(1000, size=(12,37,23)).astype('float32')
+	retArray = stackProcessing.interpol(calcArray, 250., 100., "spline", showgraph=False)
+	## Per pixel reference
+	zx = np.arange(12)*2.5
+	zxnew = np.arange(0, 11*2.5, 1)
+	for py, px in [(0,0), (5,17), (36,22)]:
+		compLine = InterpolatedUnivariateSpline(zx, calcArray[:,py,px])(zxnew)
+		np.testing.assert_allclose(retArray[:len(zxnew),py,px], compLine, rtol=1e-4, atol=1e-2)
+	## Tile borders must not change the result
+	tileArray = stackProcessing.spline(calcArray, retArray.shape, 250., 100., 12, retArray.shape[0], tilesize=8)
+	np.testing.assert_allclose(tileArray, retArray, rtol=1e-5)
+
+
+def test_interpolStream(tmpdir):
+	import tifffile as tf
+	zz, yy, xx = np.mgrid[0:15, 0:20, 0:30]
+	calcArray = (100+50*np.sin(zz/3.)+yy+xx).astype('uint16')
+	fn = str(tmpdir.join('stack.tif'))
+	fn_out = str(tmpdir.join('stack_resliced.tif'))
+	tf.imsave(fn, calcArray)
+	retVal = stackProcessing.interpolStream(fn, fn_out, 300., 161.25, 'linear', slabsize=4)
+	compArray = stackProcessing.interpol(calcArray, 300., 161.25, 'linear', showgraph=False)
+	retArray = tf.imread(fn_out)
+	assert retVal == compArray.shape
+	assert np.testing.assert_array_equal(retArray, compArray) is None
+	stackProcessing.interpolStream(fn, fn_out, 300., 161.25, 'spline', slabsize=4)
+	compArray = stackProcessing.interpol(calcArray, 300., 161.25, 'spline', showgraph=False)
+	retArray = tf.imread(fn_out)
+	np.testing.assert_allclose(retArray, compArray, atol=1)
+
+
+def test_projectStack(tmpdir):
+	import tifffile as tf
+	calcArray = np.random.RandomState(0).randint(0, 4000, (7, 12, 10)).astype('uint16')
+	fn = str(tmpdir.join('stack.tif'))
+	tf.imsave(fn, calcArray)
+	proj = stackProcessing.projectStack(fn, stats=('max', 'min', 'mean', 'argmax'))
+	assert np.testing.assert_array_equal(proj['max'], np.amax(calcArray, axis=0)) is None
+	assert np.testing.assert_array_equal(proj['min'], np.amin(calcArray, axis=0)) is None
+	assert np.testing.assert_array_equal(proj['argmax'], np.argmax(calcArray, axis=0)) is None
+	np.testing.assert_allclose(proj['mean'], calcArray.mean(axis=0), rtol=1e-6)
+	## multichannel c,z,y,x
+	calcArray = calcArray.reshape(1, 7, 12, 10).repeat(2, axis=0)
+	calcArray[1] //= 2
+	tf.imsave(fn, calcArray.transpose(1, 0, 2, 3), imagej=True)
+	proj = stackProcessing.projectStack(fn, stats=('max', 'argmax'))
+	assert sorted(proj) == ['argmax', 'max']
+	assert np.testing.assert_array_equal(proj['max'], np.amax(calcArray, axis=1)) is None
+	assert np.testing.assert_array_equal(proj['argmax'], np.argmax(calcArray, axis=1)) is None
+	assert stackProcessing.projectStack(fn, stats=('median',)).startswith('ERROR')
+
+
+def test_pipeline(tmpdir):
+	import tifffile as tf
+	zz, yy, xx = np.mgrid[0:10, 0:14, 0:12]
+	calcArray = (100+50*np.sin(zz/3.)+yy*xx).astype('uint16')
+	fn = str(tmpdir.join('stack.tif'))
+	tf.imsave(fn, calcArray)
+	## Same results as running the steps one after the other
+	seqdir = tmpdir.mkdir('sequential')
+	stackProcessing.main(fn, 300., 161.25, customSaveDir=str(seqdir))
+	stackProcessing.normalize(str(seqdir.join('stack_resliced.tif')), customSaveDir=str(seqdir))
+	stackProcessing.mip(str(seqdir.join('norm_stack_resliced.tif')), customSaveDir=str(seqdir), normalize=True)
+	progress = []
+	outputs = stackProcessing.pipeline(
+		fn, ss_in=300., ss_out=161.25, customSaveDir=str(tmpdir), normalizemip=True, callback=progress.append)
+	assert [os.path.basename(fname) for fname in outputs] == [
+		'stack_resliced.tif', 'norm_stack_resliced.tif', 'MIP_norm_norm_stack_resliced.tif']
+	for fname in outputs:
+		compArray = tf.imread(str(seqdir.join(os.path.basename(fname))))
+		assert np.testing.assert_array_equal(tf.imread(fname), compArray) is None
+	assert progress[-1] == 100
+	## Without reslicing
+	outputs = stackProcessing.pipeline(fn, stages=('normalize', 'mip'), customSaveDir=str(tmpdir))
+	assert np.testing.assert_array_equal(
+		tf.imread(outputs[1]), np.amax(stackProcessing.norm_img(calcArray), axis=0)) is None
+	assert stackProcessing.pipeline(fn, stages=('reslice',)).startswith('ERROR')
+
+
+def test_pipeline_methods(tmpdir):
+	import tifffile as tf
+	zz, yy, xx = np.mgrid[0:20, 0:14, 0:12]
+	calcArray = (1000+500*np.sin(zz/2.)+yy*xx).astype('uint16')
+	fn = str(tmpdir.join('stack.tif'))
+	tf.imsave(fn, calcArray)
+	for method in ('linear', 'cubic', 'lanczos', 'spline'):
+		compArray = stackProcessing.interpol(calcArray, 300., 161.25, method, showgraph=False)
+		outputs = stackProcessing.pipeline(
+			fn, stages=('reslice',), ss_in=300., ss_out=161.25, interpolationmethod=method,
+			customSaveDir=str(tmpdir), slabsize=4)
+		retArray = tf.imread(outputs[0])
+		if method == 'spline':
+			## The spline is fitted per slab (+ halo), see interpolStream
+			np.testing.assert_allclose(retArray, compArray, atol=0.01*calcArray.max())
+		else:
+			assert np.testing.assert_array_equal(retArray, compArray) is None
+
+
+def test_kernels(tmpdir):
+	import tifffile as tf
+	## Interpolated positions on input slices reproduce the input, weights sum up to 1
+	for kernel in ['cubic', 'lanczos']:
+		idx, w = stackProcessing.kernelWeights(7, 300., 150., kernel)
+		assert idx.shape == w.shape == (12, 4 if kernel == 'cubic' else 6)
+		np.testing.assert_allclose(w.sum(axis=1), 1, rtol=1e-6)
+		np.testing.assert_allclose(w[::2].max(axis=1), 1, rtol=1e-6)
+		assert idx.min() == 0 and idx.max() == 6
+	## Keys cubic convolution is exact for quadratic functions (away from the stack borders)
+	zz = np.mgrid[0:12, 0:4, 0:4][0]
+	calcArray = (2*zz**2+zz+5).astype('float32')
+	retArray = stackProcessing.interpol(calcArray, 300., 100., 'cubic', showgraph=False)
+	z = np.arange(retArray.shape[0])/3.
+	np.testing.assert_allclose(retArray[6:-6, 0, 0], (2*z**2+z+5)[6:-6], rtol=1e-5)
+	retArray = stackProcessing.interpol(calcArray, 300., 100., 'lanczos', showgraph=False)
+	np.testing.assert_allclose(retArray[9:-9, 0, 0], (2*z**2+z+5)[9:-9], rtol=1e-2)
+	## Streaming gives the same results
+	zz, yy, xx = np.mgrid[0:15, 0:20, 0:30]
+	calcArray = (100+50*np.sin(zz/3.)+yy+xx).astype('uint16')
+	fn = str(tmpdir.join('stack.tif'))
+	fn_out = str(tmpdir.join('stack_resliced.tif'))
+	tf.imsave(fn, calcArray)
+	for kernel in ['cubic', 'lanczos']:
+		stackProcessing.interpolStream(fn, fn_out, 300., 161.25, kernel, slabsize=4)
+		compArray = stackProcessing.interpol(calcArray, 300., 161.25, kernel, showgraph=False)
+		assert np.testing.assert_array_equal(tf.imread(fn_out), compArray) is None
+
+
+def test_isotropic(tmpdir):
+	import tifffile as tf
+	## Linear function of the physical position, reproduced exactly by linear interpolation
+	zz, yy, xx = np.mgrid[0:6, 0:20, 0:30]
+	calcArray = (10+3*zz*0.3+2*yy*0.15+xx*0.15).astype('float32')
+	fn = str(tmpdir.join('stack.tif'))
+	tf.imsave(fn, calcArray, description='{"PixelSize": "0.15", "FocusStepSize": "0.3"}')
+	retVal = stackProcessing.isotropic(fn, voxelsize=300., tilesize=4, customSaveDir=str(tmpdir))
+	assert retVal == [str(tmpdir.join('stack_isotropic.tif'))]
+	retArray = tf.imread(retVal[0])
+	assert retArray.shape == (6, 10, 15)
+	zz, yy, xx = np.mgrid[0:6, 0:10, 0:15]
+	## the first row and column are averaged with the replicated border pixels
+	np.testing.assert_allclose(retArray[:-1, 1:, 1:], (10+3*zz*0.3+2*yy*0.3+xx*0.3)[:-1, 1:, 1:], rtol=1e-5)
+	## Default voxel size is the xy pixel size, only z is resampled then
+	stackProcessing.isotropic(fn, interpolationmethod='cubic', customSaveDir=str(tmpdir))
+	compArray = stackProcessing.interpol(tf.imread(fn), 300., 150., 'cubic', showgraph=False)
+	assert np.testing.assert_array_equal(tf.imread(retVal[0]), compArray) is None
+	assert stackProcessing.isotropic(fn, interpolationmethod='nearest').startswith('Please')
+
+
+def test_isotropic_antialiasing(tmpdir):
+	import tifffile as tf
+	## Checkerboard at the xy sampling limit, downsampling must average it instead of picking one phase
+	zz, yy, xx = np.mgrid[0:6, 0:24, 0:36]
+	calcArray = (100*((xx+yy) % 2)).astype('float32')
+	fn = str(tmpdir.join('stack.tif'))
+	tf.imsave(fn, calcArray, description='{"PixelSize": "0.1", "FocusStepSize": "0.3"}')
+	for method, voxelsize in [('linear', 200.), ('linear', 300.), ('cubic', 200.), ('lanczos', 300.)]:
+		retVal = stackProcessing.isotropic(
+			fn, voxelsize=voxelsize, ss_in=voxelsize, interpolationmethod=method, customSaveDir=str(tmpdir))
+		retArray = tf.imread(retVal[0])
+		assert np.abs(retArray[:-1, 2:-2, 2:-2]-50).max() < 1
+
+
+def test_progress(tmpdir):
+	import tifffile as tf
+	calcArray = np.random.randint(256, size=(8, 16, 16)).astype('uint8')
+	fn = str(tmpdir.join('stack.tif'))
+	tf.imsave(fn, calcArray)
+	progress = []
+	stackProcessing.main(fn, 300., 150., customSaveDir=str(tmpdir), streaming=True, slabsize=4, callback=progress.append)
+	assert progress == sorted(progress) and progress[-1] == 100
+	progress = []
+	stackProcessing.projectStack(fn, callback=progress.append)
+	assert progress == sorted(progress) and progress[-1] == 100
+	## A callback returning True cancels processing
+	with pytest.raises(stackProcessing.Cancelled):
+		stackProcessing.interpolStream(
+			fn, str(tmpdir.join('stack_cancelled.tif')), 300., 150., slabsize=4, callback=lambda value: value > 50)
+	with pytest.raises(stackProcessing.Cancelled):
+		stackProcessing.mip(fn, customSaveDir=str(tmpdir), callback=lambda value: True)
+	assert not os.path.exists(str(tmpdir.join('MIP_stack.tif')))
+	## also within the in-memory interpolation of every method and of multichannel stacks
+	for method in stackProcessing.METHODS:
+		progress = []
+		stackProcessing.interpol(calcArray, 300., 150., method, False, callback=progress.append)
+		assert progress == sorted(progress) and progress[-1] == 100
+		with pytest.raises(stackProcessing.Cancelled):
+			stackProcessing.interpol(calcArray, 300., 150., method, False, callback=lambda value: value > 50)
+	progress = []
+	stackProcessing.interpol(np.array([calcArray]*3), 300., 150., 'linear', False, threads=1, callback=progress.append)
+	assert progress == sorted(progress) and progress[-1] == 100
+	with pytest.raises(stackProcessing.Cancelled):
+		stackProcessing.interpol(
+			np.array([calcArray]*3), 300., 150., 'cubic', False, threads=2, callback=lambda value: value > 10)
+
+
+def test_errors(tmpdir):
+	import tifffile as tf
+	## failed processing returns the error message (shown by the GUI)
+	fn = str(tmpdir.join('image.tif'))
+	tf.imsave(fn, np.zeros((16, 16), dtype='uint8'))
+	assert stackProcessing.main(fn, 300., 150., customSaveDir=str(tmpdir)).startswith('ERROR')
+	assert stackProcessing.main(str(tmpdir.join('missing.tif')), 300., 150.).startswith('ERROR')
+	assert stackProcessing.main(str(tmpdir), 300., 150.).startswith('ERROR')
+	assert stackProcessing.main(fn, 300., 150., interpolationmethod='none', saveorigstack=False).startswith('ERROR')
+	assert stackProcessing.mip(fn, customSaveDir=str(tmpdir)).startswith('ERROR')
+
+
+def test_castDtype():
+	retArray = stackProcessing.castDtype(np.array([-3.2, 0.5, 1.5, 254.6, 300.]), np.zeros(5, dtype='uint8'))
+	assert np.testing.assert_array_equal(retArray, np.array([0, 0, 2, 255, 255], dtype='uint8')) is None
+	idx, w0, w1 = stackProcessing.linearWeights(3, 300., 120.)
+	assert np.testing.assert_array_equal(idx, [0, 0, 0, 1, 1]) is None
+	np.testing.assert_allclose(w0+w1, 1)
+	np.testing.assert_allclose(w1, [0, 0.4, 0.8, 0.2, 0.6], rtol=1e-6)
+
+
+def test_imageSequence_workers(tmpdir):
+	import tifffile as tf
+	seqdir = tmpdir.mkdir('sequence')
+	for z in range(6):
+		for c in range(3):
+			tf.imsave(str(seqdir.join('Tile_001-001-{0:03}_{1}-000.tif'.format(z, c))), np.full((16, 16), 10*z+c, dtype='uint8'))
+	outdirs = [tmpdir.mkdir('out_serial'), tmpdir.mkdir('out_parallel')]
+	progress = []
+	stackProcessing.main(str(seqdir), 300., 150., customSaveDir=str(outdirs[0]))
+	stackProcessing.main(str(seqdir), 300., 150., customSaveDir=str(outdirs[1]), workers=3, callback=progress.append)
+	assert progress[-1] == 100
+	assert progress == sorted(progress)
+	for c in range(3):
+		for fname in ['sequence_{0}.tif'.format(c), 'sequence_{0}_resliced.tif'.format(c)]:
+			retArray = tf.imread(str(outdirs[1].join(fname)))
+			compArray = tf.imread(str(outdirs[0].join(fname)))
+			assert np.testing.assert_array_equal(retArray, compArray) is None
+		assert retArray.shape == (11, 16, 16)
+		assert retArray[2, 0, 0] == 10+c
+
+
+def test_sequenceIndex(tmpdir):
+	import tifffile as tf
+	for z in range(4):
+		for c in range(2):
+			tf.imsave(str(tmpdir.join('Tile_001-001-{0:03}_{1}-000.tif'.format(z, c))), np.full((8, 8), 10*z+c, dtype='uint16'))
+	tmpdir.join('Tile_overview.tif').write('')
+	tmpdir.join('notes.txt').write('')
+	index = stackProcessing.sequenceIndex(str(tmpdir))
+	assert len(index) == 8
+	assert index[('001-001', 1, 3)] == str(tmpdir.join('Tile_001-001-003_1-000.tif'))
+	filelists = stackProcessing.sequenceChannels(index)
+	assert sorted(filelists) == [0, 1]
+	retArray = stackProcessing.readSequence(filelists[1], threads=3)
+	assert retArray.shape == (4, 8, 8) and retArray.dtype == np.uint16
+	assert np.testing.assert_array_equal(retArray[:,0,0], [1, 11, 21, 31]) is None
+
+
+def test_depthMap(tmpdir):
+	import tifffile as tf
+	from tdct import parabolic
+	## gaussian z profiles with a sub-slice focus per pixel
+	rs = np.random.RandomState(0)
+	focus = rs.uniform(3, 16, (20, 30))
+	z = np.arange(20)[:, np.newaxis, np.newaxis]
+	calcArray = (1000*np.exp(-(z-focus)**2/8.)+rs.uniform(0, 20, (20, 20, 30))).astype('float32')
+	## maximum in the first slice and a flat profile
+	calcArray[:, 0, 0] = np.arange(20)[::-1]
+	calcArray[:, 0, 1] = 5
+	fn = str(tmpdir.join('stack.tif'))
+	tf.imsave(fn, calcArray)
+	progress = []
+	for n, img in [(3, calcArray), (5, fn)]:
+		height, peak = stackProcessing.depthMap(img, n=n, tilesize=16, callback=progress.append)
+		assert height.shape == peak.shape == (20, 30)
+		assert np.isnan(height[0, :2]).all() and np.isnan(peak[0, :2]).all()
+		for y, x in [(5, 7), (19, 29), (10, 0)]:
+			f = calcArray[:, y, x].astype(np.float64)
+			if n == 3:
+				zv, iv = parabolic.parabolic(f, np.argmax(f))
+			else:
+				zv, iv = parabolic.parabolic_polyfit(f, np.argmax(f), n)
+			assert abs(height[y, x]-zv) < 0.001
+			assert abs(peak[y, x]-iv) < 0.1
+		assert np.nanmax(np.abs(height-focus)) < 0.5
+	assert progress[-1] == 100
+	assert stackProcessing.depthMap(calcArray[0]).startswith('ERROR')
+	assert stackProcessing.depthMap(calcArray[:2]).startswith('ERROR')
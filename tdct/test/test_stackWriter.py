@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+# @Title			: test_stackWriter
+# @Project			: 3DCTv2
+# @Description		: pytest test
+# @Author			: 3DCT contributors
+# @Email			:
+# @Copyright		: Copyright (C) 2026  3DCT contributors
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		:
+# @Date				: 2026/10
+# @Version			: module rev. 1
+# @Status			: stable
+# @Usage			: pytest
+# @Notes			:
+# @Python_version	: 2.7.12
+"""
+# ======================================================================================================================
+from tdct import stackWriter, tiffMetadata
+import os
+import pytest
+import numpy as np
+import tifffile as tf
+
+
+def test_StackWriter(tmpdir):
+	calcArray = (np.arange(6*40*48).reshape(6, 40, 48) % 7).astype('uint16')
+	files = [str(tmpdir.join('stack{0}.tif'.format(i))) for i in range(3)]
+	with stackWriter.StackWriter(files[0], calcArray.shape, calcArray.dtype, metadata={'PixelSize': '0.1'}) as writer:
+		buf = np.empty(calcArray.shape[1:], calcArray.dtype)
+		for sl in calcArray:
+			## reused buffer
+			buf[:] = sl
+			writer.write(buf)
+	stackWriter.saveStack(files[1], calcArray, compress=6)
+	stackWriter.saveStack(files[2], calcArray, compress=6, tile=(16, 32))
+	for fname in files:
+		assert np.testing.assert_array_equal(tf.imread(fname), calcArray) is None
+	assert tiffMetadata.read(files[0])['pixelSize'] == 0.1
+	assert os.path.getsize(files[1]) < os.path.getsize(files[0])/4
+	with tf.TiffFile(files[2]) as tif:
+		assert tif.pages[0].is_tiled
+
+
+def test_StackWriter_errors(tmpdir):
+	fn = str(tmpdir.join('stack.tif'))
+	with pytest.raises(ValueError):
+		stackWriter.StackWriter(fn, (2, 8, 8), 'uint8', tile=(10, 16))
+	writer = stackWriter.StackWriter(fn, (2, 8, 8), 'uint8')
+	writer.write(np.zeros((8, 9), 'uint8'))
+	## Errors of the writer thread are raised in the calling thread
+	with pytest.raises(ValueError):
+		writer.close()
+	writer = stackWriter.StackWriter(fn, (2, 8, 8), 'uint8')
+	writer.write(np.zeros((8, 8), 'uint8'))
+	with pytest.raises(IOError):
+		writer.close()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+
+
+# @Title			: test_tiffMetadata
+# @Project			: 3DCTv2
+# @Description		: pytest test
+# @Author			: 3DCT contributors
+# @Email			:
+# @Copyright		: Copyright (C) 2026  3DCT contributors
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		:
+# @Date				: 2026/10
+# @Version			: module rev. 1
+# @Status			: stable
+# @Usage			: pytest
+# @Notes			:
+# @Python_version	: 2.7.12
+"""
+# ======================================================================================================================
+from tdct import tiffMetadata
+import numpy as np
+import tifffile as tf
+
+
+def test_read(image_RGB, image_Grey):
+	meta = tiffMetadata.read(str(image_RGB))
+	assert (meta['pixelSize'], meta['pixelSizeKey'], meta['pixelSizeUnit']) == (123., 'PhysicalSizeX', 'um')
+	assert (meta['focusStep'], meta['focusStepKey'], meta['focusStepUnit']) == (456., 'FocusStepSize', 'um')
+	meta = tiffMetadata.read(str(image_Grey))
+	assert (meta['pixelSize'], meta['pixelSizeKey'], meta['pixelSizeUnit']) == (4.56e-006, 'PixelWidth', 'm')
+	assert (meta['focusStep'], meta['focusStepKey'], meta['focusStepUnit']) == (0.123, 'PhysicalSizeZ', 'um')
+
+
+def test_cache(tmpdir):
+	fn = str(tmpdir.join('img.tif'))
+	tf.imsave(fn, np.zeros((3, 8, 8), dtype='uint8'), metadata={"PixelSize": "0.1"})
+	meta = tiffMetadata.read(fn)
+	assert meta['pixelSize'] == 0.1 and meta['focusStep'] is None
+	assert tiffMetadata.read(fn) is meta
+	## Changed files are parsed again
+	tf.imsave(fn, np.zeros((3, 8, 9), dtype='uint8'), metadata={"PixelSize": "0.2", "FocusStepSize": "0.3"})
+	meta = tiffMetadata.read(fn)
+	assert (meta['pixelSize'], meta['focusStep']) == (0.2, 0.3)
+
+
+def test_parse():
+	ome = '<Pixels DimensionOrder="XYCZT" PhysicalSizeX="0.1613" PhysicalSizeY="0.1613" PhysicalSizeZ="0.3">'
+	fei = '[Scan]\r\nPixelWidth=1.2e-008\r\nPixelHeight=1.2e-008\r\n'
+	meta = tiffMetadata.parse(['3DCT', ome])
+	assert (meta['pixelSize'], meta['focusStep']) == (0.1613, 0.3)
+	meta = tiffMetadata.parse([fei])
+	assert (meta['pixelSize'], meta['pixelSizeUnit'], meta['focusStep']) == (1.2e-008, 'm', None)
+	imagej = 'ImageJ=1.11a\nimages=30\nchannels=3\nslices=10\npixelsize=0.2\nfocusstepsize=0.16125\nunit=micron\n'
+	meta = tiffMetadata.parse([imagej])
+	assert (meta['pixelSize'], meta['pixelSizeKey'], meta['focusStep']) == (0.2, 'PixelSize', 0.16125)
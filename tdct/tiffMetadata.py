@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Read pixel size and focus step size from tiff image headers.
+
+Only the first IFD is parsed (ImageDescription, FEI and OME blocks and every other string tag) and the result is
+cached per file, keyed by path, modification time and file size. Repeated calls for the same unchanged file do not
+touch the disk again.
+
+Usage:
+	import tiffMetadata
+	>>> meta = tiffMetadata.read('image_stack.tif')
+	>>> meta['pixelSize'], meta['pixelSizeUnit'], meta['focusStep'], meta['focusStepUnit']
+	(0.1613, 'um', 0.3, 'um')
+
+# @Title			: tiffMetadata
+# @Project			: 3DCTv2
+# @Description		: Read pixel size and focus step size from tiff image headers
+# @Author			: 3DCT contributors
+# @Email			:
+# @Copyright		: Copyright (C) 2026  3DCT contributors
+# @License			: GPLv3 (see LICENSE file)
+# @Credits			:
+# @Maintainer		:
+# @Date				: 2026/10
+# @Version			: module rev. 1
+# @Status			: stable
+# @Usage			: import tiffMetadata
+# 					: >>> meta = tiffMetadata.read('image_stack.tif')
+# @Notes			: Tailored for image headers from FEI dual beam electron microscopes and CorrSight light microscope
+# @Python_version	: 2.7.11
+"""
+# ======================================================================================================================
+
+import os
+import re
+import collections
+import tifffile as tf
+
+## Keywords screened for, in order of precedence within one tag, and the unit their values are stored in
+KEYS_XY = [('PhysicalSizeX', 'um'), ('PixelWidth', 'm'), ('PixelSize', 'um')]
+KEYS_Z = [('PhysicalSizeZ', 'um'), ('FocusStepSize', 'um')]
+## Maximum number of files kept in the cache
+CACHESIZE = 256
+
+_cache = collections.OrderedDict()
+
+
+def read(img_path):
+	"""Return the metadata record of a tiff file as dictionary:
+
+	pixelSize		: xy pixel size as stored in the file (None if not found)
+	pixelSizeKey	: keyword the pixel size was found under ('PhysicalSizeX', 'PixelWidth' or 'PixelSize')
+	pixelSizeUnit	: unit of the stored pixel size ('m' or 'um')
+	focusStep		: focus step size as stored in the file (None if not found)
+	focusStepKey	: keyword the focus step size was found under ('PhysicalSizeZ' or 'FocusStepSize')
+	focusStepUnit	: unit of the stored focus step size ('um')
+	"""
+	stat = os.stat(img_path)
+	key = (os.path.realpath(img_path), stat.st_mtime, stat.st_size)
+	if key in _cache:
+		return _cache[key]
+	record = parse(firstPageStrings(img_path))
+	_cache[key] = record
+	while len(_cache) > CACHESIZE:
+		_cache.popitem(last=False)
+	return record
+
+
+def clearCache():
+	"""Forget all cached metadata records"""
+	_cache.clear()
+
+
+def pxSize(img_path,z=False):
+	"""Pixel size (or focus step size if z is True) as stored in the file, None if not found"""
+	record = read(img_path)
+	return record['focusStep'] if z else record['pixelSize']
+
+
+def firstPageStrings(img_path):
+	"""Return the values of all string tags of the first IFD"""
+	try:
+		tif = tf.TiffFile(img_path, maxpages=1)
+	except TypeError:
+		## tifffile versions without maxpages parse pages lazily anyway
+		tif = tf.TiffFile(img_path)
+	with tif:
+		page = tif.pages[0]
+		return [tag.value for tag in page.tags.values() if isinstance(tag.value, str)]
+
+
+def parse(strings):
+	"""Parse pixel size and focus step size from a list of tag strings into a metadata record"""
+	record = {
+		'pixelSize': None, 'pixelSizeKey': None, 'pixelSizeUnit': None,
+		'focusStep': None, 'focusStepKey': None, 'focusStepUnit': None}
+	for name, keys in [('pixelSize', KEYS_XY), ('focusStep', KEYS_Z)]:
+		for value in strings:
+			for keyword, unit in keys:
+				size = findValue(value, keyword)
+				if size is not None:
+					break
+			if size is not None:
+				record[name], record[name+'Key'], record[name+'Unit'] = size, keyword, unit
+				break
+	return record
+
+
+def findValue(value, keyword):
+	"""Return the first number following keyword in value, e.g. PhysicalSizeX="0.1" (OME), "PixelSize": "0.1" (json),
+	pixelsize=0.1 (ImageJ) or PixelWidth=1e-006 (FEI)"""
+	if value.startswith('ImageJ='):
+		## ImageJ stores metadata keys in lower case
+		keyword = keyword.lower()
+	tagpos = value.find(keyword)
+	while tagpos != -1:
+		if keyword == 'PixelWidth':
+			for piece in value[tagpos:tagpos+30].split('='):
+				try:
+					try:
+						return float(piece.strip().split('\r\n')[0])
+					except ValueError:
+						return float(piece.strip().split(r'\r\n')[0])
+				except ValueError:
+					pass
+		else:
+			for piece in re.split(r'["=\s]+', value[tagpos:tagpos+30]):
+				try:
+					return float(piece)
+				except ValueError:
+					pass
+		tagpos = value.find(keyword, tagpos+1)
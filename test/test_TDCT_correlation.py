@@ -119,7 +119,7 @@ def test_pxSize(tdct_CorrelationInstance_setup, image_RGB, image_Grey):
 
 @pytest.mark.skipif(TDCT_error != "", reason="TDCT_correlation import failed: {0}".format(TDCT_error))
 def test_norm_img(tdct_CorrelationInstance_setup):
-	compArray = TDCT_correlation.np.array([[127, 127, 127],[254, 254, 254]], dtype='uint8')
+	compArray = TDCT_correlation.np.array([[128, 128, 128],[255, 255, 255]], dtype='uint8')
 	retArray = tdct_CorrelationInstance_setup.window.norm_img(TDCT_correlation.np.array([[1,1,1],[2,2,2]],dtype='uint8'))
 	assert TDCT_correlation.np.testing.assert_array_equal(retArray, compArray) is None
 